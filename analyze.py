@@ -3,15 +3,29 @@
     The user will be able to view all, all custom, and all predefined habits.
     They can filter for daily and for weekly habits.
     The user can also view their streaks.
-    The analysis file makes use of the pandas and sqlite libraries.
+    Streaks of all habits can be recomputed from the full counter history in one vectorized pass.
+    Rolling completion rates (7, 30 and 90 days by default) of all habits are computed in one query.
+    All functions take a cursor, so long analyses can read from a db.Snapshot instead of the live database.
+    The analysis file makes use of the pandas, numpy and sqlite libraries.
 """
 
 import sqlite3
+import numpy as np
 import pandas as pd
+from dates import to_day, today, format_day
+from leaderboard import top_streaks
+from db import is_snapshot
+from habit_cache import habit_cache
+from services import HabitService
 
 ####Functions to show habits according to creator and periodicity
 
 #Functions to display habits depending on their creator (predefined vs. custom vs. all)
+def _habit_service(cur):
+    """Function that returns the HabitService of a cursor (snapshots bypass the habit cache, so it never holds stale catalogs)"""
+    return HabitService(cur.connection, cache=None if is_snapshot(cur.connection) else habit_cache)
+
+
 def show_predef_habits(cur):
     """Function to display all predefined habits"""
     try:
@@ -21,14 +35,16 @@ def show_predef_habits(cur):
 
         if not habits:
             print("\nThere are currently no predefined habits.")
-            return
+            return pd.DataFrame(columns=["Name", "Description", "Type", "Interval"])
 
         #Create a table 
         habits_df = pd.DataFrame(habits, columns=["Name", "Description", "Type", "Interval"])
         print("\nHere you can see all predefined habits:")
         print(habits_df.to_string(index=False))
+        return habits_df
     except sqlite3.Error as e:
         print(f"An error occurred while displaying predefined habits: {e}")
+        return pd.DataFrame(columns=["Name", "Description", "Type", "Interval"])
         
         
 def show_custom_habits(cur, user_id):
@@ -43,33 +59,28 @@ def show_custom_habits(cur, user_id):
 
         if not habits:
             print("\nThere are currently no custom habits.")
-            return
+            return pd.DataFrame(columns=["Name", "Description", "Type", "Interval"])
 
         #Create a table 
         habits_df = pd.DataFrame(habits, columns=["Name", "Description", "Type", "Interval"])
         print("\nHere you can see your custom habits:")
         print(habits_df.to_string(index=False))
+        return habits_df
     except sqlite3.Error as e:
         print(f"An error occurred while retrieving your habits: {e}")
+        return pd.DataFrame(columns=["Name", "Description", "Type", "Interval"])
        
     
 def show_all_habits(cur, user_id):
-    """Function to display all habits (custom and predefined)"""
+    """Function to return all habits (custom and predefined) from the cached habit catalog of the user"""
     try:
-        custom_habits = show_custom_habits(cur, user_id)
-        predef_habits = show_predef_habits(cur)
-        if custom_habits.empty and predef_habits.empty: #.empty checks for empty cells
+        #The "Custom" column lets the user distinct between own and predefined habits
+        habits = [(habit.name, habit.definition, habit.type, habit.interval, habit.is_custom)
+                  for habit in _habit_service(cur).list_habits(user_id)]
+        if not habits:
             print("\nNo habits found.")
-            return pd.DataFrame(columns=["Name", "Description", "Type", "Interval", "Custom"])
-        
-        #Add a "Custom" column for the user to distinct between own and predefined habits
-        custom_habits["Custom"] = True
-        predef_habits["Custom"] = False
-        
-        #Combine both tables (of predefined and custom habits)
-        all_habits = pd.concat([custom_habits, predef_habits], ignore_index=True)
-        return all_habits
-    except sqlite.Error as e:
+        return pd.DataFrame(habits, columns=["Name", "Description", "Type", "Interval", "Custom"])
+    except sqlite3.Error as e:
         print(f"An error occurred while joining custom with predefined habits: {e}")
         return pd.DataFrame()
 
@@ -114,11 +125,10 @@ def show_weekly_habits(cur, user_id):
 
 ####Functions to analyze counter data
 
-def show_longest_streak(cur):
-    """Function to display the streaks of all habits in descending order"""
+def show_longest_streak(cur, k=20, user_id=None):
+    """Function to display the top k longest streaks of all habits (or of one user's habits) in descending order"""
     try:
-        cur.execute("SELECT habit_name, habit_streak FROM counter ORDER BY habit_streak DESC")
-        streaks = cur.fetchall()
+        streaks = [(entry.habit_name, entry.streak) for entry in top_streaks(cur, k, user_id)]
         if not streaks:
             print("\nNo streak data available.")
             return pd.DataFrame(columns=["Habit", "Streak"])
@@ -131,7 +141,7 @@ def show_longest_streak(cur):
 def show_streak_break(cur):
     """Function to display all habits where the streak is currently broken"""
     try:
-        cur.execute("SELECT habit_name, habit_streak FROM counter WHERE habit_streak = 0")
+        cur.execute("SELECT habit_name, current_streak FROM habit_state WHERE current_streak = 0")
         streaks = cur.fetchall()
         if not streaks:
             print("\nNo broken streaks found.")
@@ -157,8 +167,8 @@ def show_streak_for_specific_habit(cur, user_id):
         #User selects a specific habit
         habit_name = input("\nEnter the exact name of a habit to get its streak: ").strip()
         cur.execute(
-            "SELECT habit_streak FROM counter WHERE habit_name = ? AND user_id = ?", 
-            (habit_name, user_id)
+            "SELECT current_streak FROM habit_state WHERE user_id = ? AND habit_name = ?", 
+            (user_id, habit_name)
         )
         streak = cur.fetchone()
         if streak:
@@ -173,26 +183,27 @@ def show_rep_number(cur, user_id):
     """Function to calculate and display the total number of repetitions of a given habit"""
     try:
         #Display all habits
-        all_habits = show_all_habits(cur, user_id)
-        if all_habits.empty:
+        habits = _habit_service(cur).catalog(user_id)
+        if not habits:
             print("\nNo habits were found to calculate counters.")
             return
 
         print("\nHere are all your habits:")
-        print(all_habits.to_string(index=False))
+        print(show_all_habits(cur, user_id).to_string(index=False))
 
         #User selects a specific habit
         habit_name = input("\nEnter the name of the habit to calculate its counter: ").strip()
-        if habit_name not in all_habits["Name"].values:
+        if habit_name not in habits:
             print("Invalid habit name. Please try again.")
             return
 
-        #Calculate the total counter
+        #Look up the total counter in the materialized habit state
         cur.execute(
-            "SELECT SUM(habit_rep) FROM counter WHERE habit_name = ? AND user_id = ?", 
-            (habit_name, user_id)
+            "SELECT total_reps FROM habit_state WHERE user_id = ? AND habit_name = ?", 
+            (user_id, habit_name)
         )
-        total_count = cur.fetchone()[0]
+        total_count = cur.fetchone()
+        total_count = total_count[0] if total_count else None
 
         if total_count:
             print(f"\nThe total count for '{habit_name}' is {total_count}.")
@@ -201,3 +212,182 @@ def show_rep_number(cur, user_id):
 
     except sqlite3.Error as e:
         print(f"An error occurred while calculating the counter for '{habit_name}': {e}")
+
+
+####Full-history streak recomputation
+
+#Largest gap in days between two checks that still continues a streak
+STREAK_MAX_GAP = {"Daily": 1, "Weekly": 7}
+
+
+def _streak_frame(cur, user_range=None):
+    """
+    Function that loads the whole counter history in one query and computes the streak of every row
+    with vectorized gaps-and-islands logic: a new island (streak) starts at the first check of a habit
+    and wherever the gap to the previous check exceeds the habit's interval.
+    """
+    #Rows of the given user range only (used by the sharded reports in reports.py)
+    in_range, params = ("user_id BETWEEN ? AND ?", tuple(user_range)) if user_range else ("1", ())
+    cur.execute(f"""SELECT user_id, habit_name, check_day, habit_streak FROM counter WHERE {in_range}
+                    ORDER BY user_id, habit_name, check_day""", params)
+    history = pd.DataFrame(cur.fetchall(), columns=["user_id", "habit_name", "day", "habit_streak"])
+    if history.empty:
+        history["interval"] = history["streak"] = pd.Series(dtype="int64")
+        return history
+
+    #Interval of each row: the user's custom habit, otherwise the predefined habit, otherwise daily
+    cur.execute(f"SELECT user_id, habit_name, habit_interval FROM habits WHERE is_custom = 1 AND {in_range}", params)
+    custom = pd.DataFrame(cur.fetchall(), columns=["user_id", "habit_name", "interval"])
+    cur.execute("SELECT habit_name, habit_interval FROM habits WHERE is_custom = 0")
+    predef = dict(cur.fetchall())
+    history = history.merge(custom, on=["user_id", "habit_name"], how="left", sort=False)
+    history["interval"] = history["interval"].fillna(history["habit_name"].map(predef)).fillna("Daily")
+
+    day = history["day"].to_numpy(np.int64)
+    max_gap = np.where(history["interval"].to_numpy() == "Weekly", STREAK_MAX_GAP["Weekly"], STREAK_MAX_GAP["Daily"])
+    user_ids = history["user_id"].to_numpy()
+    habit_names = history["habit_name"].to_numpy()
+
+    new_habit = np.ones(len(history), dtype=bool)
+    new_habit[1:] = (user_ids[1:] != user_ids[:-1]) | (habit_names[1:] != habit_names[:-1])
+    gap = np.diff(day, prepend=day[0])
+    island_start = new_habit | (gap > max_gap)
+
+    #Streak = position within the island + 1
+    positions = np.arange(len(history))
+    start_positions = positions[island_start]
+    history["max_gap"] = max_gap
+    history["streak"] = positions - start_positions[np.cumsum(island_start) - 1] + 1
+    return history
+
+
+def recompute_streaks(cur, as_of=None, user_range=None):
+    """
+    Function that recomputes the current and longest streak of every habit of every user from the full history
+    
+    :param cur: Cursor for database operations
+    :param as_of: Reference date (datetime.date, default today); a streak whose last check is older
+        than the habit's interval is reported as broken (current streak 0)
+    :param user_range: Only recompute the habits of the user IDs from first to last (inclusive tuple)
+    :return: DataFrame with the columns User, Habit, Interval, Current Streak, Longest Streak, Last Check
+    """
+    columns = ["User", "Habit", "Interval", "Current Streak", "Longest Streak", "Last Check"]
+    try:
+        history = _streak_frame(cur, user_range)
+    except sqlite3.Error as e:
+        print(f"An error occurred while recomputing streaks: {e}")
+        return pd.DataFrame(columns=columns)
+    if history.empty:
+        return pd.DataFrame(columns=columns)
+
+    summary = history.groupby(["user_id", "habit_name"], sort=False).agg(
+        interval=("interval", "last"), last_streak=("streak", "last"), longest=("streak", "max"),
+        last_day=("day", "last"), max_gap=("max_gap", "last"))
+    as_of_day = to_day(as_of) if as_of is not None else today()
+    current = np.where(as_of_day - summary["last_day"] <= summary["max_gap"], summary["last_streak"], 0)
+
+    return pd.DataFrame({
+        "User": summary.index.get_level_values(0),
+        "Habit": summary.index.get_level_values(1),
+        "Interval": summary["interval"].to_numpy(),
+        "Current Streak": current,
+        "Longest Streak": summary["longest"].to_numpy(),
+        "Last Check": [format_day(day) for day in summary["last_day"].tolist()],
+    })
+
+
+def repair_streaks(db):
+    """
+    Function that corrects drifted 'habit_streak' values in the counter table with the recomputed
+    streaks and rebuilds the habit state afterwards
+    
+    :param db: Database connection object
+    :return: The number of corrected counter rows
+    """
+    from db import rebuild_habit_state
+    cur = db.cursor()
+    try:
+        history = _streak_frame(cur)
+        drifted = history[history["habit_streak"] != history["streak"]]
+        cur.executemany(
+            "UPDATE counter SET habit_streak = ? WHERE user_id IS ? AND habit_name = ? AND check_day = ?",
+            zip(drifted["streak"].tolist(), drifted["user_id"].tolist(),
+                drifted["habit_name"].tolist(), drifted["day"].tolist())
+        )
+        db.commit()
+    except sqlite3.Error as e:
+        db.rollback()
+        print(f"An error occurred while repairing streaks: {e}")
+        return 0
+    rebuild_habit_state(db)
+    print(f"{len(drifted)} streak values were corrected.")
+    return len(drifted)
+
+
+####Rolling-window completion rates
+
+#Windows in days for which completion rates are computed
+COMPLETION_WINDOWS = (7, 30, 90)
+
+
+def completion_rates(cur, user_id=None, windows=COMPLETION_WINDOWS, as_of=None, user_range=None):
+    """
+    Function that computes the completion rate of every habit (of one user or of all users) for each
+    rolling window in a single query: the checked periods (days for daily habits, 7-day periods counted
+    back from 'as_of' for weekly habits) divided by the expected periods since the habit was created.
+    Every (habit, window) pair counts its checks with one range search on the counter primary key
+    (user_id, habit_name, check_day), so only the rows inside the windows are read.
+
+    :param cur: Cursor for database operations
+    :param user_id: Only compute the rates of this user's habits (default: all users)
+    :param windows: Window lengths in days
+    :param as_of: Last day of the windows (datetime.date, default today)
+    :param user_range: Only compute the rates of the user IDs from first to last (inclusive tuple)
+    :return: Tidy DataFrame with one row per user, habit and window and the columns
+        User, Habit, Interval, Window, Completed, Expected, Rate
+    """
+    columns = ["User", "Habit", "Interval", "Window", "Completed", "Expected", "Rate"]
+    windows = sorted({int(days) for days in windows})
+    if not windows:
+        return pd.DataFrame(columns=columns)
+    params = {"as_of": to_day(as_of) if as_of is not None else today(), "user_id": user_id,
+              "first_user": user_range[0] if user_range else None, "last_user": user_range[1] if user_range else None,
+              "weekly": STREAK_MAX_GAP["Weekly"]}
+    params.update({f"window_{number}": days for number, days in enumerate(windows)})
+    window_values = ", ".join(f"(:window_{number})" for number in range(len(windows)))
+    user_filter = "AND {0} = :user_id" if user_id is not None else ""
+    if user_range:
+        user_filter += " AND {0} BETWEEN :first_user AND :last_user"
+    in_window = """FROM counter c WHERE c.user_id = t.user_id AND c.habit_name = t.habit_name
+                   AND c.check_day > :as_of - w.days AND c.check_day <= :as_of"""
+    try:
+        cur.execute(f"""
+            WITH windows (days) AS (VALUES {window_values}),
+            tracked AS (
+                SELECT user_id, habit_name, habit_interval, habit_day FROM habits
+                WHERE is_custom = 1 {user_filter.format("user_id")}
+                UNION ALL
+                SELECT user.user_id, habits.habit_name, habits.habit_interval, habits.habit_day
+                FROM user CROSS JOIN habits
+                WHERE habits.is_custom = 0 {user_filter.format("user.user_id")}
+            ),
+            rates AS (
+                SELECT t.user_id, t.habit_name, t.habit_interval, w.days,
+                       CASE t.habit_interval
+                           WHEN 'Weekly' THEN (SELECT COUNT(DISTINCT (:as_of - c.check_day) / :weekly) {in_window})
+                           ELSE (SELECT COUNT(*) {in_window})
+                       END AS completed,
+                       CASE t.habit_interval WHEN 'Weekly' THEN :weekly ELSE 1 END AS period,
+                       MAX(0, MIN(w.days, :as_of - COALESCE(t.habit_day, :as_of - w.days) + 1)) AS span
+                FROM tracked t CROSS JOIN windows w
+            )
+            SELECT user_id, habit_name, habit_interval, days, completed, (span + period - 1) / period
+            FROM rates
+            ORDER BY user_id, habit_name, days
+            """, params)
+        rates = pd.DataFrame(cur.fetchall(), columns=columns[:-1])
+    except sqlite3.Error as e:
+        print(f"An error occurred while computing completion rates: {e}")
+        return pd.DataFrame(columns=columns)
+    rates["Rate"] = (rates["Completed"] / rates["Expected"].where(rates["Expected"] > 0)).round(4)
+    return rates
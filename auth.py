@@ -0,0 +1,246 @@
+"""
+    This file contains the password hashing and the session tokens of the habit tracker.
+    Passwords are stored as salted scrypt (or PBKDF2) hashes whose cost is set in PASSWORD_COST.
+    Older hashes and plaintext passwords of existing profiles are upgraded on the next login.
+    Because the hashing is deliberately slow, a login can also return a short-lived session token:
+    the token itself is only given to the caller, the 'sessions' table stores its SHA-256 hash, and
+    a bounded in-process cache answers repeated lookups of the same token without a query.
+    Usage: python auth.py hash-passwords --db main_db.db
+"""
+
+import argparse
+import hashlib
+import hmac
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+#Scheme of new password hashes and the cost parameters of every scheme
+#(scrypt: CPU/memory cost n, block size r, parallelism p; PBKDF2: iterations of HMAC-SHA256)
+PASSWORD_SCHEME = "scrypt"
+PASSWORD_COST = {
+    "scrypt": {"n": 2 ** 14, "r": 8, "p": 1},
+    "pbkdf2_sha256": {"iterations": 600000},
+}
+SALT_BYTES = 16
+
+#Seconds a session token is valid, and seconds a cached session is trusted before it is looked up again
+#(so that a logout in another process is seen by this process after at most SESSION_CACHE_TTL seconds)
+SESSION_TTL = 1800
+#Longest validity a client may request for a session (e.g. for the token of a cron job, see client.py)
+SESSION_MAX_TTL = 30 * 86400
+SESSION_CACHE_TTL = 60
+SESSION_CACHE_SIZE = 1024
+
+
+def _derive(scheme, password, salt, cost):
+    """Function that derives the hash of a password with a scheme, a salt and cost parameters"""
+    if scheme == "scrypt":
+        return hashlib.scrypt(password.encode(), salt=salt, n=cost["n"], r=cost["r"], p=cost["p"],
+                              maxmem=256 * cost["n"] * cost["r"] * cost["p"])
+    if scheme == "pbkdf2_sha256":
+        return hashlib.pbkdf2_hmac("sha256", password.encode(), salt, cost["iterations"])
+    raise ValueError(f"Unknown password scheme '{scheme}'. Choose one of: {', '.join(PASSWORD_COST)}.")
+
+
+def hash_password(password, scheme=PASSWORD_SCHEME, cost=None):
+    """
+    Function that returns the salted hash of a password, e.g. 'scrypt$n=16384,r=8,p=1$<salt>$<hash>'
+
+    :param password: Plaintext password
+    :param scheme: Name of a scheme in PASSWORD_COST
+    :param cost: Cost parameters of the scheme (default: PASSWORD_COST[scheme])
+    """
+    if scheme not in PASSWORD_COST:
+        raise ValueError(f"Unknown password scheme '{scheme}'. Choose one of: {', '.join(PASSWORD_COST)}.")
+    cost = cost or PASSWORD_COST[scheme]
+    salt = secrets.token_bytes(SALT_BYTES)
+    params = ",".join(f"{name}={value}" for name, value in cost.items())
+    return f"{scheme}${params}${salt.hex()}${_derive(scheme, password, salt, cost).hex()}"
+
+
+def _parse_hash(stored):
+    """Function that splits a stored hash into (scheme, cost, salt, hash); plaintext and malformed hashes give None"""
+    parts = stored.split("$")
+    if len(parts) != 4 or parts[0] not in PASSWORD_COST:
+        return None
+    scheme, params, salt, digest = parts
+    try:
+        cost = {name: int(value) for name, value in (param.split("=") for param in params.split(","))}
+        salt, digest = bytes.fromhex(salt), bytes.fromhex(digest)
+    except ValueError:
+        return None
+    #A hash needs every cost parameter of its scheme (and no others) to be derived again
+    if cost.keys() != PASSWORD_COST[scheme].keys():
+        return None
+    return scheme, cost, salt, digest
+
+
+def verify_password(password, stored):
+    """
+    Function that checks a password against its stored hash
+
+    :param password: Plaintext password entered by the user
+    :param stored: Stored hash (or the plaintext of a profile created before passwords were hashed)
+    :return: (matches, needs_rehash); needs_rehash is True for plaintext and for outdated schemes or costs
+    """
+    parsed = _parse_hash(stored)
+    if parsed is None:
+        return hmac.compare_digest(stored.encode(), password.encode()), True
+    scheme, cost, salt, digest = parsed
+    try:
+        derived = _derive(scheme, password, salt, cost)
+    except ValueError:
+        #Cost parameters that the KDF rejects (e.g. n not a power of 2) can never match
+        return False, True
+    matches = hmac.compare_digest(derived, digest)
+    return matches, scheme != PASSWORD_SCHEME or cost != PASSWORD_COST[scheme]
+
+
+def hash_token(token):
+    """Function that returns the SHA-256 hash of a session token (tokens are random, so no slow hash is needed)"""
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+class SessionCache:
+    def __init__(self, max_sessions=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL):
+
+        """
+        A thread-safe LRU cache of verified sessions keyed by token hash.
+
+        :param max_sessions: int
+            Maximum number of sessions; the least recently used one is evicted first.
+        :param ttl: float
+            Seconds a cached session is trusted before it is looked up in the database again.
+        """
+
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+    def get(self, token_hash, now=None):
+        """Method that returns the user ID of a cached session that is still valid, or None"""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._sessions.get(token_hash)
+            if entry is None or now >= entry[1]:
+                self._sessions.pop(token_hash, None)
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(token_hash)
+            self.hits += 1
+            return entry[0]
+
+
+    def put(self, token_hash, user_id, expires_at, now=None):
+        """Method to cache a verified session until it expires, but at most for the cache TTL"""
+        now = time.time() if now is None else now
+        with self._lock:
+            self._sessions[token_hash] = (user_id, min(expires_at, now + self.ttl))
+            self._sessions.move_to_end(token_hash)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+
+    def invalidate(self, token_hash=None, user_id=None):
+        """Method to drop one session, all sessions of a user, or (without arguments) all sessions"""
+        with self._lock:
+            if token_hash is not None:
+                self._sessions.pop(token_hash, None)
+            elif user_id is not None:
+                for key in [key for key, entry in self._sessions.items() if entry[0] == user_id]:
+                    del self._sessions[key]
+            else:
+                self._sessions.clear()
+
+
+    def stats(self):
+        """Method that returns the hit-rate statistics of the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"size": len(self._sessions), "max_sessions": self.max_sessions, "hits": self.hits,
+                    "misses": self.misses, "hit_rate": round(self.hits / lookups, 4) if lookups else None}
+
+
+#Central cache used by the UserService
+session_cache = SessionCache()
+
+
+def create_session(db, user_id, ttl=SESSION_TTL):
+    """Function that stores a new session of a user and returns its token (the caller commits)"""
+    token = secrets.token_urlsafe(32)
+    now = int(time.time())
+    db.execute("INSERT INTO sessions (token_hash, user_id, created_at, expires_at) VALUES (?, ?, ?, ?)",
+               (hash_token(token), user_id, now, now + ttl))
+    return token
+
+
+def resolve_session(db, token):
+    """Function that returns the user ID of a valid session token, or None (cached sessions need no query)"""
+    token_hash = hash_token(token)
+    user_id = session_cache.get(token_hash)
+    if user_id is not None:
+        return user_id
+    row = db.execute("SELECT user_id, expires_at FROM sessions WHERE token_hash = ?", (token_hash,)).fetchone()
+    if row is None or row[1] <= time.time():
+        return None
+    session_cache.put(token_hash, row[0], row[1])
+    return row[0]
+
+
+def revoke_session(db, token):
+    """Function to delete one session (the caller commits)"""
+    token_hash = hash_token(token)
+    db.execute("DELETE FROM sessions WHERE token_hash = ?", (token_hash,))
+    session_cache.invalidate(token_hash=token_hash)
+
+
+def revoke_user_sessions(db, user_id):
+    """Function to delete all sessions of a user, e.g. after a password change (the caller commits)"""
+    db.execute("DELETE FROM sessions WHERE user_id = ?", (user_id,))
+    session_cache.invalidate(user_id=user_id)
+
+
+def purge_sessions(db):
+    """Function to delete all expired sessions and return their number"""
+    deleted = db.execute("DELETE FROM sessions WHERE expires_at <= ?", (int(time.time()),)).rowcount
+    db.commit()
+    return deleted
+
+
+def hash_passwords(db):
+    """Function to replace all plaintext passwords by hashes and return their number"""
+    users = [(user_id, user_pwd) for user_id, user_pwd in db.execute("SELECT user_id, user_pwd FROM user")
+             if _parse_hash(user_pwd) is None]
+    db.executemany("UPDATE user SET user_pwd = ? WHERE user_id = ?",
+                   [(hash_password(user_pwd), user_id) for user_id, user_pwd in users])
+    db.commit()
+    return len(users)
+
+
+if __name__ == "__main__":
+    from db import get_db, close_db, migrate_db
+
+    parser = argparse.ArgumentParser(description="Habit tracker password and session maintenance")
+    parser.add_argument("command", choices=["hash-passwords", "purge-sessions"])
+    parser.add_argument("--db", default="main_db.db", help="Path of the database file")
+    args = parser.parse_args()
+
+    db = get_db(args.db)
+    migrate_db(db)
+    try:
+        if args.command == "hash-passwords":
+            print(f"{hash_passwords(db)} plaintext passwords were hashed.")
+        else:
+            print(f"{purge_sessions(db)} expired sessions were deleted.")
+    except sqlite3.Error as e:
+        db.rollback()
+        print(f"The maintenance failed: {e}")
+    finally:
+        close_db()
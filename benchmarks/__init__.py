@@ -0,0 +1,6 @@
+"""
+    Benchmark suite of the habit tracker.
+    - generate.py fills a database with a synthetic dataset of users, habits and check-ins
+    - run.py times the hot paths against such a database and writes the results to JSON
+    Usage (from the repository root): python -m benchmarks.run --users 200 --days 365 --output results.json
+"""
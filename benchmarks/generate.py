@@ -0,0 +1,108 @@
+"""
+    This file contains the synthetic dataset generator for the benchmarks.
+    It fills the user, habits and counter tables with a configurable number of users,
+    custom habits per user and days of history. Every habit gets its own adherence rate,
+    so the history contains realistic gaps and streaks of different lengths.
+    Usage: python -m benchmarks.generate --db bench.db --users 1000 --habits 5 --days 365
+"""
+
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from dates import to_day
+from db import create_tables, migrate_db, rebuild_habit_state, use_profile, get_db, close_db
+from habit_manager import create_predef_habits
+
+#Rows per executemany call
+BATCH_SIZE = 10000
+
+INSERT_COUNTER = """INSERT OR IGNORE INTO counter (user_id, habit_name, check_day, check_time, habit_rep, habit_streak)
+                    VALUES (?, ?, ?, ?, ?, ?)"""
+
+
+def _habit_history(rng, user_id, habit_name, interval, start, days):
+    """Function that yields the counter rows of one habit with random gaps and the matching streaks"""
+    adherence = rng.uniform(0.5, 0.98)
+    step = 1 if interval == "Daily" else 7
+    start_day = to_day(start)
+    last_day, streak = None, 0
+    for offset in range(0, days, step):
+        if rng.random() > adherence:
+            continue
+        #Weekly habits are checked on a random day of their week
+        day = start_day + offset + (rng.randrange(step) if step > 1 else 0)
+        streak = streak + 1 if last_day is not None and 0 < day - last_day <= step else 1
+        last_day = day
+        yield (user_id, habit_name, day, f"{rng.randrange(6, 23):02d}:{rng.randrange(60):02d}:00", 1, streak)
+
+
+def generate_dataset(db, users=100, habits_per_user=5, days=365, seed=42, end=None):
+    """
+    Function that fills a database with a synthetic dataset
+
+    :param db: Database connection object (the tables are created if needed)
+    :param users: Number of users
+    :param habits_per_user: Number of custom habits per user (every user also tracks the predefined habits)
+    :param days: Days of history up to 'end'
+    :param seed: Seed of the random generator, so that datasets are reproducible
+    :param end: Last day of the history (datetime.date, default today)
+    :return: Dict with the number of users, habits and counter rows
+    """
+    rng = random.Random(seed)
+    end = end or date.today()
+    start = end - timedelta(days=days - 1)
+    cur = db.cursor()
+    create_tables(cur, db)
+    migrate_db(db)
+    cur.execute("SELECT COUNT(*) FROM habits WHERE is_custom = 0")
+    if cur.fetchone()[0] == 0:
+        create_predef_habits(cur, db)
+    cur.execute("SELECT habit_name, habit_interval FROM habits WHERE is_custom = 0")
+    predef_habits = cur.fetchall()
+
+    user_rows, habit_rows, counter_rows = [], [], 0
+    with use_profile(db, "bulk-load"):
+        cur.execute("BEGIN")
+        pending = []
+        for number in range(users):
+            user_id = f"user{number:07d}"
+            #Plaintext like legacy profiles: hashing every user would dominate the generation time,
+            #the password is hashed on the first login (see auth.py)
+            user_rows.append((user_id, f"name{number:07d}", "pwd123!"))
+            tracked = list(predef_habits)
+            for habit_number in range(habits_per_user):
+                habit_name = f"Habit {habit_number}"
+                interval = "Daily" if rng.random() < 0.7 else "Weekly"
+                habit_rows.append((user_id, habit_name, "Synthetic habit", "Synthetic", to_day(start), interval))
+                tracked.append((habit_name, interval))
+            for habit_name, interval in tracked:
+                pending.extend(_habit_history(rng, user_id, habit_name, interval, start, days))
+            if len(pending) >= BATCH_SIZE:
+                cur.executemany(INSERT_COUNTER, pending)
+                counter_rows += len(pending)
+                pending = []
+        cur.executemany(INSERT_COUNTER, pending)
+        counter_rows += len(pending)
+        cur.executemany("INSERT OR IGNORE INTO user (user_id, user_name, user_pwd) VALUES (?, ?, ?)", user_rows)
+        cur.executemany("""INSERT OR IGNORE INTO habits (user_id, habit_name, habit_def, habit_type, habit_day, habit_interval, is_custom)
+                        VALUES (?, ?, ?, ?, ?, ?, 1)""", habit_rows)
+        db.commit()
+        rebuild_habit_state(db)
+    return {"users": len(user_rows), "habits": len(habit_rows), "counter_rows": counter_rows}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic habit tracker database")
+    parser.add_argument("--db", default="bench.db", help="Path of the database file")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--habits", type=int, default=5, help="Custom habits per user")
+    parser.add_argument("--days", type=int, default=365, help="Days of history")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    db = get_db(args.db)
+    counts = generate_dataset(db, args.users, args.habits, args.days, args.seed)
+    close_db()
+    print(f"Generated {counts} in {time.perf_counter() - started:.1f} s.")
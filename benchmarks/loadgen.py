@@ -0,0 +1,169 @@
+"""
+    This file contains the load generator for the HTTP service (see server.py).
+    Concurrent clients keep one connection each and send a mix of check-ins, habit reads and
+    analytics requests as fast as the server answers. The client-side latency percentiles of every
+    endpoint and the overall throughput are reported, and can be written to JSON like run.py.
+    The clients log in as the synthetic users of a generated database (see generate.py).
+    Usage: python server.py --db bench.db --port 8080
+           python -m benchmarks.loadgen --port 8080 --clients 32 --requests 200 --output load.json
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from datetime import date, timedelta
+from benchmarks.run import _percentile
+
+#Request mix: endpoint name -> weight
+REQUEST_MIX = {"check_in": 30, "list_habits": 30, "habit_status": 20, "completion": 10, "leaderboard": 10}
+
+
+class Client:
+    """
+    One keep-alive HTTP/1.1 connection to the server.
+
+    :param host: str
+    :param port: int
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.token = None
+        self._reader = None
+        self._writer = None
+
+
+    async def request(self, method, path, body=None):
+        """Method that sends a request and returns (status, JSON payload)"""
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        data = json.dumps(body).encode() if body is not None else b""
+        headers = f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\nContent-Length: {len(data)}\r\n"
+        if self.token:
+            headers += f"Authorization: Bearer {self.token}\r\n"
+        self._writer.write(headers.encode() + b"\r\n" + data)
+        await self._writer.drain()
+        status = int((await self._reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await self._reader.readexactly(length)) if length else {}
+
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+async def _run_client(client, user_id, password, requests, start_day, rng, latencies, errors):
+    """Function that logs in a client and sends its share of the request mix"""
+    status, payload = await client.request("POST", "/login", {"identifier": user_id, "password": password})
+    if status != 200:
+        errors["login"] = errors.get("login", 0) + 1
+        return
+    client.token = payload["token"]
+    habits = [habit["name"] for habit in (await client.request("GET", "/habits"))[1]["habits"]]
+    names, weights = zip(*REQUEST_MIX.items())
+    day = start_day
+    for _ in range(requests):
+        name = rng.choices(names, weights)[0]
+        habit = rng.choice(habits)
+        if name == "check_in":
+            day += timedelta(days=1)
+            method, path, body = "POST", "/check-ins", {"habit": habit, "date": day.isoformat()}
+        elif name == "list_habits":
+            method, path, body = "GET", "/habits", None
+        elif name == "habit_status":
+            method, path, body = "GET", f"/habits/{habit.replace(' ', '%20')}/status", None
+        elif name == "completion":
+            method, path, body = "GET", "/analytics/completion", None
+        else:
+            method, path, body = "GET", "/analytics/leaderboard?k=10&scope=all", None
+        started = time.perf_counter()
+        status, payload = await client.request(method, path, body)
+        latencies.setdefault(name, []).append((time.perf_counter() - started) * 1000)
+        #404 is a habit that was never checked and 409 a check-in of a day that was already checked
+        if status >= 500 or status in (400, 401):
+            errors[name] = errors.get(name, 0) + 1
+
+
+async def run_load(host="127.0.0.1", port=8080, clients=32, requests=200, users=50, password="pwd123!",
+                   start_date=date(2400, 1, 1), seed=1):
+    """
+    Function that runs the load test and returns its statistics in milliseconds
+
+    :param clients: Number of concurrent clients (connections)
+    :param requests: Requests per client after its login
+    :param users: Number of synthetic users the clients log in as (user0000000, user0000001, ...)
+    :param start_date: First check-in date; each client checks in on the following days
+        (use a later date to repeat a run on the same database)
+    """
+    rng = random.Random(seed)
+    latencies, errors = {}, {}
+    connections = [Client(host, port) for _ in range(clients)]
+    #Each client checks in on its own range of days, so that concurrent check-ins do not collide
+    tasks = [_run_client(client, f"user{number % users:07d}", password, requests,
+                         start_date + timedelta(days=number * (requests + 1)),
+                         random.Random(rng.random()), latencies, errors)
+             for number, client in enumerate(connections)]
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for client in connections:
+            client.close()
+    elapsed = time.perf_counter() - started
+
+    results = {}
+    for name, values in sorted(latencies.items()):
+        values.sort()
+        results[name] = {
+            "requests": len(values),
+            "p50_ms": round(_percentile(values, 0.50), 3),
+            "p99_ms": round(_percentile(values, 0.99), 3),
+            "max_ms": round(values[-1], 3),
+        }
+    everything = sorted(value for values in latencies.values() for value in values)
+    if everything:
+        results["all"] = {
+            "requests": len(everything),
+            "p50_ms": round(_percentile(everything, 0.50), 3),
+            "p99_ms": round(_percentile(everything, 0.99), 3),
+            "max_ms": round(everything[-1], 3),
+            "requests_per_s": round(len(everything) / elapsed, 1),
+        }
+    return {"clients": clients, "seconds": round(elapsed, 3), "errors": errors, "endpoints": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load generator for the habit tracker HTTP server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per client")
+    parser.add_argument("--users", type=int, default=50, help="Synthetic users to log in as")
+    parser.add_argument("--password", default="pwd123!", help="Password of the synthetic users")
+    parser.add_argument("--start-date", type=date.fromisoformat, default=date(2400, 1, 1),
+                        help="First check-in date (use a later one to repeat a run on the same database)")
+    parser.add_argument("--output", help="JSON file for the results")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_load(args.host, args.port, args.clients, args.requests, args.users,
+                                   args.password, args.start_date))
+    print(f"{args.clients} clients, {results['seconds']} s, errors: {results['errors'] or 'none'}")
+    print(f"{'endpoint':<14}{'requests':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, stats in results["endpoints"].items():
+        print(f"{name:<14}{stats['requests']:>10}{stats['p50_ms']:>10}{stats['p99_ms']:>10}{stats['max_ms']:>10}")
+    print(f"Throughput: {results['endpoints'].get('all', {}).get('requests_per_s')} requests/s")
+    if args.output:
+        with open(args.output, "w") as results_file:
+            json.dump(results, results_file, indent=2)
+        print(f"The results were written to '{args.output}'.")
@@ -0,0 +1,275 @@
+"""
+    This file contains the timed benchmark scenarios of the habit tracker.
+    Every scenario runs one hot-path operation repeatedly against a synthetic database
+    (see generate.py) and reports latency percentiles and throughput.
+    Every scenario runs on a fresh copy of the generated database, which itself is never changed,
+    so that write scenarios measure the same work in every run.
+    The results are written to JSON, so that runs of different commits can be compared;
+    with --baseline, scenarios that got slower than the threshold are reported as regressions.
+    Usage: python -m benchmarks.run --users 200 --days 365 --output results.json [--baseline old.json]
+"""
+
+import argparse
+import builtins
+import io
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from contextlib import contextmanager, redirect_stdout
+from datetime import date, datetime, timedelta
+from dates import to_day, today
+from db import add_counter, get_db, close_db
+from counter_manager import increment_streak
+from services import CounterService
+from benchmarks.generate import generate_dataset
+
+
+@contextmanager
+def _answers(*answers):
+    """Context manager that answers input() prompts with the given values (in a loop)"""
+    original_input = builtins.input
+    replies = iter(answers * 1000000)
+    builtins.input = lambda prompt="": next(replies)
+    try:
+        yield
+    finally:
+        builtins.input = original_input
+
+
+####Scenarios
+#Each scenario receives the connection, a random generator, the list of user IDs (or of the targets
+#listed in SCENARIO_TARGETS) and the iteration number, and performs exactly one operation.
+
+def scenario_add_counter(db, rng, user_ids, iteration):
+    add_counter(db, rng.choice(user_ids), "Habit 0", to_day(date(2100, 1, 1)) + iteration, "12:00:00", 1, 1)
+
+
+def scenario_increment_streak(db, rng, pairs, iteration):
+    #increment_streak always checks today, so every iteration (warmup ones have negative numbers)
+    #takes a different habit that was not checked today yet; repeating one would only time the duplicate check
+    user_id, habit_name = pairs[iteration % len(pairs)]
+    increment_streak(db.cursor(), db, habit_name, user_id)
+
+
+def scenario_check_habit(db, rng, user_ids, iteration):
+    check_date = (date(2200, 1, 1) + timedelta(days=iteration)).isoformat()
+    CounterService(db).check_in(rng.choice(user_ids), "Journaling", check_date)
+
+
+def scenario_show_all_habits(db, rng, user_ids, iteration):
+    from analyze import show_all_habits
+    show_all_habits(db.cursor(), rng.choice(user_ids))
+
+
+def scenario_show_longest_streak(db, rng, user_ids, iteration):
+    from analyze import show_longest_streak
+    show_longest_streak(db.cursor())
+
+
+def scenario_show_rep_number(db, rng, user_ids, iteration):
+    from analyze import show_rep_number
+    with _answers("Yoga"):
+        show_rep_number(db.cursor(), rng.choice(user_ids))
+
+
+def scenario_completion_rates(db, rng, user_ids, iteration):
+    from analyze import completion_rates
+    completion_rates(db.cursor(), rng.choice(user_ids))
+
+
+def scenario_completion_rates_all(db, rng, user_ids, iteration):
+    from analyze import completion_rates
+    completion_rates(db.cursor())
+
+
+SCENARIOS = {
+    "add_counter": scenario_add_counter,
+    "increment_streak": scenario_increment_streak,
+    "check_habit": scenario_check_habit,
+    "show_all_habits": scenario_show_all_habits,
+    "show_longest_streak": scenario_show_longest_streak,
+    "show_rep_number": scenario_show_rep_number,
+    "completion_rates": scenario_completion_rates,
+    "completion_rates_all": scenario_completion_rates_all,
+}
+
+#Scenarios that scan the whole dataset run at most this many iterations
+SCENARIO_MAX_ITERATIONS = {"completion_rates_all": 5}
+
+
+def _unchecked_habits(db, rng, user_ids):
+    """Function that returns the (user ID, habit name) pairs of the custom habits not checked today, in random order"""
+    users = set(user_ids)
+    pairs = [(user_id, habit_name) for user_id, habit_name in db.execute(
+        """SELECT user_id, habit_name FROM habits h WHERE is_custom = 1
+           AND NOT EXISTS (SELECT 1 FROM counter c WHERE c.user_id = h.user_id AND c.habit_name = h.habit_name
+                           AND c.check_day = ?)
+           ORDER BY user_id, habit_name""", (today(),)) if user_id in users]
+    rng.shuffle(pairs)
+    return pairs
+
+
+#Scenarios that must not repeat an operation receive their targets from these functions instead of the user IDs
+SCENARIO_TARGETS = {"increment_streak": _unchecked_habits}
+
+
+def _percentile(sorted_values, fraction):
+    """Function that returns a percentile of an already sorted list"""
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+def run_scenario(db, name, iterations=200, warmup=5, seed=1):
+    """
+    Function that times a scenario and returns its statistics in milliseconds
+
+    :param db: Database connection object
+    :param name: Name of a scenario in SCENARIOS
+    :param iterations: Number of timed operations
+    :param warmup: Number of untimed operations before the measurement
+    """
+    scenario = SCENARIOS[name]
+    rng = random.Random(seed)
+    user_ids = [row[0] for row in db.execute("SELECT user_id FROM user WHERE user_id LIKE 'user%'")]
+    if name in SCENARIO_TARGETS:
+        user_ids = SCENARIO_TARGETS[name](db, rng, user_ids)
+        if len(user_ids) < warmup + iterations:
+            raise ValueError(f"The dataset has {len(user_ids)} targets for '{name}', "
+                             f"it needs {warmup + iterations}; generate more users or habits.")
+    latencies = []
+    #Messages of the database layer would dominate the measured time
+    logging.disable(logging.WARNING)
+    with redirect_stdout(io.StringIO()):
+        for iteration in range(warmup):
+            scenario(db, rng, user_ids, -1 - iteration)
+        for iteration in range(iterations):
+            started = time.perf_counter()
+            scenario(db, rng, user_ids, iteration)
+            latencies.append((time.perf_counter() - started) * 1000)
+    logging.disable(logging.NOTSET)
+    latencies.sort()
+    total_ms = sum(latencies)
+    return {
+        "iterations": iterations,
+        "total_ms": round(total_ms, 3),
+        "mean_ms": round(total_ms / iterations, 4),
+        "p50_ms": round(_percentile(latencies, 0.50), 4),
+        "p95_ms": round(_percentile(latencies, 0.95), 4),
+        "max_ms": round(latencies[-1], 4),
+        "ops_per_s": round(iterations / (total_ms / 1000), 1) if total_ms else None,
+    }
+
+
+def _git_commit():
+    """Function that returns the current git commit, or None outside of a git checkout"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare_results(results, baseline, threshold=1.2):
+    """Function that returns the scenarios whose mean latency grew by more than 'threshold' against a baseline"""
+    regressions = []
+    for name, stats in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old and old["mean_ms"] and stats["mean_ms"] / old["mean_ms"] > threshold:
+            regressions.append((name, old["mean_ms"], stats["mean_ms"]))
+    return regressions
+
+
+def _remove_database(path):
+    """Function that deletes a database file together with its journal files"""
+    for suffix in ("", "-wal", "-shm", "-journal"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def _working_copy(db_name):
+    """Function that copies the pristine benchmark database into a fresh working file and returns its path"""
+    path = f"{db_name}.work"
+    _remove_database(path)
+    source, target = sqlite3.connect(db_name), sqlite3.connect(path)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    return path
+
+
+def run_benchmarks(db_name, users, habits, days, iterations, scenarios, seed=42):
+    """Function that generates the dataset (if the database is new) and runs every scenario on a fresh copy of it"""
+    dataset, generate_s = None, None
+    if not os.path.exists(db_name):
+        db = get_db(db_name)
+        if db is None:
+            raise sqlite3.OperationalError(f"Could not open '{db_name}'.")
+        try:
+            started = time.perf_counter()
+            with redirect_stdout(io.StringIO()):
+                dataset = generate_dataset(db, users, habits, days, seed)
+            generate_s = round(time.perf_counter() - started, 2)
+        finally:
+            close_db()
+    results = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "dataset": {"users": users, "habits_per_user": habits, "days": days, "seed": seed,
+                        "generated": dataset, "generate_s": generate_s},
+        },
+        "scenarios": {},
+    }
+    for name in scenarios:
+        #Write scenarios change their database, so every scenario starts from the pristine dataset
+        working_copy = _working_copy(db_name)
+        db = get_db(working_copy)
+        if db is None:
+            raise sqlite3.OperationalError(f"Could not open '{working_copy}'.")
+        try:
+            scenario_iterations = min(iterations, SCENARIO_MAX_ITERATIONS.get(name, iterations))
+            results["scenarios"][name] = run_scenario(db, name, scenario_iterations)
+        finally:
+            close_db()
+            _remove_database(working_copy)
+        print(f"{name:22s} {results['scenarios'][name]['mean_ms']:10.4f} ms mean "
+              f"{results['scenarios'][name]['p95_ms']:10.4f} ms p95")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the habit tracker benchmarks")
+    parser.add_argument("--db", default="bench.db", help="Pristine database file (generated if it does not exist, "
+                                                         "the scenarios run on copies of it)")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--habits", type=int, default=5, help="Custom habits per user")
+    parser.add_argument("--days", type=int, default=365, help="Days of history")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="Scenario to run (repeatable, default: all)")
+    parser.add_argument("--output", default="bench_results.json", help="JSON file for the results")
+    parser.add_argument("--baseline", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown factor reported as regression")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.db, args.users, args.habits, args.days, args.iterations,
+                             args.scenario or list(SCENARIOS))
+    with open(args.output, "w") as output:
+        json.dump(results, output, indent=2)
+    print(f"Results were written to '{args.output}'.")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_results(results, json.load(baseline_file), args.threshold)
+        for name, old_ms, new_ms in regressions:
+            print(f"Regression in {name}: {old_ms:.4f} ms -> {new_ms:.4f} ms")
+        sys.exit(1 if regressions else 0)
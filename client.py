@@ -0,0 +1,161 @@
+"""
+    This file contains the thin command line client of the habit tracker daemon.
+    The daemon (python server.py --socket) keeps its connections, caches and imported modules warm;
+    the client only imports the standard library, sends one request over the Unix domain socket
+    and prints the answer, so that shell scripts and cron jobs get their result in milliseconds.
+    'login' stores the session token in ~/.habit_tracker_token (or use HABIT_TRACKER_TOKEN).
+    Usage: python client.py login testuser --ttl 86400
+           python client.py check "Habit 0"
+           python client.py streaks
+"""
+
+import argparse
+import json
+import os
+import socket
+import sys
+from urllib.parse import quote
+
+#Socket of the daemon and file of the session token (can be changed with environment variables)
+DEFAULT_SOCKET = os.environ.get("HABIT_TRACKER_SOCKET", os.path.expanduser("~/.habit_tracker.sock"))
+TOKEN_FILE = os.environ.get("HABIT_TRACKER_TOKEN_FILE", os.path.expanduser("~/.habit_tracker_token"))
+
+
+def request(method, path, body=None, token=None, socket_path=DEFAULT_SOCKET):
+    """
+    Function that sends one HTTP request to the daemon and returns (status, JSON payload)
+
+    :param method: HTTP method
+    :param path: Resource path, e.g. /habits
+    :param body: JSON body (dict) or None
+    :param token: Session token or None
+    :param socket_path: Path of the daemon's Unix domain socket
+    """
+    data = json.dumps(body).encode() if body is not None else b""
+    head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(data)}\r\nConnection: close\r\n"
+    if token:
+        head += f"Authorization: Bearer {token}\r\n"
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(socket_path)
+        connection.sendall(head.encode() + b"\r\n" + data)
+        chunks = []
+        while True:
+            chunk = connection.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    head, _, payload = b"".join(chunks).partition(b"\r\n\r\n")
+    return int(head.split()[1]), json.loads(payload) if payload else {}
+
+
+def read_token():
+    """Function that returns the session token from HABIT_TRACKER_TOKEN or the token file, or None"""
+    if os.environ.get("HABIT_TRACKER_TOKEN"):
+        return os.environ["HABIT_TRACKER_TOKEN"]
+    try:
+        with open(TOKEN_FILE) as token_file:
+            return token_file.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def save_token(token):
+    """Function that stores the session token in a file that only the user can read"""
+    descriptor = os.open(TOKEN_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(descriptor, "w") as token_file:
+        token_file.write(token)
+
+
+def print_table(rows, columns=None):
+    """Function that prints a list of dicts as an aligned table"""
+    if not rows:
+        print("No entries found.")
+        return
+    columns = columns or list(rows[0])
+    cells = [[str(row.get(column, "")) for column in columns] for row in rows]
+    widths = [max(len(column), *(len(line[number]) for line in cells)) for number, column in enumerate(columns)]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for line in cells:
+        print("  ".join(cell.ljust(width) for cell, width in zip(line, widths)))
+
+
+def main(argv=None):
+    """Function that runs one client command and returns the exit code"""
+    parser = argparse.ArgumentParser(description="Thin client of the habit tracker daemon")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix domain socket of the daemon")
+    commands = parser.add_subparsers(dest="command", required=True)
+    login = commands.add_parser("login", help="Log in and store the session token")
+    login.add_argument("identifier", help="User name or user ID")
+    login.add_argument("--ttl", type=int, help="Seconds the session stays valid")
+    commands.add_parser("logout", help="End the stored session")
+    check = commands.add_parser("check", help="Check a habit")
+    check.add_argument("habit")
+    check.add_argument("--date", help="Date of the check (YYYY-MM-DD, default today)")
+    habits = commands.add_parser("habits", help="List the habits")
+    habits.add_argument("--interval", choices=["Daily", "Weekly"])
+    status = commands.add_parser("status", help="Show the streak state of a habit")
+    status.add_argument("habit")
+    commands.add_parser("streaks", help="Show the recomputed streaks of all habits")
+    completion = commands.add_parser("completion", help="Show the completion rates")
+    completion.add_argument("--windows", default="7,30,90", help="Comma-separated window lengths in days")
+    leaderboard = commands.add_parser("leaderboard", help="Show the streak leaderboard")
+    leaderboard.add_argument("-k", type=int, default=10)
+    leaderboard.add_argument("--all", action="store_true", help="Rank the habits of all users")
+    args = parser.parse_args(argv)
+
+    body, token = None, read_token()
+    if args.command == "login":
+        from getpass import getpass
+        body = {"identifier": args.identifier, "password": getpass("Password: ")}
+        if args.ttl:
+            body["ttl"] = args.ttl
+        method, path = "POST", "/login"
+    elif args.command == "logout":
+        method, path = "POST", "/logout"
+    elif args.command == "check":
+        method, path, body = "POST", "/check-ins", {"habit": args.habit, "date": args.date}
+    elif args.command == "habits":
+        method, path = "GET", "/habits" + (f"?interval={args.interval}" if args.interval else "")
+    elif args.command == "status":
+        method, path = "GET", f"/habits/{quote(args.habit, safe='')}/status"
+    elif args.command == "streaks":
+        method, path = "GET", "/analytics/streaks"
+    elif args.command == "completion":
+        method, path = "GET", f"/analytics/completion?windows={quote(args.windows)}"
+    else:
+        method, path = "GET", f"/analytics/leaderboard?k={args.k}" + ("&scope=all" if args.all else "")
+
+    try:
+        status_code, payload = request(method, path, body, token, args.socket)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(f"The daemon is not running. Start it with: python server.py --socket {args.socket}")
+        return 2
+
+    if status_code >= 400 and "outcome" not in payload:
+        print(payload.get("error", f"The request failed with status {status_code}."))
+        return 1
+    if args.command == "login":
+        save_token(payload["token"])
+        print(f"Logged in as '{payload['user_id']}' for {payload['expires_in'] // 60} minutes.")
+    elif args.command == "logout":
+        if os.path.exists(TOKEN_FILE):
+            os.remove(TOKEN_FILE)
+        print(payload["message"])
+    elif args.command == "check":
+        print(f"'{payload['habit']}': {payload['outcome']}")
+        return 0 if status_code < 400 else 1
+    elif args.command == "habits":
+        print_table(payload["habits"], ["name", "interval", "type", "is_custom", "date"])
+    elif args.command == "status":
+        print_table([payload["status"]])
+    elif args.command == "streaks":
+        print_table(payload["streaks"])
+    elif args.command == "completion":
+        print_table(payload["completion"])
+    else:
+        print_table(payload["leaderboard"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
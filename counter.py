@@ -6,46 +6,45 @@
 """
 
 import sqlite3
+from db import connection_scope
 from counter_manager import increment_streak, increment_counter, check_habit, reset_streak
 
 class Counter:
     def __init__(self, db_connection, user_id):
     
-    """
-    A class that represents a counter for habits to be tracked and checked.
-    
-    :param db_connection: sqlite3.connection 
-        The database connection object that is used to interact with the database.
-    :param user_id: str
-        A unique identification of the user; used to associate habits with their account.
-    """
+        """
+        A class that represents a counter for habits to be tracked and checked.
+        
+        :param db_connection: sqlite3.Connection or db.ConnectionPool
+            The database connection (or pool of connections) that is used to interact with the database.
+        :param user_id: str
+            A unique identification of the user; used to associate habits with their account.
+        """
     
         self.user_id = user_id
-        #Database connection
+        #Database connection or connection pool
         self.db = db_connection
-        self.cur = self.db.cursor()
         
         
     def increment_streak(self, habit_name):
         """Method to increment the streak counter by 1"""
-        increment_streak(self.cur, self.db, habit_name, self.user_id)
+        with connection_scope(self.db) as db:
+            increment_streak(db.cursor(), db, habit_name, self.user_id)
         
         
     def increment_counter(self, habit_name):
         """Method to increment the repetition counter by 1"""
-        increment_counter(self.cur, self.db, habit_name, self.us
+        with connection_scope(self.db) as db:
+            increment_counter(db.cursor(), db, habit_name, self.user_id)
         
                           
     def check_habit(self):
         """Method to mark a habit as completed"""
-        check_habit(self.cur, self.db, self.user_id)
+        with connection_scope(self.db) as db:
+            check_habit(db.cursor(), db, self.user_id)
 
                           
     def reset_streak(self):
         """Method to manually reset a streak"""
-        reset_streak(self.cur, self.db, None, self.user_id)
-                          
-#This is for later tests
-counter = Counter("test name", "test description")
-counter.increment_streak()
-print(counter)
\ No newline at end of file
+        with connection_scope(self.db) as db:
+            reset_streak(db.cursor(), db, None, self.user_id)
@@ -5,47 +5,95 @@
 """
 
 import sqlite3
-from datetime import datetime, timedelta
-from analyze import show_all_habits
-from db import add_counter
+from concurrent.futures import Future
+from datetime import datetime
+from dates import to_day, today, format_day
+from db import add_counter, is_shard, UPSERT_HABIT_STATE
+from records import COUNTER_COLUMNS, counter_row
+
+#Outcomes of a single record in check_in_many()
+CHECK_IN_INSERTED = "inserted"
+CHECK_IN_DUPLICATE = "duplicate"
+CHECK_IN_UNKNOWN_HABIT = "unknown habit"
+CHECK_IN_OUT_OF_ORDER = "out of order"
+CHECK_IN_INVALID = "invalid"
+CHECK_IN_UNKNOWN_USER = "unknown user"
+#Record older than the last check of its habit, inserted with backfill=True (see check_in_many)
+CHECK_IN_BACKFILLED = "backfilled"
+
+#Maximum number of bound parameters used for an "IN (...)" lookup
+LOOKUP_CHUNK_SIZE = 500
+
+#Largest number of repetitions accepted for one check-in
+MAX_HABIT_REP = 1000000
+
+
+#Streak rule shared by increment_streak() and check_in_many()
+def next_streak(habit_interval, last_day, last_streak, check_day):
+    """
+    Function that returns the streak of a habit after a check on 'check_day'
+    
+    :param habit_interval: 'Daily' or 'Weekly'
+    :param last_day: Day number of the previous check (see dates.py) or None
+    :param last_streak: Streak value of the previous check
+    :param check_day: Day number of the new check
+    """
+    if last_day is None:
+        return 1
+    gap = check_day - last_day
+    if habit_interval == "Daily" and gap == 1:
+        return last_streak + 1
+    if habit_interval == "Weekly" and 0 < gap <= 7:
+        return last_streak + 1
+    return 1
+
+#Function that returns the latest counter row of a habit as a CounterRecord (or None)
+def last_counter_record(cur, habit_name, user_id):
+    """Function to look up the most recent counter record of a habit"""
+    cur = cur.connection.cursor()
+    cur.row_factory = counter_row
+    cur.execute(
+        f"SELECT {COUNTER_COLUMNS} FROM counter WHERE user_id = ? AND habit_name = ? ORDER BY check_day DESC LIMIT 1",
+        (user_id, habit_name)
+    )
+    return cur.fetchone()
+
+
+def _streak_on(cur, habit_name, user_id, last_record, check_day):
+    """Function that returns the streak of a habit after a check on 'check_day', given its last counter record"""
+    if last_record is None:
+        return next_streak(None, None, 0, check_day)
+    if last_record.check_day == check_day:
+        return last_record.habit_streak
+    #Find out the habit's interval (a custom habit takes precedence over a predefined one, as in check_in_many)
+    cur.execute("""SELECT habit_interval FROM habits WHERE habit_name = ? AND (user_id = ? OR is_custom = 0)
+                   ORDER BY is_custom DESC LIMIT 1""", (habit_name, user_id))
+    interval = cur.fetchone()
+    return next_streak(interval[0] if interval else None, last_record.check_day, last_record.habit_streak, check_day)
+
+
+def _committed(result):
+    """Function that returns the outcome of add_counter, waiting for the group commit in write-behind mode"""
+    return result.result() if isinstance(result, Future) else result
+
 
 #Functions defining the update of the repetition and the streak counters
 #Called in check_habit()
 def increment_streak(cur, db, habit_name, user_id):
     """Function that increments the streak of a habit"""
     try:
-        now = datetime.now()
-        check_date = now.strftime('%Y-%m-%d')  #Current date
-        check_time = now.strftime('%H:%M:%S')  #Current time
-        
-        #Check the last streak value
-        cur.execute(
-            "SELECT habit_streak FROM counter WHERE habit_name = ? AND user_id = ? ORDER BY check_date DESC LIMIT 1",
-            (habit_name, user_id)
-        )
-        last_record = cur.fetchone()
-
-        if last_record:
-            last_streak, last_date = last_record
-            last_date = datetime.strptime(last_date, "%Y-%m-%d").date()
-        else:
-            last_streak, last_date = 0, None
-        
-        #Find out the habit's interval
-        cur.execute("SELECT habit_interval FROM habits WHERE habit_name = ? AND user_id = ?", (habit_name, user_id))
-        interval = cur.fetchone()
+        check_day = today()  #Current date
+        check_time = datetime.now().strftime('%H:%M:%S')  #Current time
         
         #Update streak counter according to the habit's interval
-        if interval and interval[0] == "Weekly" and last_date and last_date >= now.date() - timedelta(days=7):
-            new_streak = last_streak + 1
-        elif interval and interval[0] == "Daily" and last_date == now.date():
-            new_streak = last_streak + 1
-        else:
-            new_streak = 1
+        new_streak = _streak_on(cur, habit_name, user_id, last_counter_record(cur, habit_name, user_id), check_day)
 
         #Call add_counter function from db.py to update streak counter
-        add_counter(cur, db, user_id, habit_name, check_date, check_time, 0, new_streak)
-        print(f"The streak for '{habit_name}' has been incremented to {new_streak}.")
+        committed = _committed(add_counter(db, user_id, habit_name, check_day, check_time, 0, new_streak))
+        if committed:
+            print(f"The streak for '{habit_name}' has been incremented to {new_streak}.")
+        elif committed is False:
+            print(f"'{habit_name}' was already checked today. Its streak stays at {new_streak}.")
     except sqlite3.Error as e:
         db.rollback()
         print(f"An error occurred while incrementing streak for '{habit_name}': {e}")
@@ -57,9 +105,8 @@ def increment_counter(cur, db, habit_name, user_id):
         and that automatically increments the streak counter
     """
     try:
-        now = datetime.now()
-        check_date = now.strftime('%Y-%m-%d')  #Current date
-        check_time = now.strftime('%H:%M:%S')  #Current time
+        check_day = today()  #Current date
+        check_time = datetime.now().strftime('%H:%M:%S')  #Current time
         
         #Validate if the habit exists
         cur.execute("SELECT 1 FROM counter WHERE habit_name = ? AND user_id = ?", (habit_name, user_id))
@@ -68,20 +115,21 @@ def increment_counter(cur, db, habit_name, user_id):
             return  
                 
         #Check the last repetition value
-        cur.execute(
-            "SELECT habit_rep FROM counter WHERE habit_name = ? AND user_id = ? ORDER BY check_date DESC LIMIT 1",
-            (habit_name, user_id)
-        )
-        last_rep = cur.fetchone()
+        last_record = last_counter_record(cur, habit_name, user_id)
         
-        if last_rep and last_rep[1] == check_date:
-            new_rep = last_rep[0] + 1
+        if last_record and last_record.check_day == check_day:
+            new_rep = last_record.habit_rep + 1
         else:
             new_rep = 1
 
-        #Call add_counter function from db.py to update repetition counter
-        add_counter(cur, db, user_id, habit_name, check_date, check_time, new_rep, 0)
-        print(f"The number of repetitions of '{habit_name}' has been incremented to {new_rep}.")
+        #Call add_counter function from db.py to update repetition counter; the row carries the streak
+        #of the check, so that the habit_state upsert does not reset the current streak
+        committed = _committed(add_counter(db, user_id, habit_name, check_day, check_time, new_rep,
+                                           _streak_on(cur, habit_name, user_id, last_record, check_day)))
+        if committed:
+            print(f"The number of repetitions of '{habit_name}' has been incremented to {new_rep}.")
+        elif committed is False:
+            print(f"'{habit_name}' was already checked today. The number of repetitions was not changed.")
         
         #Automatically increment streak
         increment_streak(cur, db, habit_name, user_id)              
@@ -91,36 +139,272 @@ def increment_counter(cur, db, habit_name, user_id):
         print(f"Error while incrementing counter for '{habit_name}': {e}")
 
 
+#Batched check-in: validates, computes streaks and writes all records in one transaction
+def _load_habit_intervals(cur, user_ids):
+    """Function that maps (user_id, habit_name) to the habit's interval for the given users"""
+    cur.execute("SELECT habit_name, habit_interval FROM habits WHERE is_custom = 0")
+    predef_intervals = dict(cur.fetchall())
+    custom_intervals = {}
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), LOOKUP_CHUNK_SIZE):
+        chunk = user_ids[start:start + LOOKUP_CHUNK_SIZE]
+        cur.execute(
+            f"""SELECT user_id, habit_name, habit_interval FROM habits
+            WHERE is_custom = 1 AND user_id IN ({", ".join("?" * len(chunk))})""",
+            chunk
+        )
+        for user_id, habit_name, habit_interval in cur.fetchall():
+            custom_intervals[(user_id, habit_name)] = habit_interval
+    return predef_intervals, custom_intervals
+
+
+def _load_users(cur, user_ids):
+    """Function that returns the subset of the given user IDs that exist in the user table"""
+    users = set()
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), LOOKUP_CHUNK_SIZE):
+        chunk = user_ids[start:start + LOOKUP_CHUNK_SIZE]
+        cur.execute(f"SELECT user_id FROM user WHERE user_id IN ({', '.join('?' * len(chunk))})", chunk)
+        users.update(row[0] for row in cur.fetchall())
+    return users
+
+
+def _load_habit_states(cur, user_ids):
+    """Function that maps (user_id, habit_name) to [current streak, longest streak, last check day]"""
+    states = {}
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), LOOKUP_CHUNK_SIZE):
+        chunk = user_ids[start:start + LOOKUP_CHUNK_SIZE]
+        cur.execute(
+            f"""SELECT user_id, habit_name, current_streak, longest_streak, last_check_day FROM habit_state
+            WHERE user_id IN ({", ".join("?" * len(chunk))})""",
+            chunk
+        )
+        for user_id, habit_name, current_streak, longest_streak, last_check_day in cur.fetchall():
+            states[(user_id, habit_name)] = [current_streak, longest_streak, last_check_day]
+    return states
+
+
+def _habit_rep(value):
+    """Function that returns the repetitions of a check-in record as an int (missing or empty: 1)"""
+    if value is None or value == "":
+        return 1
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(f"Invalid number of repetitions: {value!r}")
+    habit_rep = int(value)
+    if not 0 <= habit_rep <= MAX_HABIT_REP:
+        raise ValueError(f"The number of repetitions must be between 0 and {MAX_HABIT_REP}.")
+    return habit_rep
+
+
+class HabitLookup:
+    def __init__(self, cur, user_ids=None):
+
+        """
+        In-memory lookups of habit intervals and habit states used by check_in_many to validate
+        records and to compute streaks without a query per record. check_in_many keeps the
+        states up to date, so one lookup can be reused for many batches (see importer.py).
+
+        :param cur: Cursor for database operations
+        :param user_ids: Users whose habits are loaded (None: all users); records of users that do
+            not exist in the user table are rejected (except on a shard, see sharding.ShardConnection)
+        """
+
+        #Users that may check in; None accepts every user
+        self.users = None
+        if user_ids is None:
+            if not is_shard(cur.connection):
+                cur.execute("SELECT user_id FROM user")
+                self.users = {row[0] for row in cur}
+            cur.execute("SELECT habit_name, habit_interval FROM habits WHERE is_custom = 0")
+            self.predef_intervals = dict(cur.fetchall())
+            cur.execute("SELECT user_id, habit_name, habit_interval FROM habits WHERE is_custom = 1")
+            self.custom_intervals = {(user_id, habit_name): interval for user_id, habit_name, interval in cur}
+            cur.execute("SELECT user_id, habit_name, current_streak, longest_streak, last_check_day FROM habit_state")
+            self.states = {(user_id, habit_name): [current, longest, last_day]
+                           for user_id, habit_name, current, longest, last_day in cur}
+        else:
+            if not is_shard(cur.connection):
+                self.users = _load_users(cur, user_ids)
+            self.predef_intervals, self.custom_intervals = _load_habit_intervals(cur, user_ids)
+            self.states = _load_habit_states(cur, user_ids)
+
+
+    def interval(self, user_id, habit_name):
+        """Method that returns the interval of a habit of a user, or None if the user does not track it"""
+        return self.custom_intervals.get((user_id, habit_name)) or self.predef_intervals.get(habit_name)
+
+
+def _recompute_streaks(cur, lookup, keys):
+    """
+    Function that recomputes the streaks of all counter rows and the habit_state rows of the given
+    habits in date order, e.g. after older check-ins were inserted (the caller commits)
+
+    :param cur: Cursor inside a write transaction
+    :param lookup: HabitLookup, updated with the new habit states
+    :param keys: Iterable of (user_id, habit_name)
+    """
+    for user_id, habit_name in keys:
+        interval = lookup.interval(user_id, habit_name)
+        cur.execute("""SELECT check_day, habit_streak, habit_rep FROM counter
+                       WHERE user_id = ? AND habit_name = ? ORDER BY check_day""", (user_id, habit_name))
+        streak, longest, last_day, total_reps = 0, 0, None, 0
+        changed = []
+        for check_day, old_streak, habit_rep in cur.fetchall():
+            streak = next_streak(interval, last_day, streak, check_day)
+            if streak != old_streak:
+                changed.append((streak, user_id, habit_name, check_day))
+            longest, last_day, total_reps = max(longest, streak), check_day, total_reps + (habit_rep or 0)
+        cur.executemany("UPDATE counter SET habit_streak = ? WHERE user_id = ? AND habit_name = ? AND check_day = ?",
+                        changed)
+        cur.execute("""INSERT OR REPLACE INTO habit_state
+                       (user_id, habit_name, current_streak, longest_streak, last_check_day, total_reps)
+                       VALUES (?, ?, ?, ?, ?, ?)""", (user_id, habit_name, streak, longest, last_day, total_reps))
+        lookup.states[(user_id, habit_name)] = [streak, longest, last_day]
+
+
+def check_in_many(db, records, lookup=None, default_time=None, backfill=False):
+    """
+    Function to check in a batch of habits (of one or several users) in a single transaction
+    
+    :param db: Database connection object
+    :param records: Iterable of dicts with the keys 'user_id' and 'habit_name' and the optional keys
+        'check_date' (YYYY-MM-DD, datetime.date or day number, default today), 'check_time' (HH:MM:SS, default now) and 'habit_rep' (0 to MAX_HABIT_REP, default 1)
+    :param lookup: HabitLookup to reuse across batches (default: loaded for the users of the records)
+    :param default_time: check_time of records without one (default: now)
+    :param backfill: Insert records older than the last check of their habit and recompute the streaks
+        of these habits (CHECK_IN_BACKFILLED) instead of rejecting them as CHECK_IN_OUT_OF_ORDER
+    :return: List with one outcome per record, in input order (CHECK_IN_INSERTED, CHECK_IN_DUPLICATE,
+        CHECK_IN_UNKNOWN_HABIT, CHECK_IN_UNKNOWN_USER, CHECK_IN_OUT_OF_ORDER, CHECK_IN_BACKFILLED or CHECK_IN_INVALID)
+    """
+    records = list(records)
+    outcomes = [CHECK_IN_INVALID] * len(records)
+    current_day = today()
+    now_time = default_time or datetime.now().strftime('%H:%M:%S')
+
+    #Validate the shape of each record and normalize it into a tuple
+    rows = []
+    for index, record in enumerate(records):
+        try:
+            user_id = record["user_id"]
+            habit_name = record["habit_name"]
+            check_date = record.get("check_date")
+            check_day = current_day if check_date in (None, "") else to_day(check_date)
+            habit_rep = _habit_rep(record.get("habit_rep"))
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+        rows.append((user_id, habit_name, check_day, record.get("check_time") or now_time, habit_rep, index))
+    if not rows:
+        return outcomes
+
+    cur = db.cursor()
+    try:
+        #Take the write lock before the habit state is read, so that two writers cannot compute
+        #streaks from the same state
+        cur.execute("BEGIN IMMEDIATE")
+        if lookup is None:
+            lookup = HabitLookup(cur, {row[0] for row in rows})
+        states = lookup.states
+
+        #Process the records of each habit in date order so that streaks build up correctly
+        rows.sort(key=lambda row: (row[0], row[1], row[2]))
+        counter_rows = []
+        backfill_rows = []
+        changed_reps = {}
+        for user_id, habit_name, check_day, check_time, habit_rep, index in rows:
+            key = (user_id, habit_name)
+            if lookup.users is not None and user_id not in lookup.users:
+                outcomes[index] = CHECK_IN_UNKNOWN_USER
+                continue
+            habit_interval = lookup.interval(user_id, habit_name)
+            if habit_interval is None:
+                outcomes[index] = CHECK_IN_UNKNOWN_HABIT
+                continue
+
+            state = states.get(key)
+            if state is not None and state[2] is not None and check_day <= state[2]:
+                if check_day == state[2]:
+                    outcomes[index] = CHECK_IN_DUPLICATE
+                elif backfill:
+                    backfill_rows.append((user_id, habit_name, check_day, check_time, habit_rep, index))
+                else:
+                    outcomes[index] = CHECK_IN_OUT_OF_ORDER
+                continue
+
+            if state is None:
+                state = states[key] = [0, 0, None]
+            streak = next_streak(habit_interval, state[2], state[0], check_day)
+            state[0], state[1], state[2] = streak, max(state[1], streak), check_day
+
+            counter_rows.append((user_id, habit_name, check_day, check_time, habit_rep, streak))
+            changed_reps[key] = changed_reps.get(key, 0) + habit_rep
+            outcomes[index] = CHECK_IN_INSERTED
+
+        #Write the whole batch with one upsert per row
+        state_rows = [(key[0], key[1], *states[key], reps) for key, reps in changed_reps.items()]
+        cur.executemany("""
+            INSERT INTO counter (user_id, habit_name, check_day, check_time, habit_rep, habit_streak)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, habit_name, check_day) DO NOTHING
+            """, counter_rows)
+        cur.executemany(UPSERT_HABIT_STATE, state_rows)
+
+        #Older records may fall on a day that is already checked, so they are inserted one by one
+        backfilled = set()
+        for user_id, habit_name, check_day, check_time, habit_rep, index in backfill_rows:
+            cur.execute("""
+                INSERT INTO counter (user_id, habit_name, check_day, check_time, habit_rep, habit_streak)
+                VALUES (?, ?, ?, ?, ?, 0)
+                ON CONFLICT (user_id, habit_name, check_day) DO NOTHING
+                """, (user_id, habit_name, check_day, check_time, habit_rep))
+            if cur.rowcount == 1:
+                backfilled.add((user_id, habit_name))
+                outcomes[index] = CHECK_IN_BACKFILLED
+            else:
+                outcomes[index] = CHECK_IN_DUPLICATE
+        _recompute_streaks(cur, lookup, backfilled)
+        db.commit()
+    except sqlite3.Error as e:
+        db.rollback()
+        print(f"An error occurred while checking in {len(records)} records: {e}")
+        raise
+    except Exception:
+        #Never leave the write lock behind
+        db.rollback()
+        raise
+    return outcomes
+
+
 #Function to mark a habit as checked + update counters
 def check_habit(cur, db, user_id):
     """
         Function that lets the user check a given habit and that
         automatically increments the repetition counter
     """
+    #Imported here so that pandas (via analyze) is only loaded when a table is displayed
+    from analyze import show_all_habits
+    from services import HabitService, CounterService
     try:
-        #Display all habits using imported "show_all_habits" function
-        all_habits = show_all_habits(cur, user_id)
-        if all_habits.empty:
+        #Load the habits of the user through the service layer
+        habits = HabitService(db).catalog(user_id)
+        if not habits:
             print("\nNo habits found to check.")
             return
 
         print("\nHere you can see all habits: ")
-        print(all_habits.to_string(index=False))
+        print(show_all_habits(cur, user_id).to_string(index=False))
 
         #User input 1: Enter correct habit name
         while True:
             habit_name = input("\nEnter the name of the habit you want to check: ").strip()
-            if habit_name in all_habits["Name"].values:
-                selected_habit = all_habits[all_habits["Name"] == habit_name].iloc[0]
+            if habit_name in habits:
                 break
             print("Invalid habit name. Please enter a valid habit name from the list.")
 
-        habit_interval = selected_habit["Interval"]
+        habit_interval = habits[habit_name].interval
 
         #User input 2: Check the habit according to its interval
-        now = datetime.now()
-        check_date = now.strftime('%Y-%m-%d')  #Current date
-        check_time = now.strftime('%H:%M:%S')  #Current time
+        check_date = format_day(today())  #Current date
         
         if habit_interval == "Daily":
             print(f"Did you practice '{habit_name}' today ({check_date})?") 
@@ -132,12 +416,14 @@ def check_habit(cur, db, user_id):
             raise ValueError("Invalid periodicity. Neither 'Daily' nor 'Weekly'.")
 
         if check_input == "y": 
-            #Call add_counter function from db.py to mark habit as checked
-            add_counter(cur, db, user_id, habit_name, check_date, check_time, 1,1)
-            print(f"The habit '{habit_name}' was marked as checked.")
-            
-             #Automatically increment the repetition counter (and indirectly the streak)
-            increment_counter(cur, db, habit_name, user_id)
+            #Mark the habit as checked, the repetition and streak counters are updated in the same transaction
+            result = CounterService(db).check_in(user_id, habit_name, check_date)
+            if result.ok:
+                print(f"The habit '{habit_name}' was marked as checked.")
+            elif result.outcome == CHECK_IN_DUPLICATE:
+                print(f"The habit '{habit_name}' was already checked on {check_date}.")
+            else:
+                print(f"The habit '{habit_name}' could not be checked ({result.outcome}).")
         else:
             print(f"The habit '{habit_name}' wasn't marked as checked.")
 
@@ -149,14 +435,17 @@ def check_habit(cur, db, user_id):
 #Function to manually reset the streak of a given habit
 def reset_streak(cur, db, habit_name, user_id):
     """Function to allow manual reset of the streak of a given habit by the user"""
+    #Imported here so that pandas (via analyze) is only loaded when a table is displayed
+    from analyze import show_all_habits
+    from services import HabitService, CounterService
     try:
-        #Display all habits using imported "show_all_habits" function
+        #Load the habits of the user through the service layer and display them
         print("\nHere you can see all habits:")
-        all_habits = show_all_habits(cur, user_id)
-        if all_habits.empty: #Check for empty cells in pandas dataframe
+        habit_names = HabitService(db).catalog(user_id)
+        if not habit_names:
             print("\nNo habits available to reset streaks.")
             return
-        print(all_habits.to_string(index=False))
+        print(show_all_habits(cur, user_id).to_string(index=False))
 
         #Ask user if they want to reset streak manually
         while True:
@@ -164,13 +453,8 @@ def reset_streak(cur, db, habit_name, user_id):
             manual_reset = input("Please type 'Y' for yes and 'N' for no: ").strip().lower()
             if manual_reset == 'y':
                 habit_name = input("\nPlease enter the name of the habit you want to reset the streak for: ").strip()
-                if habit_name in all_habits["Name"].values:
-                    cur.execute(
-                        "UPDATE counter SET habit_streak = 0 WHERE habit_name = ? AND user_id = ?",
-                        (habit_name, user_id)
-                    )
-                    db.commit()
-                    print(f"The streak for '{habit_name}' has been manually reset.")
+                if habit_name in habit_names:
+                    print(CounterService(db).reset_streak(user_id, habit_name).message)
                     return
                 else:
                     print("Invalid habit name. Please choose a habit from the list.")
@@ -183,5 +467,3 @@ def reset_streak(cur, db, habit_name, user_id):
     except sqlite3.Error as e:
         db.rollback()
         print(f"An error occurred while resetting streak for '{habit_name}': {e}")
-        
-        
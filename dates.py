@@ -0,0 +1,44 @@
+"""
+    This file contains the conversion helpers for the dates of the habit tracker.
+    Dates are stored as integer day numbers (days since 1970-01-01) in the 'check_day',
+    'habit_day' and 'last_check_day' columns, so gaps, streaks and date ranges are plain
+    integer arithmetic and range queries can use the indexes.
+    ISO strings (YYYY-MM-DD) are only used at the edges: user input, display, import and export.
+"""
+
+from datetime import date, datetime
+
+#Ordinal of the first day number (1970-01-01 is day 0)
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+#SQL expression that turns an ISO date column into a day number (used by the migration)
+SQL_ISO_TO_DAY = "CAST(julianday({column}) - 2440587.5 AS INTEGER)"
+
+#SQL expression that turns a day number column into an ISO date (used by the export)
+SQL_DAY_TO_ISO = "date({column} * 86400, 'unixepoch')"
+
+
+def to_day(value):
+    """Function that returns the day number of a date, datetime or ISO string (YYYY-MM-DD); None stays None"""
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, datetime):
+        value = value.date()
+    elif isinstance(value, str):
+        value = date.fromisoformat(value)
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def from_day(day):
+    """Function that returns the datetime.date of a day number; None stays None"""
+    return None if day is None else date.fromordinal(day + EPOCH_ORDINAL)
+
+
+def format_day(day):
+    """Function that returns the ISO string (YYYY-MM-DD) of a day number; None stays None"""
+    return None if day is None else from_day(day).isoformat()
+
+
+def today():
+    """Function that returns the day number of the current local date"""
+    return date.today().toordinal() - EPOCH_ORDINAL
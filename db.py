@@ -10,38 +10,665 @@
 """
 
 import sqlite3
+import atexit
+import json
 import logging
 import os
+import queue
+import re
+import sys
+import threading
+import time
+from concurrent.futures import Future, wait
+from contextlib import contextmanager
 from datetime import datetime
+from dates import SQL_ISO_TO_DAY, format_day, to_day, today
 
 #Log configuration for error handling
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-#Central variable for database connection
+#Central variable for database connection (kept for callers of get_db)
 db_connection = None  
 
+#Central connection pool used by get_db
+_default_pool = None
+
+#Shard router of the optional sharded storage mode (see enable_sharding and sharding.py)
+_router = None
+
+#SQLite performance profiles, applied to every new connection through PRAGMAs
+#(cache_size is given in KiB when negative, mmap_size in bytes, busy_timeout in milliseconds)
+PROFILES = {
+    "durable": {"journal_mode": "WAL", "synchronous": "FULL", "mmap_size": 0,
+                "cache_size": -8192, "temp_store": "DEFAULT", "busy_timeout": 5000},
+    "balanced": {"journal_mode": "WAL", "synchronous": "NORMAL", "mmap_size": 268435456,
+                 "cache_size": -65536, "temp_store": "MEMORY", "busy_timeout": 5000},
+    "bulk-load": {"journal_mode": "WAL", "synchronous": "OFF", "mmap_size": 1073741824,
+                  "cache_size": -262144, "temp_store": "MEMORY", "busy_timeout": 30000},
+}
+DEFAULT_PROFILE = "balanced"
+
+
+def read_profile(db):
+    """Function that returns the effective values of all profile PRAGMAs of a connection"""
+    return {pragma: db.execute(f"PRAGMA {pragma}").fetchone()[0] for pragma in PROFILES[DEFAULT_PROFILE]}
+
+
+def apply_profile(db, profile=DEFAULT_PROFILE):
+    """
+    Function to apply a performance profile to a connection
+    
+    :param db: Database connection object (must not be inside a transaction)
+    :param profile: Name of a profile in PROFILES or a dict of PRAGMA values (e.g. from read_profile)
+    :return: The effective PRAGMA values after applying the profile
+    """
+    if isinstance(profile, str):
+        if profile not in PROFILES:
+            raise ValueError(f"Unknown profile '{profile}'. Choose one of: {', '.join(PROFILES)}.")
+        settings = PROFILES[profile]
+    else:
+        settings = profile
+    for pragma, value in settings.items():
+        #Switching the journal mode takes a lock, so it is only done if the mode changes
+        if pragma == "journal_mode" and db.execute("PRAGMA journal_mode").fetchone()[0].lower() == str(value).lower():
+            continue
+        db.execute(f"PRAGMA {pragma} = {value}")
+    return read_profile(db)
+
+
+@contextmanager
+def use_profile(db, profile):
+    """Context manager that switches a connection to another profile and restores the previous settings"""
+    previous = read_profile(db)
+    apply_profile(db, profile)
+    try:
+        yield db
+    finally:
+        if db.in_transaction:
+            db.commit()
+        apply_profile(db, previous)
+
+
+#Opt-in query tracing
+#When enabled (enable_tracing() or the environment variable HABIT_TRACKER_TRACE=log|<file>.json),
+#new connections time every statement and count the statements SQLite executes and the rows returned,
+#grouped by the calling function (or by the label of an active trace_scope).
+_trace_stats = None
+_trace_operations = {}
+_trace_output = None
+_trace_lock = threading.Lock()
+_trace_local = threading.local()
+
+
+def _normalize_sql(sql):
+    """Function that replaces literals by '?' and collapses whitespace, so that equal statements group together"""
+    sql = re.sub(r"'(?:[^']|'')*'", "?", sql)
+    sql = re.sub(r"\b\d+(?:\.\d+)?\b", "?", sql)
+    sql = re.sub(r"\(\s*\?(?:\s*,\s*\?)+\s*\)", "(?, ...)", sql)
+    return " ".join(sql.split())
+
+
+def _trace_caller():
+    """Function that returns the label of the active trace_scope or the name of the function that issued a statement"""
+    labels = getattr(_trace_local, "labels", None)
+    if labels:
+        return labels[-1]
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code in _TRACING_CODE:
+        frame = frame.f_back
+    if frame is None:
+        return "<unknown>"
+    return f"{os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]}.{frame.f_code.co_name}"
+
+
+def _trace_entry(caller, sql):
+    """Function that returns the statistics entry of a statement issued by a caller"""
+    key = (caller, _normalize_sql(sql))
+    entry = _trace_stats.get(key)
+    if entry is None:
+        entry = _trace_stats.setdefault(key, {"calls": 0, "executed": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0})
+    return entry
+
+
+def _trace_callback(statement):
+    """Trace callback of sqlite3: counts every statement SQLite executes (also inside executemany and COMMIT)"""
+    if _trace_stats is None:
+        return
+    with _trace_lock:
+        _trace_entry(getattr(_trace_local, "caller", "<unknown>"), statement)["executed"] += 1
+
+
+class TracingCursor(sqlite3.Cursor):
+    """A cursor that records the latency and the returned rows of its statements"""
+    
+    def _timed(self, method, sql, *args):
+        """Method that runs execute/executemany/executescript and records the latency"""
+        caller = _trace_local.caller = _trace_caller()
+        started = time.perf_counter()
+        try:
+            return method(self, sql, *args)
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with _trace_lock:
+                entry = self._trace = _trace_entry(caller, sql)
+                entry["calls"] += 1
+                entry["total_ms"] += elapsed_ms
+                entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+                
+                
+    def _count_rows(self, rows, started):
+        """Method that adds fetched rows and the fetch time to the last statement"""
+        entry = getattr(self, "_trace", None)
+        if entry is not None:
+            with _trace_lock:
+                entry["rows"] += rows
+                entry["total_ms"] += (time.perf_counter() - started) * 1000
+            
+            
+    def execute(self, sql, parameters=()):
+        return self._timed(sqlite3.Cursor.execute, sql, parameters)
+    
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(sqlite3.Cursor.executemany, sql, seq_of_parameters)
+    
+    
+    def executescript(self, sql_script):
+        return self._timed(sqlite3.Cursor.executescript, sql_script)
+    
+    
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._count_rows(row is not None, started)
+        return row
+    
+    
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._count_rows(len(rows), started)
+        return rows
+    
+    
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._count_rows(len(rows), started)
+        return rows
+    
+    
+    def __next__(self):
+        started = time.perf_counter()
+        row = super().__next__()
+        self._count_rows(1, started)
+        return row
+
+
+class TracingConnection(sqlite3.Connection):
+    """A connection whose cursors (also the implicit ones of execute()) are TracingCursors"""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_trace_callback(_trace_callback)
+        
+        
+    def cursor(self, factory=TracingCursor):
+        return super().cursor(factory)
+    
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+    
+    
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+    
+    
+    def commit(self):
+        _trace_local.caller = _trace_caller()
+        super().commit()
+        
+        
+    def rollback(self):
+        _trace_local.caller = _trace_caller()
+        super().rollback()
+
+
+#Frames of the tracing classes are skipped when looking for the calling function
+_TRACING_CODE = {function.__code__ for cls in (TracingCursor, TracingConnection)
+                 for function in vars(cls).values() if hasattr(function, "__code__")}
+
+
+def enable_tracing(output="log"):
+    """
+    Function to switch on query tracing for all connections opened afterwards
+    
+    :param output: 'log' to log the summary at exit, a path to write it as JSON, or None for no dump at exit
+    """
+    global _trace_stats, _trace_output
+    if _trace_stats is None:
+        _trace_stats = {}
+        if output is not None:
+            atexit.register(dump_query_stats)
+    _trace_output = output
+
+
+@contextmanager
+def trace_scope(label):
+    """Context manager that groups all statements of a block under a label (e.g. one menu action)"""
+    labels = _trace_local.__dict__.setdefault("labels", [])
+    labels.append(label)
+    if _trace_stats is not None:
+        with _trace_lock:
+            _trace_operations[label] = _trace_operations.get(label, 0) + 1
+    try:
+        yield
+    finally:
+        labels.pop()
+
+
+def query_stats():
+    """
+    Function that returns the collected statistics grouped by caller, the most expensive callers and
+    statements first; 'statements_per_operation' is reported for trace_scope labels
+    """
+    summary = {}
+    with _trace_lock:
+        items = list((_trace_stats or {}).items())
+        operations = dict(_trace_operations)
+    for (caller, sql), entry in items:
+        group = summary.setdefault(caller, {"operations": operations.get(caller), "calls": 0, "executed": 0,
+                                            "total_ms": 0.0, "statements": []})
+        group["calls"] += entry["calls"]
+        group["executed"] += entry["executed"]
+        group["total_ms"] += entry["total_ms"]
+        group["statements"].append(dict(entry, sql=sql, total_ms=round(entry["total_ms"], 3),
+                                        max_ms=round(entry["max_ms"], 3)))
+    for group in summary.values():
+        group["total_ms"] = round(group["total_ms"], 3)
+        group["statements"].sort(key=lambda statement: statement["total_ms"], reverse=True)
+        if group["operations"]:
+            group["statements_per_operation"] = round(group["executed"] / group["operations"], 2)
+    return dict(sorted(summary.items(), key=lambda item: item[1]["total_ms"], reverse=True))
+
+
+def dump_query_stats(output=None):
+    """Function that writes the query statistics to a JSON file or, for output='log', to the log"""
+    output = output or _trace_output
+    summary = query_stats()
+    if output and output != "log":
+        with open(output, "w") as stats_file:
+            json.dump(summary, stats_file, indent=2)
+        logging.info(f"Query statistics were written to '{output}'.")
+        return
+    for caller, group in summary.items():
+        logging.info(f"{caller}: {group['calls']} calls, {group['executed']} statements, {group['total_ms']} ms")
+        for statement in group["statements"]:
+            logging.info(f"    {statement['calls']:6d}x {statement['total_ms']:10.3f} ms "
+                         f"(max {statement['max_ms']:.3f} ms, {statement['rows']} rows) {statement['sql']}")
+
+
+if os.environ.get("HABIT_TRACKER_TRACE"):
+    enable_tracing(os.environ["HABIT_TRACKER_TRACE"])
+
+
+class ConnectionPool:
+    """
+    A bounded pool of database connections that can be shared between threads.
+    Every checked out connection is used by one caller at a time and is returned with checkin()
+    or automatically by the connection() context manager.
+    
+    :param name: str
+        Path of the database file.
+    :param size: int
+        Maximum number of connections that can be checked out at the same time.
+    :param timeout: float
+        Seconds to wait for a free connection before raising sqlite3.OperationalError.
+    :param profile: str
+        Name of the performance profile (see PROFILES) applied to every new connection.
+    :param factory: type
+        Connection class of the pool (e.g. sharding.ShardConnection).
+    """
+    
+    def __init__(self, name="main_db.db", size=5, timeout=30.0, profile=DEFAULT_PROFILE, factory=sqlite3.Connection):
+        self.name = name
+        self.size = size
+        self.timeout = timeout
+        self.profile = profile
+        self.factory = factory
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+        
+        
+    def _connect(self):
+        """Method to open a new connection that may be used from any thread"""
+        factory = self.factory
+        if _trace_stats is not None and not issubclass(factory, TracingConnection):
+            #Tracing keeps the class of the pool's connections (and so their markers)
+            factory = TracingConnection if factory is sqlite3.Connection else \
+                type(f"Tracing{factory.__name__}", (TracingConnection, factory), {})
+        db = sqlite3.connect(self.name, timeout=self.timeout, check_same_thread=False, factory=factory)
+        apply_profile(db, self.profile)
+        return db
+    
+    
+    @staticmethod
+    def _is_healthy(db):
+        """Method to check whether a pooled connection can still execute statements"""
+        try:
+            db.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+        
+        
+    def checkout(self):
+        """Method to take a healthy connection out of the pool (opens one if none is idle)"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("The connection pool is closed.")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError(f"No free connection in the pool after {self.timeout} seconds.")
+        try:
+            while True:
+                try:
+                    db = self._idle.get_nowait()
+                except queue.Empty:
+                    return self._connect()
+                if self._is_healthy(db):
+                    return db
+                logging.warning("Discarding a broken pooled connection.")
+                db.close()
+        except sqlite3.Error:
+            self._slots.release()
+            raise
+        
+        
+    def checkin(self, db):
+        """Method to return a connection to the pool; an open transaction is rolled back"""
+        try:
+            if db.in_transaction:
+                db.rollback()
+            if self._closed:
+                db.close()
+            else:
+                self._idle.put(db)
+        except sqlite3.Error as e:
+            logging.warning(f"Discarding a pooled connection that could not be returned: {e}")
+            db.close()
+        finally:
+            self._slots.release()
+            
+            
+    @contextmanager
+    def connection(self):
+        """Method to check out a connection for the duration of a 'with' block"""
+        db = self.checkout()
+        try:
+            yield db
+        finally:
+            self.checkin(db)
+            
+            
+    def close(self):
+        """Method to close all idle connections; connections still checked out are closed on checkin"""
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def get_pool(name="main_db.db", size=5, profile=DEFAULT_PROFILE):
+    """Function to create and return the central connection pool"""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = ConnectionPool(name, size, profile=profile)
+    return _default_pool
+
+
+@contextmanager
+def connection_scope(source):
+    """Context manager that yields a connection from either a ConnectionPool or a bare connection"""
+    if isinstance(source, ConnectionPool):
+        with source.connection() as db:
+            yield db
+    else:
+        yield source
+
+
+#PRAGMAs of a profile that do not write to the database file
+READ_ONLY_PRAGMAS = ("mmap_size", "cache_size", "temp_store", "busy_timeout")
+
+
+def connect_readonly(name="main_db.db", profile=DEFAULT_PROFILE, factory=sqlite3.Connection):
+    """
+    Function that opens a read-only connection (URI mode=ro) for reports and other readers
+
+    :param name: Path of an existing database file
+    :param profile: Performance profile whose read-only PRAGMAs (READ_ONLY_PRAGMAS) are applied
+    :param factory: Connection class (e.g. SnapshotConnection)
+    """
+    uri = f"file:{os.path.abspath(name)}?mode=ro"
+    db = sqlite3.connect(uri, uri=True, check_same_thread=False, factory=factory)
+    apply_profile(db, {pragma: value for pragma, value in PROFILES[profile].items() if pragma in READ_ONLY_PRAGMAS})
+    return db
+
+
+class SnapshotConnection(sqlite3.Connection):
+    """A connection to the copy of a Snapshot; its class marks it as possibly stale without a query (see is_snapshot)"""
+    is_snapshot = True
+
+
+#Pages copied per backup step and seconds after which an analytics snapshot is refreshed
+SNAPSHOT_PAGES = 1024
+SNAPSHOT_REFRESH = 300
+
+
+class Snapshot:
+    """
+    A read-only copy of the live database for long analytics queries (see analyze.py and reports.py).
+    The copy is taken with the SQLite backup API in steps of a few pages inside one read transaction:
+    in WAL mode the transaction pins a consistent version of the database without blocking check-ins,
+    so writes during the copy neither restart it nor end up in it. The copy is refreshed once it is
+    older than the refresh interval.
+
+    :param source: str
+        Path of the live database file.
+    :param target: str
+        Path of the snapshot file, or ":memory:" to keep the snapshot in memory.
+        An existing snapshot file is reused until it is older than the refresh interval.
+    :param refresh_interval: float
+        Seconds after which connection() takes a new snapshot (None: only refresh() does).
+    :param pages: int
+        Pages copied per backup step (-1 copies the whole database in one step).
+    :param sleep: float
+        Seconds to pause between two backup steps, so that writers can take the lock.
+    """
+
+    def __init__(self, source="main_db.db", target=":memory:", refresh_interval=SNAPSHOT_REFRESH,
+                 pages=SNAPSHOT_PAGES, sleep=0.005):
+        self.source = source
+        self.target = target
+        self.refresh_interval = refresh_interval
+        self.pages = pages
+        self.sleep = sleep
+        self.taken_at = None
+        self._db = None
+        self._lock = threading.Lock()
+        if target != ":memory:" and os.path.exists(target):
+            self.taken_at = datetime.fromtimestamp(os.path.getmtime(target))
+
+
+    def refresh(self, progress=None):
+        """
+        Method to copy the live database into a new snapshot and switch to it
+
+        :param progress: Optional function called with (status, remaining pages, total pages) after every step
+        :return: Seconds the backup took
+        """
+        with self._lock:
+            started = time.perf_counter()
+            taken_at = datetime.now()
+            source = connect_readonly(self.source)
+            try:
+                source.execute("BEGIN")
+                source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+                if self.target == ":memory:":
+                    snapshot = sqlite3.connect(":memory:", check_same_thread=False, factory=SnapshotConnection)
+                    source.backup(snapshot, pages=self.pages, progress=progress, sleep=self.sleep)
+                else:
+                    #The copy is written next to the snapshot and swapped in, so readers never see a half copy
+                    partial = f"{self.target}.partial"
+                    if os.path.exists(partial):
+                        os.remove(partial)
+                    copy = sqlite3.connect(partial)
+                    try:
+                        source.backup(copy, pages=self.pages, progress=progress, sleep=self.sleep)
+                        #A rollback journal snapshot can be swapped without stale -wal/-shm files
+                        copy.execute("PRAGMA journal_mode = DELETE")
+                    finally:
+                        copy.close()
+                    os.replace(partial, self.target)
+                    snapshot = connect_readonly(self.target, factory=SnapshotConnection)
+            finally:
+                source.rollback()
+                source.close()
+            snapshot.execute("PRAGMA query_only = ON")
+            previous, self._db, self.taken_at = self._db, snapshot, taken_at
+            if previous is not None:
+                previous.close()
+            elapsed = time.perf_counter() - started
+            logging.info(f"Snapshot of '{self.source}' was taken into '{self.target}' in {elapsed:.2f} s.")
+            return elapsed
+
+
+    def age(self):
+        """Method that returns the age of the snapshot in seconds (None if none was taken yet)"""
+        return None if self.taken_at is None else (datetime.now() - self.taken_at).total_seconds()
+
+
+    def is_stale(self):
+        """Method to check whether the snapshot is missing or older than the refresh interval"""
+        return self.taken_at is None or (self.refresh_interval is not None and self.age() > self.refresh_interval)
+
+
+    def connection(self):
+        """Method that returns the read-only snapshot connection, refreshing the snapshot first if it is stale"""
+        if self.is_stale():
+            self.refresh()
+        elif self._db is None:
+            with self._lock:
+                self._db = connect_readonly(self.target, factory=SnapshotConnection)
+                self._db.execute("PRAGMA query_only = ON")
+        return self._db
+
+
+    def cursor(self):
+        """Method that returns a cursor of the snapshot connection (for the analyze.py functions)"""
+        return self.connection().cursor()
+
+
+    def staleness(self):
+        """Method that returns a short report of when the snapshot was taken and how old it is"""
+        if self.taken_at is None:
+            return f"No snapshot of '{self.source}' was taken yet."
+        interval = "" if self.refresh_interval is None else f", refreshed every {self.refresh_interval:g} s"
+        return (f"Data as of {self.taken_at:%Y-%m-%d %H:%M:%S} "
+                f"(snapshot of '{self.source}' is {self.age():.0f} s old{interval}).")
+
+
+    def close(self):
+        """Method to close the snapshot connection"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+            if self.target == ":memory:":
+                self.taken_at = None
+
+
+def is_snapshot(db):
+    """Function to check whether a connection belongs to a Snapshot (its data may be stale)"""
+    return getattr(db, "is_snapshot", False)
+
+
+def is_shard(db):
+    """Function to check whether a connection belongs to a shard (its users are in the directory, see sharding.py)"""
+    return getattr(db, "is_shard", False)
+
+
+def enable_sharding(shards, directory="directory.db", pool_size=5, profile=DEFAULT_PROFILE):
+    """
+    Function to switch get_db to the sharded storage mode (see sharding.py)
+    
+    :param shards: Paths of the shard databases
+    :param directory: Path of the directory database, which becomes the central database of get_db
+    :return: The ShardRouter
+    """
+    global _router
+    from sharding import ShardRouter
+    close_db()
+    _router = ShardRouter(directory, shards, pool_size, profile)
+    logging.info(f"Sharded mode: directory '{directory}', {len(_router.shards)} shards.")
+    return _router
+
+
+def get_router():
+    """Function that returns the ShardRouter in sharded mode, otherwise None"""
+    return _router
+
+
 #The database "main_db.db" will be created
-def get_db(name="main_db.db"):
-    """Function to create and return a database connection"""
+def get_db(name="main_db.db", profile=DEFAULT_PROFILE, user_id=None):
+    """
+    Function to create and return a database connection (checked out from the central pool).
+    In sharded mode the central database is the directory (user profiles), and get_db(user_id=...)
+    checks out a connection of the user's shard (habits and counters) that is returned by close_db.
+    """
     global db_connection
+    if _router is not None:
+        name = _router.directory
     if db_connection is None:
         try:
             if not os.path.exists(name):
                 logging.info(f"Database '{name}' not found. Creating a new one.")
-            db_connection = sqlite3.connect(name)
+            db_connection = get_pool(name, profile=profile).checkout()
             logging.info(f"Database '{name}' connection was successful")
+            logging.info(f"Profile '{profile}' is active: {read_profile(db_connection)}")
+            if _router is not None:
+                _router.init_directory(db_connection)
         except sqlite3.Error as e:
             logging.error(f"The database connection failed: {e}")
             return None
+    if _router is not None and user_id is not None:
+        #A connection of the user's shard, checked out for the caller until close_db
+        try:
+            return _router.checkout(db_connection, user_id)
+        except (sqlite3.Error, KeyError) as e:
+            logging.error(f"The shard connection for user '{user_id}' failed: {e}")
+            return None
     return db_connection
 
 
 def close_db():
-    """Function to close the central database connection if it exists"""
-    global db_connection
+    """Function to drain the write-behind queue and close the central database connection and pool if they exist"""
+    global db_connection, _default_pool
+    disable_write_behind()
+    if _router is not None:
+        _router.close()
     if db_connection is not None:
-        db_connection.close()
+        _default_pool.checkin(db_connection)
         db_connection = None
+    if _default_pool is not None:
+        _default_pool.close()
+        _default_pool = None
         logging.info("The database connection is now closed.")
         
         
@@ -96,8 +723,9 @@ def insert_predef_user_data(db):
     """Function that inserts predefined user data into the database"""
     cur = db.cursor()
     try:
+        from auth import hash_password
         cur.execute("""INSERT OR IGNORE INTO user (user_id, user_name, user_pwd) VALUES (?, ?, ?)""",
-                    ('test0101', 'testuser', 'pwd123!'))
+                    ('test0101', 'testuser', hash_password('pwd123!')))
         db.commit()
         logging.info("Predefined data inserted successfully")
     except sqlite3.Error as e:
@@ -105,6 +733,332 @@ def insert_predef_user_data(db):
         logging.error(f"Failed to insert predefined data: {e}")        
         
 
+#Schema migrations
+#Each migration is a (version, description, function) tuple; the function receives a cursor.
+#Migrations run in ascending order and every applied version is recorded in 'schema_version',
+#so existing databases are upgraded in place on startup.
+def _migration_counter_indexes(cur):
+    """Covering index for the latest counter row of a habit (used by every check-in)"""
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_counter_user_habit_date
+                   ON counter (user_id, habit_name, check_date DESC, habit_streak, habit_rep)""")
+
+
+def _migration_user_name_index(cur):
+    """Index on the user name for the login lookup"""
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_user_name ON user (user_name)")
+
+
+def _migration_habit_state(cur):
+    """Materialized per-habit state, filled from the existing counter history"""
+    cur.execute("""CREATE TABLE IF NOT EXISTS habit_state (
+                    user_id TEXT,
+                    habit_name TEXT,
+                    current_streak INTEGER DEFAULT 0,
+                    longest_streak INTEGER DEFAULT 0,
+                    last_check_date TEXT,
+                    total_reps INTEGER DEFAULT 0,
+                    PRIMARY KEY (user_id, habit_name))
+                """)
+    #Filled with the TEXT dates of this schema version (_fill_habit_state works on day numbers)
+    cur.execute("""
+        INSERT INTO habit_state (user_id, habit_name, current_streak, longest_streak, last_check_date, total_reps)
+        SELECT c.user_id, c.habit_name,
+               (SELECT l.habit_streak FROM counter l
+                WHERE l.user_id IS c.user_id AND l.habit_name = c.habit_name
+                ORDER BY l.check_date DESC LIMIT 1),
+               MAX(c.habit_streak), MAX(c.check_date), COALESCE(SUM(c.habit_rep), 0)
+        FROM counter c
+        GROUP BY c.user_id, c.habit_name
+        """)
+
+
+def _migration_leaderboard_indexes(cur):
+    """Indexes on the streaks of habit_state for the leaderboards (see leaderboard.py)"""
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_habit_state_longest
+                   ON habit_state (longest_streak, user_id, habit_name)""")
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_habit_state_current
+                   ON habit_state (current_streak, user_id, habit_name)""")
+
+
+def _rebuild_with_days(cur, table, create_statement, columns, date_columns):
+    """
+    Function that rebuilds a table with the given CREATE statement and copies its rows,
+    converting each ISO date column into a day number column
+
+    :param cur: Cursor for database operations
+    :param table: Name of the table to rebuild
+    :param create_statement: CREATE TABLE statement of the new table (named '<table>_days')
+    :param columns: Columns that are copied unchanged
+    :param date_columns: Dict of old ISO date column -> new day number column
+    """
+    #Refuse to convert values that are not valid ISO dates instead of silently storing NULL
+    for column in date_columns:
+        cur.execute(f"SELECT COUNT(*) FROM {table} WHERE {column} IS NOT NULL AND date({column}) IS NOT {column}")
+        invalid = cur.fetchone()[0]
+        if invalid:
+            raise sqlite3.IntegrityError(f"{invalid} rows of '{table}' have an invalid {column} (expected YYYY-MM-DD).")
+    cur.execute(create_statement)
+    converted = [SQL_ISO_TO_DAY.format(column=column) for column in date_columns]
+    cur.execute(f"""INSERT INTO {table}_days ({', '.join([*columns, *date_columns.values()])})
+                    SELECT {', '.join([*columns, *converted])} FROM {table}""")
+    cur.execute(f"DROP TABLE {table}")
+    cur.execute(f"ALTER TABLE {table}_days RENAME TO {table}")
+
+
+def _migration_integer_days(cur):
+    """Store all dates as integer day numbers (days since 1970-01-01) instead of ISO TEXT"""
+    _rebuild_with_days(cur, "habits", """CREATE TABLE habits_days (
+                        user_id TEXT,
+                        habit_name TEXT NOT NULL,
+                        habit_def TEXT,
+                        habit_type TEXT,
+                        habit_day INTEGER,
+                        habit_interval TEXT,
+                        is_custom BOOLEAN DEFAULT 1,
+                        PRIMARY KEY (user_id, habit_name),
+                        FOREIGN KEY (user_id) REFERENCES user (user_id))
+                    """, ["user_id", "habit_name", "habit_def", "habit_type", "habit_interval", "is_custom"],
+                       {"habit_date": "habit_day"})
+
+    #The old 'check_time, TEXT,' definition also created an unused column named TEXT, which is not copied
+    _rebuild_with_days(cur, "counter", """CREATE TABLE counter_days (
+                        user_id TEXT,
+                        habit_name TEXT,
+                        check_day INTEGER NOT NULL,
+                        check_time TEXT,
+                        habit_rep INTEGER DEFAULT 0,
+                        habit_streak INTEGER DEFAULT 0,
+                        PRIMARY KEY (user_id, habit_name, check_day),
+                        FOREIGN KEY (user_id) REFERENCES user (user_id),
+                        FOREIGN KEY (habit_name) REFERENCES habits (habit_name))
+                    """, ["user_id", "habit_name", "check_time", "habit_rep", "habit_streak"],
+                       {"check_date": "check_day"})
+    cur.execute("""CREATE INDEX IF NOT EXISTS idx_counter_user_habit_day
+                   ON counter (user_id, habit_name, check_day DESC, habit_streak, habit_rep)""")
+    #Date range queries across all users (export, reports)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_counter_day ON counter (check_day)")
+
+    _rebuild_with_days(cur, "habit_state", """CREATE TABLE habit_state_days (
+                        user_id TEXT,
+                        habit_name TEXT,
+                        current_streak INTEGER DEFAULT 0,
+                        longest_streak INTEGER DEFAULT 0,
+                        last_check_day INTEGER,
+                        total_reps INTEGER DEFAULT 0,
+                        PRIMARY KEY (user_id, habit_name))
+                    """, ["user_id", "habit_name", "current_streak", "longest_streak", "total_reps"],
+                       {"last_check_date": "last_check_day"})
+    _migration_leaderboard_indexes(cur)
+
+
+def _migration_sessions(cur):
+    """Table of the session tokens (see auth.py), stored as SHA-256 hashes"""
+    cur.execute("""CREATE TABLE IF NOT EXISTS sessions (
+                    token_hash TEXT PRIMARY KEY,
+                    user_id TEXT NOT NULL,
+                    created_at INTEGER NOT NULL,
+                    expires_at INTEGER NOT NULL)
+                """)
+    #Revoking the sessions of a user and purging expired sessions
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sessions_expires ON sessions (expires_at)")
+
+
+def _migration_streak_breaks(cur):
+    """Table of the streaks that detect_streak_breaks found broken, one row per streak"""
+    cur.execute("""CREATE TABLE IF NOT EXISTS streak_breaks (
+                    user_id TEXT,
+                    habit_name TEXT NOT NULL,
+                    last_check_day INTEGER NOT NULL,
+                    broken_streak INTEGER NOT NULL,
+                    detected_day INTEGER NOT NULL,
+                    PRIMARY KEY (user_id, habit_name, last_check_day))
+                """)
+    #Breaks found by one run (reports, cleanup)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_streak_breaks_detected ON streak_breaks (detected_day)")
+
+
+MIGRATIONS = [
+    (1, "Covering index on counter (user_id, habit_name, check_date DESC)", _migration_counter_indexes),
+    (2, "Index on user.user_name", _migration_user_name_index),
+    (3, "Materialized habit_state table", _migration_habit_state),
+    (4, "Streak indexes on habit_state for leaderboards", _migration_leaderboard_indexes),
+    (5, "Integer day numbers instead of ISO TEXT dates", _migration_integer_days),
+    (6, "Sessions table for token authentication", _migration_sessions),
+    (7, "Streak breaks recorded by the nightly streak job", _migration_streak_breaks),
+]
+
+
+def get_schema_version(cur):
+    """Function that returns the highest applied migration version (0 for an unversioned database)"""
+    cur.execute("""CREATE TABLE IF NOT EXISTS schema_version (
+                    version INTEGER PRIMARY KEY,
+                    description TEXT,
+                    applied_at TEXT)
+                """)
+    cur.execute("SELECT MAX(version) FROM schema_version")
+    version = cur.fetchone()[0]
+    return version or 0
+
+
+def migrate_db(db):
+    """
+    Function that applies all pending migrations, each one in its own transaction
+    
+    :param db: Database connection object
+    :return: The schema version after migrating
+    """
+    cur = db.cursor()
+    current_version = get_schema_version(cur)
+    db.commit()
+    for version, description, migration in MIGRATIONS:
+        if version <= current_version:
+            continue
+        try:
+            cur.execute("BEGIN")
+            migration(cur)
+            cur.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?)",
+                        (version, description, datetime.now().strftime('%Y-%m-%d %H:%M:%S')))
+            db.commit()
+            current_version = version
+            logging.info(f"Applied migration {version}: {description}")
+        except sqlite3.Error as e:
+            db.rollback()
+            logging.error(f"Migration {version} failed: {e}")
+            raise
+    return current_version
+
+
+#The habit_state table holds one row per habit with its current streak, longest streak,
+#last check day and total repetitions. add_counter and reset_streak keep it up to date,
+#rebuild_habit_state regenerates it from the counter history.
+def _fill_habit_state(cur):
+    """Function that (re)derives all habit_state rows from the counter table"""
+    cur.execute("DELETE FROM habit_state")
+    cur.execute("""
+        INSERT INTO habit_state (user_id, habit_name, current_streak, longest_streak, last_check_day, total_reps)
+        SELECT c.user_id, c.habit_name,
+               (SELECT l.habit_streak FROM counter l
+                WHERE l.user_id IS c.user_id AND l.habit_name = c.habit_name
+                ORDER BY l.check_day DESC LIMIT 1),
+               MAX(c.habit_streak), MAX(c.check_day), COALESCE(SUM(c.habit_rep), 0)
+        FROM counter c
+        GROUP BY c.user_id, c.habit_name
+        """)
+
+
+def rebuild_habit_state(db):
+    """
+    Function to regenerate the habit_state table from the counter table
+    
+    :param db: Database connection object
+    :return: The number of habit_state rows written
+    """
+    cur = db.cursor()
+    try:
+        cur.execute("BEGIN")
+        _fill_habit_state(cur)
+        cur.execute("SELECT COUNT(*) FROM habit_state")
+        rows = cur.fetchone()[0]
+        db.commit()
+        logging.info(f"The habit state was rebuilt for {rows} habits.")
+        return rows
+    except sqlite3.Error as e:
+        db.rollback()
+        logging.error(f"An error occurred while rebuilding the habit state: {e}")
+        return 0
+
+
+#A streak is broken once the next check-in can no longer continue it (see counter_manager.next_streak):
+#a Daily habit needs a check-in on the following day, a Weekly habit one within 7 days.
+#Habits that no longer exist have no interval and are left alone.
+STREAK_GAPS = {"Daily": 1, "Weekly": 7}
+
+
+def _break_streaks(cur, as_of):
+    """
+    Function that records and resets all streaks that are broken on a day, with set-based statements
+
+    :param cur: Cursor inside a write transaction
+    :param as_of: Day number of the day the streaks are checked on
+    :return: (number of broken streaks, number of newly recorded breaks)
+    """
+    gaps = " ".join(f"WHEN '{interval}' THEN {gap}" for interval, gap in STREAK_GAPS.items())
+    cur.execute("DROP TABLE IF EXISTS temp.broken_streaks")
+    #Custom habits take precedence over predefined habits of the same name, as in check_in_many;
+    #the range condition on last_check_day skips all streaks that were continued yesterday
+    cur.execute(f"""
+        CREATE TEMP TABLE broken_streaks AS
+        WITH predefined AS (
+            SELECT habit_name, MIN(habit_interval) AS habit_interval FROM habits
+            WHERE is_custom = 0 GROUP BY habit_name
+        )
+        SELECT s.user_id, s.habit_name, s.last_check_day, s.current_streak
+        FROM habit_state s
+        LEFT JOIN habits h ON h.user_id = s.user_id AND h.habit_name = s.habit_name AND h.is_custom = 1
+        LEFT JOIN predefined p ON p.habit_name = s.habit_name
+        WHERE s.current_streak > 0 AND s.last_check_day < :as_of - {min(STREAK_GAPS.values())}
+          AND :as_of - s.last_check_day > CASE COALESCE(h.habit_interval, p.habit_interval) {gaps} END
+        """, {"as_of": as_of})
+    broken = cur.execute("SELECT COUNT(*) FROM temp.broken_streaks").fetchone()[0]
+    recorded = cur.execute(
+        """INSERT OR IGNORE INTO streak_breaks (user_id, habit_name, last_check_day, broken_streak, detected_day)
+        SELECT user_id, habit_name, last_check_day, current_streak, ? FROM temp.broken_streaks""",
+        (as_of,)
+    ).rowcount
+    cur.execute("""UPDATE habit_state SET current_streak = 0
+                   FROM temp.broken_streaks b
+                   WHERE habit_state.user_id = b.user_id AND habit_state.habit_name = b.habit_name""")
+    cur.execute("DROP TABLE temp.broken_streaks")
+    return broken, recorded
+
+
+def detect_streak_breaks(db, as_of=None):
+    """
+    Function that finds the broken Daily and Weekly streaks of all users, records them in streak_breaks
+    and resets their current streak in habit_state. Streaks that were already reset are not checked
+    again, so the job can be repeated (e.g. nightly by cron) without changing the result.
+    The counter history is left as it is, so a rebuild_habit_state restores the current streaks
+    from it; the next run resets them again without recording the breaks twice.
+
+    :param db: Database connection object
+    :param as_of: Date or day number the streaks are checked on (default: today)
+    :return: Dict with the numbers of active, broken and newly recorded streaks and the duration
+    """
+    as_of = today() if as_of is None else to_day(as_of)
+    started = time.perf_counter()
+    cur = db.cursor()
+    try:
+        #Take the write lock first, so that no check-in changes a streak between detection and reset
+        cur.execute("BEGIN IMMEDIATE")
+        active = cur.execute("SELECT COUNT(*) FROM habit_state WHERE current_streak > 0").fetchone()[0]
+        broken, recorded = _break_streaks(cur, as_of)
+        db.commit()
+    except sqlite3.Error as e:
+        db.rollback()
+        logging.error(f"An error occurred while detecting streak breaks: {e}")
+        return None
+    report = {"as_of": format_day(as_of), "active": active, "broken": broken, "recorded": recorded,
+              "seconds": round(time.perf_counter() - started, 3)}
+    logging.info(f"{broken} of {active} active streaks were broken on {report['as_of']} "
+                 f"({recorded} newly recorded, {report['seconds']} s).")
+    return report
+
+
+#Statement that folds a single counter row into habit_state, used in add_counter
+UPSERT_HABIT_STATE = """
+    INSERT INTO habit_state (user_id, habit_name, current_streak, longest_streak, last_check_day, total_reps)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ON CONFLICT (user_id, habit_name) DO UPDATE SET
+        current_streak = CASE WHEN excluded.last_check_day >= habit_state.last_check_day
+                              OR habit_state.last_check_day IS NULL
+                         THEN excluded.current_streak ELSE habit_state.current_streak END,
+        longest_streak = MAX(habit_state.longest_streak, excluded.longest_streak),
+        last_check_day = COALESCE(MAX(habit_state.last_check_day, excluded.last_check_day), excluded.last_check_day),
+        total_reps = habit_state.total_reps + excluded.total_reps
+    """
+
+
 #Function to initialize the database by calling create_tables() and insert_predef_user_data()
 def initialize_db(cur, db):
     """
@@ -115,8 +1069,11 @@ def initialize_db(cur, db):
         #Create tables
         create_tables(cur, db)
 
+        #Bring the schema to the latest version
+        migrate_db(db)
+
         #Insert predefined user data
-        insert_predef_user_data(cur, db)
+        insert_predef_user_data(db)
 
         #Insert predefined habits
         from habit_manager import create_predef_habits
@@ -130,7 +1087,7 @@ def initialize_db(cur, db):
         
         
 #Function to increment the counter data, used in counter_manager.py
-def add_counter(db, user_id, habit_name, check_date, check_time, habit_rep, habit_streak):
+def add_counter(db, user_id, habit_name, check_day, check_time, habit_rep, habit_streak):
     """
     Function to to add or update a counter record for a specific habit
     
@@ -138,29 +1095,337 @@ def add_counter(db, user_id, habit_name, check_date, check_time, habit_rep, habi
     :param db: Database connection object
     :param user_id: ID of the user
     :param habit_name: Name of the habit
-    :param check_date: Date of the check (format: YYYY-MM-DD)
+    :param check_day: Day number of the check (see dates.py)
     :param check_time: Time of the check (format: HH:MM:SS)
     :param habit_rep: Number of repetitions
     :param habit_streak: Current streak value
+    :return: True once the row is committed, False if the habit was already checked on that day and
+        None if the insert failed; in write-behind mode (see enable_write_behind), if db is a connection
+        to the queue's database, a Future that resolves to True or False (or raises the error)
     """
+    if _write_behind is not None and _write_behind.writes_to(db):
+        return _write_behind.submit(user_id, habit_name, check_day, check_time, habit_rep, habit_streak)
     try:
         cur = db.cursor()
         
         #Check if a record for the current date already exists
-        cur.execute("""SELECT 1 FROM counter WHERE user_id = ? AND habit_name = ? AND check_date = ?""",
-                    (user_id, habit_name, check_date))
+        cur.execute("""SELECT 1 FROM counter WHERE user_id = ? AND habit_name = ? AND check_day = ?""",
+                    (user_id, habit_name, check_day))
         if cur.fetchone():
             logging.warning("There exists already an entry for this habit and date.")
-            return
+            return False
         
         #Insert new data
         cur.execute("""
-            INSERT INTO counter (user_id, habit_name, check_date, check_time, habit_rep, habit_streak) 
+            INSERT INTO counter (user_id, habit_name, check_day, check_time, habit_rep, habit_streak) 
             VALUES (?, ?, ?, ?, ?, ?)
-            """, (user_id, habit_name, check_date, check_time, habit_rep, habit_streak))
+            """, (user_id, habit_name, check_day, check_time, habit_rep, habit_streak))
+        
+        #Update the materialized habit state in the same transaction
+        cur.execute(UPSERT_HABIT_STATE,
+                    (user_id, habit_name, habit_streak, habit_streak, check_day, habit_rep))
         db.commit()
         logging.info("Counter data was successfully inserted.")
+        return True
     
     except sqlite3.Error as e:
         db.rollback()
-        logging.error(f"An error occurred while inserting counter data: {e}")
\ No newline at end of file
+        logging.error(f"An error occurred while inserting counter data: {e}")
+
+
+#Write-behind mode of add_counter: rows per group commit and seconds the first queued row may wait
+WRITE_BEHIND_BATCH = 500
+WRITE_BEHIND_DELAY = 0.05
+
+
+def database_file(db):
+    """Function that returns the real path of the database file of a connection or pool ('' for in-memory databases)"""
+    if isinstance(db, ConnectionPool):
+        name = db.name
+    else:
+        name = db.execute("PRAGMA database_list").fetchone()[2]
+    return os.path.realpath(name) if name and name != ":memory:" else ""
+
+
+class WriteBehindQueue:
+    """
+    An in-memory queue of counter rows and check-in records that a background writer thread commits
+    in groups. A group is committed once it has batch_size entries or its first entry waited max_delay
+    seconds, so many check-ins share one transaction (and one fsync). Every submitted entry gets a
+    Future that resolves when it is durable. Entries are only visible to readers after their commit.
+    If a group fails, its entries are committed one by one, so only the failing entry gets the error.
+
+    :param name: str
+        Path of the database file.
+    :param batch_size: int
+        Maximum number of rows per group commit.
+    :param max_delay: float
+        Maximum seconds between queuing a row and the start of its group commit.
+    :param profile: str
+        Performance profile of the writer connection (see PROFILES).
+    """
+
+    def __init__(self, name="main_db.db", batch_size=WRITE_BEHIND_BATCH, max_delay=WRITE_BEHIND_DELAY,
+                 profile=DEFAULT_PROFILE):
+        self.name = name
+        self.path = os.path.realpath(name)
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._pool = ConnectionPool(name, 1, profile=profile)
+        self._queue = queue.Queue()
+        self._closed = False
+        self._lock = threading.Lock()
+        self._last = None
+        self.commits = 0
+        self.rows = 0
+        self._writer = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._writer.start()
+
+
+    def writes_to(self, db):
+        """Method that checks whether a connection (or pool) uses the database file of the queue"""
+        return database_file(db) == self.path
+
+
+    def _put(self, kind, entry):
+        """Method to queue an entry ('row' or 'check_in') and return the Future of its commit"""
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise sqlite3.ProgrammingError("The write-behind queue is closed.")
+            self._queue.put((kind, entry, future))
+            self._last = future
+        return future
+
+
+    def submit(self, user_id, habit_name, check_day, check_time, habit_rep, habit_streak):
+        """Method to queue a counter row and return the Future of its commit (True, or False for a duplicate)"""
+        return self._put("row", (user_id, habit_name, check_day, check_time, habit_rep, habit_streak))
+
+
+    def submit_check_in(self, record):
+        """Method to queue a check-in record (see counter_manager.check_in_many) and return the Future of its outcome"""
+        return self._put("check_in", record)
+
+
+    def check_in_many(self, records):
+        """Method that queues check-in records, waits for their group commits and returns their outcomes"""
+        futures = [self.submit_check_in(record) for record in records]
+        return [future.result() for future in futures]
+
+
+    def flush(self, timeout=None):
+        """Method that waits until every entry queued so far is committed (or failed)"""
+        with self._lock:
+            last = self._last
+        if last is not None:
+            wait([last], timeout)
+
+
+    def _next_batch(self):
+        """Method that waits for the first row and collects further rows until the batch is full or due"""
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                #Put the stop marker back, so the loop ends after this batch
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+
+    def _write(self, db, batch):
+        """Method that commits a batch in runs of the same kind, in queue order"""
+        start = 0
+        while start < len(batch):
+            end = start
+            while end < len(batch) and batch[end][0] == batch[start][0]:
+                end += 1
+            run = [(entry, future) for kind, entry, future in batch[start:end]]
+            if batch[start][0] == "row":
+                self._write_rows(db, run)
+            else:
+                self._write_check_ins(db, run)
+            start = end
+
+
+    def _write_rows(self, db, batch):
+        """Method that commits counter rows in one transaction and resolves their futures"""
+        cur = db.cursor()
+        inserted = []
+        try:
+            cur.execute("BEGIN")
+            for row, future in batch:
+                cur.execute("""
+                    INSERT INTO counter (user_id, habit_name, check_day, check_time, habit_rep, habit_streak)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (user_id, habit_name, check_day) DO NOTHING
+                    """, row)
+                inserted.append(cur.rowcount == 1)
+                if cur.rowcount == 1:
+                    user_id, habit_name, check_day, check_time, habit_rep, habit_streak = row
+                    cur.execute(UPSERT_HABIT_STATE,
+                                (user_id, habit_name, habit_streak, habit_streak, check_day, habit_rep))
+            db.commit()
+        except sqlite3.Error as e:
+            db.rollback()
+            if len(batch) > 1:
+                #Retry the group row by row, so that only the failing row gets the error
+                for entry in batch:
+                    self._write_rows(db, [entry])
+                return
+            logging.error(f"A counter row could not be written: {e}")
+            batch[0][1].set_exception(e)
+            return
+        self.commits += 1
+        self.rows += len(batch)
+        for (row, future), was_inserted in zip(batch, inserted):
+            future.set_result(was_inserted)
+
+
+    def _write_check_ins(self, db, batch):
+        """Method that commits check-in records with one check_in_many call and resolves their futures"""
+        from counter_manager import check_in_many
+        try:
+            outcomes = check_in_many(db, [record for record, future in batch])
+        except Exception as e:
+            if len(batch) > 1:
+                for entry in batch:
+                    self._write_check_ins(db, [entry])
+                return
+            batch[0][1].set_exception(e)
+            return
+        self.commits += 1
+        self.rows += len(batch)
+        for (record, future), outcome in zip(batch, outcomes):
+            future.set_result(outcome)
+
+
+    @staticmethod
+    def _fail(futures, error):
+        """Method to resolve the futures that are still pending with an error"""
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+
+
+    def _run(self):
+        """Method of the writer thread: commits batches until the stop marker of close() arrives"""
+        try:
+            with self._pool.connection() as db:
+                while True:
+                    batch = self._next_batch()
+                    if batch is None:
+                        break
+                    try:
+                        self._write(db, batch)
+                    except Exception as e:
+                        #An unexpected error fails this batch only; the thread keeps running
+                        logging.error(f"A group commit of {len(batch)} entries failed: {e!r}")
+                        if db.in_transaction:
+                            db.rollback()
+                        self._fail([future for kind, entry, future in batch], e)
+        except Exception as e:
+            #Without a writer connection nothing can be committed: fail every queued entry
+            logging.error(f"The write-behind writer stopped: {e!r}")
+            with self._lock:
+                self._closed = True
+            pending = []
+            while not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is not None:
+                    pending.append(item[2])
+            self._fail(pending, e)
+        finally:
+            self._pool.close()
+
+
+    def close(self):
+        """Method to stop accepting rows, commit all queued rows and stop the writer thread"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._writer.join()
+        logging.info(f"Write-behind queue drained: {self.rows} rows in {self.commits} group commits.")
+
+
+#Write-behind queue of add_counter (see enable_write_behind)
+_write_behind = None
+
+
+def enable_write_behind(name="main_db.db", batch_size=WRITE_BEHIND_BATCH, max_delay=WRITE_BEHIND_DELAY,
+                        profile=DEFAULT_PROFILE):
+    """
+    Function to switch add_counter and CounterService.check_in_many to write-behind mode: their writes
+    to the database 'name' are queued and committed in groups by a background thread. add_counter returns
+    a Future instead of committing itself; check_in_many waits for the group commits of its records.
+    Writes to other databases are not queued. close_db (or disable_write_behind) commits the queued rows
+    before it returns.
+
+    :param name: Path of the database file the queued rows are written to
+    :param batch_size: Maximum number of rows per group commit
+    :param max_delay: Maximum seconds a queued row waits for its group commit
+    :return: The WriteBehindQueue
+    """
+    global _write_behind
+    if _router is not None:
+        raise ValueError("Write-behind mode writes to a single database and cannot be combined with sharding.")
+    disable_write_behind()
+    _write_behind = WriteBehindQueue(name, batch_size, max_delay, profile)
+    return _write_behind
+
+
+def get_write_behind():
+    """Function that returns the WriteBehindQueue in write-behind mode, otherwise None"""
+    return _write_behind
+
+
+def disable_write_behind():
+    """Function to drain the write-behind queue and switch add_counter back to one commit per row"""
+    global _write_behind
+    if _write_behind is not None:
+        _write_behind, queue_to_close = None, _write_behind
+        queue_to_close.close()
+
+
+#Sharded mode from the environment, e.g. HABIT_TRACKER_SHARDS=shard0.db,shard1.db
+if os.environ.get("HABIT_TRACKER_SHARDS"):
+    enable_sharding(os.environ["HABIT_TRACKER_SHARDS"].split(","),
+                    os.environ.get("HABIT_TRACKER_DIRECTORY", "directory.db"))
+
+#Maintenance commands, e.g. "python db.py rebuild-state"
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Habit tracker database maintenance")
+    parser.add_argument("command", choices=["migrate", "rebuild-state", "streak-breaks"])
+    parser.add_argument("--db", default="main_db.db", help="Path of the database file")
+    parser.add_argument("--as-of", help="Day the streaks are checked on (YYYY-MM-DD, default today)")
+    args = parser.parse_args()
+
+    db = get_db(args.db)
+    if db is not None:
+        if args.command == "migrate":
+            print(f"Schema version: {migrate_db(db)}")
+        elif args.command == "rebuild-state":
+            migrate_db(db)
+            print(f"The habit state was rebuilt for {rebuild_habit_state(db)} habits.")
+        elif args.command == "streak-breaks":
+            #Nightly, e.g. with the crontab line: 5 0 * * * python db.py streak-breaks --db main_db.db
+            migrate_db(db)
+            report = detect_streak_breaks(db, args.as_of)
+            if report is not None:
+                print(f"{report['broken']} of {report['active']} active streaks were broken on {report['as_of']} "
+                      f"({report['recorded']} newly recorded) in {report['seconds']} s.")
+        close_db()
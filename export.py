@@ -0,0 +1,171 @@
+"""
+    This file contains the streaming export of the habit tracker data.
+    Rows of the counter and habits tables are read in batches with fetchmany() and passed
+    through generators to CSV, JSON Lines or (if pyarrow is installed) Parquet writers,
+    so the memory use stays constant no matter how many rows are exported.
+    The rows can be filtered by user, habit and date range.
+    Dates are stored as day numbers and written as YYYY-MM-DD (see dates.py).
+    Usage: python export.py counter history.csv --user test0101 --from 2024-01-01 --to 2024-12-31
+"""
+
+import argparse
+import csv
+import json
+import os
+import sqlite3
+import sys
+import time
+from dates import to_day, SQL_DAY_TO_ISO
+from db import get_db, close_db, migrate_db
+
+#Rows per fetchmany() call
+EXPORT_BATCH_SIZE = 5000
+
+#Exported columns and the day column used for the date range filter
+EXPORT_TABLES = {
+    "counter": (["user_id", "habit_name", "check_date", "check_time", "habit_rep", "habit_streak"], "check_day"),
+    "habits": (["user_id", "habit_name", "habit_def", "habit_type", "habit_date", "habit_interval", "is_custom"], "habit_day"),
+}
+
+#Exported date columns that are formatted from a day number column
+EXPORT_DATES = {"check_date": "check_day", "habit_date": "habit_day"}
+
+#Arrow type of every exported column, following the table definitions (dates are exported as YYYY-MM-DD)
+EXPORT_TYPES = {
+    "user_id": "string", "habit_name": "string", "check_date": "string", "check_time": "string",
+    "habit_rep": "int64", "habit_streak": "int64", "habit_def": "string", "habit_type": "string",
+    "habit_date": "string", "habit_interval": "string", "is_custom": "int64",
+}
+
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+
+
+def iter_batches(db, table, user_id=None, habit_name=None, date_from=None, date_to=None, batch_size=EXPORT_BATCH_SIZE):
+    """
+    Generator that yields the rows of a table in batches (lists of tuples)
+
+    :param db: Database connection object
+    :param table: 'counter' or 'habits'
+    :param user_id: Only export rows of this user
+    :param habit_name: Only export rows of this habit
+    :param date_from: First date to export (YYYY-MM-DD, inclusive)
+    :param date_to: Last date to export (YYYY-MM-DD, inclusive)
+    :param batch_size: Number of rows fetched at once
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown table '{table}'. Choose one of: {', '.join(EXPORT_TABLES)}.")
+    columns, day_column = EXPORT_TABLES[table]
+    conditions, params = [], []
+    for column, value, operator in (("user_id", user_id, "="), ("habit_name", habit_name, "="),
+                                    (day_column, to_day(date_from), ">="), (day_column, to_day(date_to), "<=")):
+        if value is not None:
+            conditions.append(f"{column} {operator} ?")
+            params.append(value)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    #The order follows the primary key and the counter index, so SQLite does not need to sort
+    order = "user_id, habit_name, check_day" if table == "counter" else "user_id, habit_name"
+    selected = [f"{SQL_DAY_TO_ISO.format(column=EXPORT_DATES[column])} AS {column}" if column in EXPORT_DATES else column
+                for column in columns]
+    cur = db.cursor()
+    cur.execute(f"SELECT {', '.join(selected)} FROM {table} {where} ORDER BY {order}", params)
+    try:
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cur.close()
+
+
+def write_csv(batches, columns, path):
+    """Function that writes batches of rows to a CSV file with a header and returns the number of rows"""
+    count = 0
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+
+def write_jsonl(batches, columns, path):
+    """Function that writes batches of rows to a JSON Lines file (one object per row) and returns the number of rows"""
+    count = 0
+    with open(path, "w") as jsonl_file:
+        for rows in batches:
+            jsonl_file.writelines(json.dumps(dict(zip(columns, row))) + "\n" for row in rows)
+            count += len(rows)
+    return count
+
+
+def write_parquet(batches, columns, path):
+    """Function that writes batches of rows to a Parquet file (one row group per batch) and returns the number of rows"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("The Parquet export needs the optional 'pyarrow' package (pip install pyarrow).")
+    #The schema comes from the column types, not from the first batch, in which a column may be all NULL
+    schema = pa.schema([(column, pa.type_for_alias(EXPORT_TYPES[column])) for column in columns])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in batches:
+            writer.write_table(pa.Table.from_pylist([dict(zip(columns, row)) for row in rows], schema=schema))
+            count += len(rows)
+    return count
+
+
+WRITERS = {"csv": write_csv, "jsonl": write_jsonl, "parquet": write_parquet}
+
+
+def export_table(db, table, path, export_format=None, **filters):
+    """
+    Function that streams a (filtered) table into a file
+
+    :param db: Database connection object
+    :param table: 'counter' or 'habits'
+    :param path: Path of the output file
+    :param export_format: 'csv', 'jsonl' or 'parquet' (default: derived from the file extension)
+    :param filters: user_id, habit_name, date_from, date_to and batch_size (see iter_batches)
+    :return: Tuple of (exported rows, seconds, rows per second)
+    """
+    export_format = export_format or os.path.splitext(path)[1].lstrip(".").lower()
+    if export_format not in WRITERS:
+        raise ValueError(f"Unknown export format '{export_format}'. Choose one of: {', '.join(EXPORT_FORMATS)}.")
+    started = time.perf_counter()
+    rows = WRITERS[export_format](iter_batches(db, table, **filters), EXPORT_TABLES[table][0], path)
+    seconds = time.perf_counter() - started
+    return rows, seconds, rows / seconds if seconds else 0.0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export habit tracker data")
+    parser.add_argument("table", choices=sorted(EXPORT_TABLES))
+    parser.add_argument("output", help="Output file (.csv, .jsonl or .parquet)")
+    parser.add_argument("--format", choices=EXPORT_FORMATS, help="Output format (default: file extension)")
+    parser.add_argument("--db", default="main_db.db", help="Path of the database file")
+    parser.add_argument("--user", help="Only export rows of this user ID")
+    parser.add_argument("--habit", help="Only export rows of this habit")
+    parser.add_argument("--from", dest="date_from", help="First date (YYYY-MM-DD)")
+    parser.add_argument("--to", dest="date_to", help="Last date (YYYY-MM-DD)")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    db = get_db(args.db)
+    if db is None:
+        sys.exit(1)
+    try:
+        #Older databases are brought to the current schema (day numbers, habit_state) first
+        migrate_db(db)
+        rows, seconds, rate = export_table(db, args.table, args.output, args.format, user_id=args.user,
+                                           habit_name=args.habit, date_from=args.date_from,
+                                           date_to=args.date_to, batch_size=args.batch_size)
+        print(f"Exported {rows} rows to '{args.output}' in {seconds:.2f} s ({rate:,.0f} rows/s).")
+    except (sqlite3.Error, ValueError, ImportError, OSError) as e:
+        print(f"An error occurred during the export: {e}")
+        sys.exit(1)
+    finally:
+        close_db()
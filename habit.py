@@ -5,30 +5,32 @@
     For this purpose, functions from "habit_manager.py" are called.
 """
 
+from datetime import datetime
+from db import connection_scope
 from habit_manager import create_predef_habits, create_custom_habits, delete_custom_habit, edit_custom_habit
 
 class Habit:
     def __init__(self, db_connection, user_id, habit_name: str, habit_def: str, habit_type: str, 
                  habit_date: datetime, habit_interval: str):
     
-    """ 
-    A class that represents a habit that will be tracked.
+        """ 
+        A class that represents a habit that will be tracked.
     
-    :param db_connection: sqlite3.Connection 
-        The database connection object used to interact with the database.
-    :param user_id: str
-        A unique identification of the user.
-    :param habit_name: str
-        The name of the habit being tracked.
-    :param habit_def: str
-        A detailed description of the habit.
-    :param habit_type: str
-        The category of the habit (e.g., relaxing, cognitive, physical).
-    :param habit_date: datetime
-        The date when the habit was created.
-    :param habit_interval: str
-        The practice interval of the habit (daily or weekly).
-    """   
+        :param db_connection: sqlite3.Connection or db.ConnectionPool
+            The database connection (or pool of connections) used to interact with the database.
+        :param user_id: str
+            A unique identification of the user.
+        :param habit_name: str
+            The name of the habit being tracked.
+        :param habit_def: str
+            A detailed description of the habit.
+        :param habit_type: str
+            The category of the habit (e.g., relaxing, cognitive, physical).
+        :param habit_date: datetime
+            The date when the habit was created.
+        :param habit_interval: str
+            The practice interval of the habit (daily or weekly).
+        """   
         
         self.habit_name = habit_name
         self.habit_def = habit_def
@@ -36,26 +38,29 @@ class Habit:
         self.habit_date = habit_date
         self.habit_interval = habit_interval
         self.user_id = user_id
-        #Database connection
+        #Database connection or connection pool
         self.db = db_connection
-        self.cur = self.db.cursor()
 
     
     def create_predef_habits(self):
         """Method to insert predefined habits into database"""
-        create_predef_habits(self.cur, self.db)
+        with connection_scope(self.db) as db:
+            create_predef_habits(db.cursor(), db)
 
         
     def create_custom_habits(self):
         """Method for creating custom habits"""
-        create_custom_habits(self.cur, self.db, self.user_id)
+        with connection_scope(self.db) as db:
+            create_custom_habits(db.cursor(), db, self.user_id)
 
         
     def delete_habit(self, habit_name):
         """Method for deleting custom habits"""
-        delete_custom_habit(self.cur, self.db, self.user_id, habit_name)
+        with connection_scope(self.db) as db:
+            delete_custom_habit(db.cursor(), db, self.user_id)
 
         
     def edit_habit(self, habit_name):
         """Method for editing custom habits"""
-        edit_custom_habit(self.cur, self.db, self.user_id, habit_name)
\ No newline at end of file
+        with connection_scope(self.db) as db:
+            edit_custom_habit(db.cursor(), db, self.user_id)
\ No newline at end of file
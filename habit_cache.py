@@ -0,0 +1,113 @@
+"""
+    This file contains the per-user habit catalog cache.
+    The habits of a user rarely change within a session, but they are needed for every check,
+    streak reset and habit view. The cache keeps the catalog (habit name -> HabitRecord with interval,
+    type and custom flag) of the most recently used users in memory, bounded by an LRU limit.
+    Catalogs are keyed by database file and user ID, so services of different databases never see
+    each other's habits.
+    The HabitService writes through it: creating, deleting or editing a habit invalidates the
+    catalog of that user, changes of the predefined habits clear the whole cache. Edits made by
+    another process (e.g. the CLI while the server runs) are seen once the cached catalog is older
+    than the TTL.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+#Default number of users whose catalogs are kept
+HABIT_CACHE_SIZE = 1024
+
+#Seconds a cached catalog is trusted before it is read from the database again
+HABIT_CACHE_TTL = 30
+
+
+class HabitCache:
+    def __init__(self, max_users=HABIT_CACHE_SIZE, ttl=HABIT_CACHE_TTL):
+
+        """
+        A thread-safe LRU cache of habit catalogs keyed by (database file, user ID).
+
+        :param max_users: int
+            Maximum number of user catalogs; the least recently used one is evicted first.
+        :param ttl: float
+            Seconds a cached catalog is trusted before it is read from the database again.
+        """
+
+        self.max_users = max_users
+        self.ttl = ttl
+        self._catalogs = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+
+    def get(self, database, user_id, now=None):
+        """Method that returns the cached catalog (dict of habit name -> HabitRecord) of a user, or None"""
+        now = time.time() if now is None else now
+        key = (database, user_id)
+        with self._lock:
+            entry = self._catalogs.get(key)
+            if entry is not None and now >= entry[1]:
+                del self._catalogs[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._catalogs.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+
+    def put(self, database, user_id, catalog, now=None):
+        """Method to store the catalog of a user, evicting the least recently used catalogs if needed"""
+        now = time.time() if now is None else now
+        key = (database, user_id)
+        with self._lock:
+            self._catalogs[key] = (catalog, now + self.ttl)
+            self._catalogs.move_to_end(key)
+            while len(self._catalogs) > self.max_users:
+                self._catalogs.popitem(last=False)
+                self.evictions += 1
+
+
+    def invalidate(self, user_id=None, database=None):
+        """
+        Method to drop cached catalogs: of one user in one database, of one user in every database,
+        of every user of one database, or (without arguments) all of them
+        """
+        with self._lock:
+            if user_id is None and database is None:
+                self._catalogs.clear()
+            elif user_id is not None and database is not None:
+                self._catalogs.pop((database, user_id), None)
+            else:
+                for key in [key for key in self._catalogs
+                            if (user_id is None or key[1] == user_id) and (database is None or key[0] == database)]:
+                    del self._catalogs[key]
+            self.invalidations += 1
+
+
+    def stats(self):
+        """Method that returns the hit-rate statistics of the cache"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._catalogs),
+                "max_users": self.max_users,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }
+
+
+#Central cache used by the HabitService
+habit_cache = HabitCache()
@@ -7,9 +7,9 @@
 """
 
 import sqlite3
-import pandas as pd
-from datetime import datetime
-from analyze import show_custom_habits
+from dates import to_day
+from habit_cache import habit_cache
+from services import HabitService
 
 #Functions to create habits
 def create_predef_habits(cur, db):
@@ -23,11 +23,14 @@ def create_predef_habits(cur, db):
         ('Jogging', 'It is the act of gentle running.', 'Physical', '2024-05-15', 'Weekly', 0)
     ]
     try:
-        for habit in predef_habits:
+        for habit_name, habit_def, habit_type, habit_date, habit_interval, is_custom in predef_habits:
             cur.execute(
-                "INSERT INTO habits (habit_name, habit_def, habit_type, habit_date, habit_interval, is_custom) VALUES (?, ?, ?, ?, ?, ?)", habit
+                "INSERT INTO habits (habit_name, habit_def, habit_type, habit_day, habit_interval, is_custom) VALUES (?, ?, ?, ?, ?, ?)",
+                (habit_name, habit_def, habit_type, to_day(habit_date), habit_interval, is_custom)
             )
         db.commit()
+        #The predefined habits are part of every user's cached catalog
+        habit_cache.invalidate()
         print("Predefined habits have been successfully inserted.")
     except sqlite3.Error as e:
         db.rollback()
@@ -39,100 +42,70 @@ def create_custom_habits(cur, db, user_id):
     print("In this menu, you can create your own custom habits.")
     print("Please answer the following questions:")
 
-    try:
-        habit_name = input("\nWhat is the name of the habit you want to create?\n")
-        habit_def = input("\nPlease write a short definition of your habit.\n")
-        habit_type = input("\nWhat could be the generic term of your habit (e.g., 'Relaxing', 'Cognitive', 'Physical', etc.)?\n")
-        habit_date = datetime.now().strftime('%Y-%m-%d')
+    habit_name = input("\nWhat is the name of the habit you want to create?\n").strip()
+    habit_def = input("\nPlease write a short definition of your habit.\n")
+    habit_type = input("\nWhat could be the generic term of your habit (e.g., 'Relaxing', 'Cognitive', 'Physical', etc.)?\n")
 
-        while True:
-            habit_interval = input("\nDo you want to practice your habit daily or weekly? (Type 'd' for daily and 'w' for weekly):\n").lower()
-            if habit_interval == 'd':
-                habit_interval = 'Daily'
-                break
-            elif habit_interval == 'w':
-                habit_interval = 'Weekly'
-                break
-            else:
-                print("Invalid input. Please type 'd' for daily or 'w' for weekly.")
+    while True:
+        habit_interval = input("\nDo you want to practice your habit daily or weekly? (Type 'd' for daily and 'w' for weekly):\n").lower()
+        if habit_interval == 'd':
+            habit_interval = 'Daily'
+            break
+        elif habit_interval == 'w':
+            habit_interval = 'Weekly'
+            break
+        else:
+            print("Invalid input. Please type 'd' for daily or 'w' for weekly.")
 
-        # Insert custom habit into the database
-        cur.execute("INSERT INTO habits (user_id, habit_name, habit_def, habit_type, habit_date, habit_interval, is_custom) VALUES (?, ?, ?, ?, ?, ?, 1)",
-                    (user_id, habit_name, habit_def, habit_type, habit_date, habit_interval))
-        db.commit()
-        print(f"The habit '{habit_name}' has been successfully saved.")
-    except sqlite3.Error as e:
-        db.rollback()
-        print(f"An error occurred while creating your custom habit: {e}")
+    #Insert custom habit into the database
+    result = HabitService(db).create_habit(user_id, habit_name, habit_def, habit_type, habit_interval)
+    print(result.message)
+    return result.ok
 
         
 #Functions to change habits        
 def delete_custom_habit(cur, db, user_id):
     """Function to delete a habit"""
+    from analyze import show_custom_habits #Imported here so that pandas is only loaded when needed
     print("\nDo you want to delete one of your custom habits?")
-    show_custom_habits(cur) #Shows existing habits
+    show_custom_habits(cur, user_id) #Shows existing habits
     custom_input = input("Type 'Y' for yes and 'N' for no: ").lower()
 
     if custom_input == "y":
-        while True:
-            try:
-                del_name_input = input("\nPlease enter the name of the habit you want to delete: ")
-                #Validation if the habit exists
-                cur.execute("SELECT 1 FROM habits WHERE habit_name = ? AND user_id = ?", (del_name_input, user_id))
-                if not cur.fetchone():
-                    print(f"The habit '{del_name_input}' does not exist.")
-                    return
-                #Then delete
-                cur.execute("DELETE FROM habits WHERE habit_name = ? AND user_id = ?", 
-                            (del_name_input, user_id))
-                db.commit()
-                print(f"The habit '{del_name_input}' was successfully deleted.")
-                break
-            
-            except sqlite3.Error as e:
-                db.rollback()
-                print(f"An error occurred while deleting your habit: {e}. Please try again.")
+        del_name_input = input("\nPlease enter the name of the habit you want to delete: ")
+        print(HabitService(db).delete_habit(user_id, del_name_input).message)
     else:
         print("No habits were deleted.")
 
         
 def edit_custom_habit(cur, db, user_id):
     """Function to edit the periodicity of a habit"""
+    from analyze import show_custom_habits #Imported here so that pandas is only loaded when needed
     print("\nDo you want to edit the periodicity of your custom habits?")
-    show_custom_habits(cur) #Shows existing habits
+    show_custom_habits(cur, user_id) #Shows existing habits
     custom_input = input("Type 'Y' for yes and 'N' for no: ").lower()
 
     if custom_input == "y":
+        habit_service = HabitService(db)
+        habit_name = input("\nPlease enter the name of the habit you want to edit: ")
+        #Validation if the habit exists
+        habit = habit_service.get_habit(user_id, habit_name)
+        if habit is None or not habit.is_custom:
+            print(f"The habit '{habit_name}' does not exist.")
+            return
+
         while True:
-            try:
-                habit_name = input("\nPlease enter the name of the habit you want to edit: ")
-                #Validation if the habit exists
-                cur.execute("SELECT 1 FROM habits WHERE habit_name = ? AND user_id = ?", (habit_name, user_id))
-                if not cur.fetchone():
-                    print(f"The habit '{habit_name}' does not exist.")
-                    return
-                
-                periodicity_input = input("\nDo you want to set the periodicity to 'Weekly' or 'Daily'? Please enter 'W' or 'D'): ").lower()
-                
-                if periodicity_input == "d":
-                    new_interval = "Daily"
-                    #Now edit
-                    cur.execute("UPDATE habits SET habit_interval = ? WHERE habit_name = ? AND user_id = ?", 
-                        (new_interval, habit_name, user_id))
-                    db.commit()
-                    print(f"The periodicity of habit '{habit_name}' has been successfully updated to '{new_interval}'.")
-                    break
-                elif periodicity_input == "w":
-                    new_interval = "Weekly"
-                    cur.execute("UPDATE habits SET habit_interval = ? WHERE habit_name = ? AND user_id = ?", 
-                        (new_interval, habit_name, user_id))
-                    db.commit()
-                    print(f"The periodicity of habit '{habit_name}' has been successfully updated to '{new_interval}'.")
-                    break
-                else:
-                    print("Invalid input. Please enter 'W' for Weekly or 'D' for Daily.")
-            except sqlite3.Error as e:
-                db.rollback()
-                print(f"An error occurred while editing your habit: {e}. Please try again.")
+            periodicity_input = input("\nDo you want to set the periodicity to 'Weekly' or 'Daily'? Please enter 'W' or 'D'): ").lower()
+            if periodicity_input == "d":
+                new_interval = "Daily"
+                break
+            elif periodicity_input == "w":
+                new_interval = "Weekly"
+                break
+            else:
+                print("Invalid input. Please enter 'W' for Weekly or 'D' for Daily.")
+
+        #Now edit
+        print(habit_service.set_interval(user_id, habit_name, new_interval).message)
     else:
-        print("No habits were edited.")
\ No newline at end of file
+        print("No habits were edited.")
@@ -0,0 +1,69 @@
+"""
+    This file contains an import-time budget check for the habit tracker.
+    It imports 'main.py' in a fresh interpreter with 'python -X importtime',
+    reports the slowest imports and fails if the startup exceeds the budget
+    or if a heavy module (pandas, numpy) is imported before a table is displayed.
+    Usage: python import_budget.py [--budget-ms 100] [--top 10]
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+#Modules that must not be imported up to the login prompt
+FORBIDDEN_MODULES = ("pandas", "numpy")
+
+
+def measure_imports(module="main"):
+    """
+    Function that imports a module in a new interpreter and returns the import times
+
+    :param module: Name of the module to import
+    :return: List of (module name, self time in µs, cumulative time in µs) in import order
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing '{module}' failed:\n{result.stderr}")
+
+    timings = []
+    for line in result.stderr.splitlines():
+        #Format: "import time:   self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings.append((name.strip(), int(self_us), int(cumulative_us)))
+    return timings
+
+
+def check_budget(budget_ms=100.0, top=10, module="main"):
+    """Function that prints an import-time report and returns True if the import stays within the budget"""
+    timings = measure_imports(module)
+    #The cumulative time of the module itself covers everything it imports (interpreter startup excluded)
+    total_us = next(cumulative for name, _, cumulative in reversed(timings) if name == module)
+    loaded = {name.strip().split(".")[0] for name, _, _ in timings}
+
+    print(f"Importing '{module}' took {total_us / 1000:.1f} ms (budget: {budget_ms:.1f} ms).")
+    print(f"\nThe {top} slowest imports (cumulative):")
+    for name, self_us, cumulative_us in sorted(timings, key=lambda timing: timing[2], reverse=True)[:top]:
+        print(f"  {cumulative_us / 1000:8.1f} ms  {self_us / 1000:8.1f} ms self  {name.strip()}")
+
+    within_budget = total_us / 1000 <= budget_ms
+    forbidden = sorted(loaded.intersection(FORBIDDEN_MODULES))
+    if forbidden:
+        print(f"\nThese modules must be imported lazily: {', '.join(forbidden)}")
+    if not within_budget:
+        print("\nThe import-time budget was exceeded.")
+    return within_budget and not forbidden
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import-time budget check for the habit tracker")
+    parser.add_argument("--budget-ms", type=float, default=100.0, help="Maximum import time of main.py in ms")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest imports to report")
+    parser.add_argument("--module", default="main", help="Module to import")
+    args = parser.parse_args()
+    sys.exit(0 if check_budget(args.budget_ms, args.top, args.module) else 1)
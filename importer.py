@@ -0,0 +1,144 @@
+"""
+    This file contains the chunked bulk import of historical check-ins.
+    Check-ins are read as a stream from CSV or JSON Lines files (columns/keys: user_id, habit_name,
+    check_date and optionally check_time and habit_rep), validated against in-memory lookups of the
+    users and habits, and inserted in chunks with check_in_many() under the 'bulk-load' profile.
+    Streaks are computed in the same pass from the habit state of the database.
+    After every committed chunk a checkpoint file is written, so that a failed import continues
+    where it stopped when it is started again with the same checkpoint.
+    The input should be ordered by date per habit: a record older than the last check of its habit
+    is still inserted ('backfilled' in the outcomes), but the streaks of that habit are then
+    recomputed from its whole history, which is slower.
+    Usage: python importer.py checkins.csv --checkpoint checkins.checkpoint.json
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import os
+import sqlite3
+import sys
+import time
+from db import get_db, close_db, migrate_db, use_profile
+from counter_manager import check_in_many, HabitLookup, CHECK_IN_INVALID, CHECK_IN_UNKNOWN_USER
+
+#Records per transaction
+IMPORT_CHUNK_SIZE = 50000
+
+
+def read_records(path):
+    """Generator that yields the records of a CSV (with header) or JSON Lines file as dicts"""
+    if path.lower().endswith((".jsonl", ".ndjson", ".json")):
+        with open(path) as jsonl_file:
+            for line in jsonl_file:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(path, newline="") as csv_file:
+            yield from csv.DictReader(csv_file)
+
+
+def load_checkpoint(path):
+    """Function that returns the saved progress of an import, or an empty one"""
+    if path and os.path.exists(path):
+        with open(path) as checkpoint_file:
+            return json.load(checkpoint_file)
+    return {"records_done": 0, "outcomes": {}}
+
+
+def save_checkpoint(path, checkpoint):
+    """Function that writes the progress of an import atomically (write to a temporary file, then rename)"""
+    if not path:
+        return
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as checkpoint_file:
+        json.dump(checkpoint, checkpoint_file)
+    os.replace(temporary_path, path)
+
+
+def import_chunk(db, lookup, records, outcomes):
+    """
+    Function that validates a chunk of records, computes their streaks and writes them in one transaction
+    (with check_in_many; records older than the last check of their habit are backfilled)
+
+    :param db: Database connection object
+    :param lookup: HabitLookup of all users, updated with the new habit states
+    :param records: List of record dicts
+    :param outcomes: Dict of outcome counts that is updated
+    """
+    #Unlike a live check-in, an imported record needs a date
+    dated = []
+    for record in records:
+        if isinstance(record, dict) and record.get("check_date"):
+            dated.append(record)
+        else:
+            outcomes[CHECK_IN_INVALID] = outcomes.get(CHECK_IN_INVALID, 0) + 1
+    for outcome in check_in_many(db, dated, lookup, default_time="00:00:00", backfill=True):
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+
+def import_checkins(db, path, checkpoint_path=None, chunk_size=IMPORT_CHUNK_SIZE, progress=None):
+    """
+    Function that imports a CSV or JSON Lines file of check-ins in chunks
+
+    :param db: Database connection object
+    :param path: Path of the input file
+    :param checkpoint_path: Path of the checkpoint file (None: the import cannot be resumed)
+    :param chunk_size: Records per transaction
+    :param progress: Optional function called with the checkpoint dict after every chunk
+    :return: The final checkpoint dict (records_done, outcomes, seconds, records_per_s)
+    """
+    migrate_db(db)
+    checkpoint = load_checkpoint(checkpoint_path)
+    if checkpoint.get("source", path) != path:
+        raise ValueError(f"The checkpoint '{checkpoint_path}' belongs to '{checkpoint['source']}'.")
+    checkpoint["source"] = path
+    lookup = HabitLookup(db.cursor())
+
+    started = time.perf_counter()
+    #Records that were committed before are skipped without being validated again
+    records = itertools.islice(read_records(path), checkpoint["records_done"], None)
+    imported = 0
+    with use_profile(db, "bulk-load"):
+        while True:
+            chunk = list(itertools.islice(records, chunk_size))
+            if not chunk:
+                break
+            import_chunk(db, lookup, chunk, checkpoint["outcomes"])
+            imported += len(chunk)
+            checkpoint["records_done"] += len(chunk)
+            save_checkpoint(checkpoint_path, checkpoint)
+            if progress:
+                progress(checkpoint)
+
+    checkpoint["seconds"] = round(time.perf_counter() - started, 3)
+    checkpoint["records_per_s"] = round(imported / checkpoint["seconds"]) if checkpoint["seconds"] else 0
+    save_checkpoint(checkpoint_path, checkpoint)
+    return checkpoint
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk import of historical check-ins")
+    parser.add_argument("input", help="CSV or JSON Lines file with check-ins")
+    parser.add_argument("--db", default="main_db.db", help="Path of the database file")
+    parser.add_argument("--checkpoint", help="Checkpoint file used to resume a failed import "
+                                             "(default: <input>.checkpoint.json)")
+    parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = parser.parse_args()
+
+    db = get_db(args.db)
+    if db is None:
+        sys.exit(1)
+    try:
+        result = import_checkins(
+            db, args.input, args.checkpoint or f"{args.input}.checkpoint.json", args.chunk_size,
+            progress=lambda checkpoint: print(f"{checkpoint['records_done']} records processed...")
+        )
+        print(f"Imported {result['records_done']} records in {result['seconds']} s "
+              f"({result['records_per_s']} records/s): {result['outcomes']}")
+    except (sqlite3.Error, ValueError, OSError) as e:
+        print(f"The import stopped: {e}. Start it again to continue from the last checkpoint.")
+        sys.exit(1)
+    finally:
+        close_db()
@@ -0,0 +1,61 @@
+"""
+    This file contains the streak leaderboards of the habit tracker.
+    The leaderboards read the materialized 'habit_state' table through an index on the streak,
+    so the top K habits (globally or per user) are found without sorting the whole table.
+    Further pages are fetched with keyset pagination: the last entry of a page is passed as
+    'after' to get the entries that follow it, instead of skipping rows with OFFSET.
+"""
+
+from typing import NamedTuple
+
+#Leaderboard metric -> column of the habit_state table
+LEADERBOARD_METRICS = {"longest": "longest_streak", "current": "current_streak"}
+
+
+class LeaderboardEntry(NamedTuple):
+    """One habit of a leaderboard; also used as the keyset position of the next page"""
+    streak: int
+    user_id: str
+    habit_name: str
+
+
+def top_streaks(cur, k=10, user_id=None, metric="longest", after=None):
+    """
+    Function that returns one page of a streak leaderboard
+
+    :param cur: Cursor for database operations
+    :param k: Maximum number of entries
+    :param user_id: Only rank the habits of this user (default: all users)
+    :param metric: 'longest' or 'current' streak
+    :param after: Last LeaderboardEntry of the previous page (default: start with the first page)
+    :return: List of LeaderboardEntry, highest streak first (ties ordered by user and habit name)
+    """
+    if metric not in LEADERBOARD_METRICS:
+        raise ValueError(f"Unknown metric '{metric}'. Choose one of: {', '.join(LEADERBOARD_METRICS)}.")
+    column = LEADERBOARD_METRICS[metric]
+    conditions, params = [], []
+    if user_id is not None:
+        conditions.append("user_id = ?")
+        params.append(user_id)
+    if after is not None:
+        #Row value comparison in index order: (streak, user, habit) strictly below the last entry
+        conditions.append(f"({column}, user_id, habit_name) < (?, ?, ?)")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    cur.execute(
+        f"""SELECT {column}, user_id, habit_name FROM habit_state {where}
+        ORDER BY {column} DESC, user_id DESC, habit_name DESC LIMIT ?""",
+        (*params, k)
+    )
+    return [LeaderboardEntry(*row) for row in cur.fetchall()]
+
+
+def iter_leaderboard(cur, page_size=100, user_id=None, metric="longest"):
+    """Generator that walks through a whole leaderboard page by page"""
+    after = None
+    while True:
+        page = top_streaks(cur, page_size, user_id, metric, after)
+        yield from page
+        if len(page) < page_size:
+            break
+        after = page[-1]
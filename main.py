@@ -5,11 +5,12 @@ files such as the habit class, the user class, the counter
 class, the database file, and the analyse file.
 """
 
-import counter
-import analyze
-from db import get_db, close_db, initialize_db
-from habits import Habit
-from user import user_auth, create_profile
+import sqlite3
+import counter_manager
+from db import get_db, close_db, initialize_db, migrate_db
+from habit_manager import create_custom_habits, delete_custom_habit, edit_custom_habit
+from user import User
+from user_manager import user_auth, create_profile
 
                 
 
@@ -91,6 +92,8 @@ def database_needed():
             print("No tables were found. Initializing database...")
             initialize_db(cur, db)
             print("Database has been successfully created and initialized.")
+        else:  #Upgrade an existing database in place
+            migrate_db(db)
     except sqlite3.Error as e:
         print(f"An error occurred while checking the database: {e}. Exiting program.")
         return None, None
@@ -99,8 +102,8 @@ def database_needed():
 
 
 #Step 3: Login Menu
-def login_user_menu():
-    """Function that represents a login menu"""
+def login_user_menu(cur, db):
+    """Function that represents a login menu and returns the ID of the logged-in user"""
     print("Do you aready have created a user profile?")
     log_input = input("Yes = 1, No = 2, Exit = 3")
     if log_input == "1":
@@ -109,16 +112,18 @@ def login_user_menu():
               LOGIN TO YOUR USER PROFILE
         **************************************
         """)
-        user_auth()
+        return user_auth(cur, db)
     elif log_input == "2":
         print("""
         **************************************
                 CREATE A USER PROFILE
         **************************************
         """)
-        create_profile()
+        profile = create_profile(cur, db)
+        return profile[0] if profile else None
     elif log_input == "3":
-        return ("Thanks for participating.\nYou will now exit the program.")
+        print("Thanks for participating.\nYou will now exit the program.")
+        return None
 
 
 
@@ -165,6 +170,7 @@ def main_user_menu():
 #Step 4.1: VIEW HABITS & STREAKS    
 def view_habits(cur, user_id):
     """Function to represent a menu with options to display habits and streaks"""
+    import analyze #Imported here so that pandas is only loaded when a table is displayed
     while True:
         print("""
         ******************************************
@@ -185,23 +191,23 @@ def view_habits(cur, user_id):
         choice = input("Please select an option (1-10): ").strip()
         
         if choice == "1":
-            analyse.show_predef_habits(cur)
+            analyze.show_predef_habits(cur)
         elif choice == "2":
-            analyse.show_custom_habits(cur, user_id)
+            analyze.show_custom_habits(cur, user_id)
         elif choice == "3":
-            analyse.show_all_habits(cur, user_id)
+            print(analyze.show_all_habits(cur, user_id).to_string(index=False))
         elif choice == "4":
-            habits = analyse.show_daily_habits(cur, user_id)
+            habits = analyze.show_daily_habits(cur, user_id)
         elif choice == "5":
-            habits = analyse.show_weekly_habits(cur, user_id)
+            habits = analyze.show_weekly_habits(cur, user_id)
         elif choice == "6":
-            streaks = analyse.show_longest_streak(cur)
+            streaks = analyze.show_longest_streak(cur)
         elif choice == "7":
-            streaks = analyse.show_streak_break(cur)
+            streaks = analyze.show_streak_break(cur)
         elif choice == "8":
-            analyse.show_streak_for_specific_habit(cur, user_id)
+            analyze.show_streak_for_specific_habit(cur, user_id)
         elif choice == "9":
-            analyse.show_rep_number(cur, user_id)
+            analyze.show_rep_number(cur, user_id)
         elif choice == "10":
             print("Returning to the main menu.")
             break
@@ -227,19 +233,16 @@ def change_habits(cur, db, user_id):
 
         if choice == "1":
             print("\nCreating a new custom habit...")
-            habit_instance = Habit(db, user_id, "", "", "", None, "")
-            habit_instance.create_custom_habits()
-            print("Custom habit was successfully created!")
+            if create_custom_habits(cur, db, user_id):
+                print("Custom habit was successfully created!")
         
         elif choice == "2":
             print("\nDeleting a habit...")
-            habit_instance = Habit(db, user_id, "", "", "", None, "")
-            habit_instance.delete_habit(habit_name)
+            delete_custom_habit(cur, db, user_id)
         
         elif choice == "3":
             print("\nEditing a habit...")
-            habit_instance = Habit(db, user_id, "", "", "", None, "")
-            habit_instance.edit_habit(habit_name)
+            edit_custom_habit(cur, db, user_id)
                     
         elif choice == "4":
             print("Returning to the main menu.")
@@ -272,26 +275,24 @@ def update_habits(cur, db, user_id):
         if choice == "1":
             print("\nMarking a habit as checked...")
             print("Note: The repetition counter and the streak will be updated automatically.")
-            counter.check_habit(cur, db, user_id)
-            print("Habit successfully checked, counter and streak successfully incremented!")
+            counter_manager.check_habit(cur, db, user_id)
         
         elif choice == "2":
             print("\nResetting a streak...")
-            counter.reset_streak(cur, db, user_id)
-            print("Streak reset successfully!")
+            counter_manager.reset_streak(cur, db, None, user_id)
         
         elif choice == "3":
             print("\nManual Increment: Counter")
             print("Note: Use this option only if the habit check was forgotten.")
             habit_name = input("Please enter the name of the habit for which to increment the counter: ").strip()
-            counter.increment_counter(cur, db, habit_name, user_id)
+            counter_manager.increment_counter(cur, db, habit_name, user_id)
             print("Counter incremented successfully!")
         
         elif choice == "4":
             print("\nManual Increment: Streak")
             print("Note: Use this option only if the habit check was forgotten.")
             habit_name = input("Please enter the name of the habit for which to increment the streak: ").strip()
-            counter.increment_streak(cur, db, habit_name, user_id)
+            counter_manager.increment_streak(cur, db, habit_name, user_id)
             print("Streak incremented successfully!")
         
         elif choice == "5":
@@ -318,7 +319,7 @@ def change_profile(cur, db, user_id):
 
         if choice == "1":
             print("\nEditing profile information...")
-            user_instance = user.User(db, user_id=user_id)
+            user_instance = User(db, user_id=user_id)
             user_instance.change_profile()
             print("Profile successfully updated!")
         elif choice == "2":
@@ -341,10 +342,17 @@ def main():
             return
         
         #Step 3: User Authentication
-        user_id = login_user_menu()
+        user_id = login_user_menu(cur, db)
         if not user_id:
             print("Exiting program. Thanks and goodbye!")
             return
+        
+        #Habits and counters are read from the user's shard in sharded mode (otherwise the same database)
+        user_db = get_db(user_id=user_id)
+        if not user_db:
+            print("Failed to connect to the database of your habits. Exiting program.")
+            return
+        user_cur = user_db.cursor()
                 
         #Step 4: Main User Menu
         while True:
@@ -353,15 +361,15 @@ def main():
 
             #4.1 VIEW HABITS & STREAKS
             if input_main_menu == "1":
-                view_habits(cur, user_id)
+                view_habits(user_cur, user_id)
 
             #4.2 CHANGE HABITS
             elif input_main_menu == "2":    
-                change_habits(cur, db, user_id)
+                change_habits(user_cur, user_db, user_id)
 
             #4.3 UPDATE HABITS & STREAKS
             elif input_main_menu == "3":
-                update_habits(cur, db, user_id)
+                update_habits(user_cur, user_db, user_id)
 
             #4.4 CHANGE PROFILE
             elif input_main_menu == "4":
@@ -381,8 +389,5 @@ def main():
             cur.close()
         close_db()
     
-main()
-                   
-                      
-                          
-        
\ No newline at end of file
+if __name__ == "__main__":
+    main()
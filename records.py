@@ -0,0 +1,67 @@
+"""
+    This file contains the compact record types of the habit tracker.
+    The records are immutable named tuples (no per-instance __dict__) that are created directly
+    by sqlite3 row factories, so internal code paths can look up habits, counters and users
+    without building pandas DataFrames. DataFrames are only created for display in 'analyze.py'.
+    Dates are day numbers as stored in the database (see dates.py).
+"""
+
+from typing import NamedTuple
+
+
+class HabitRecord(NamedTuple):
+    """One row of the habits table (user_id is None for predefined habits)"""
+    user_id: str
+    name: str
+    definition: str
+    type: str
+    day: int
+    interval: str
+    is_custom: bool
+
+
+class CounterRecord(NamedTuple):
+    """One row of the counter table"""
+    user_id: str
+    habit_name: str
+    check_day: int
+    check_time: str
+    habit_rep: int
+    habit_streak: int
+
+
+class UserRecord(NamedTuple):
+    """One row of the user table"""
+    user_id: str
+    user_name: str
+    user_pwd: str
+
+
+#Columns to select for each record type, in field order
+HABIT_COLUMNS = "user_id, habit_name, habit_def, habit_type, habit_day, habit_interval, is_custom"
+COUNTER_COLUMNS = "user_id, habit_name, check_day, check_time, habit_rep, habit_streak"
+USER_COLUMNS = "user_id, user_name, user_pwd"
+
+
+#Row factories, e.g. cur.row_factory = habit_row
+def habit_row(cursor, row):
+    """Row factory that turns a row selected with HABIT_COLUMNS into a HabitRecord"""
+    return HabitRecord(row[0], row[1], row[2], row[3], row[4], row[5], bool(row[6]))
+
+
+def counter_row(cursor, row):
+    """Row factory that turns a row selected with COUNTER_COLUMNS into a CounterRecord"""
+    return CounterRecord._make(row)
+
+
+def user_row(cursor, row):
+    """Row factory that turns a row selected with USER_COLUMNS into a UserRecord"""
+    return UserRecord._make(row)
+
+
+def index_by_name(habits):
+    """Function that returns a dict of habit name -> HabitRecord; the first record of a name wins"""
+    index = {}
+    for habit in habits:
+        index.setdefault(habit.name, habit)
+    return index
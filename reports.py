@@ -0,0 +1,130 @@
+"""
+    This file contains the parallel report runner of the habit tracker.
+    Heavy reports (full streak recomputation and completion rates, see analyze.py) are split into
+    shards of consecutive user IDs. Every shard is computed by a worker process of a ProcessPoolExecutor
+    that reads the database through its own read-only connection, and the partial results are merged.
+    With --snapshot the report reads a db.Snapshot of the database, so it does not slow down check-ins.
+    Usage: python reports.py streaks --db main_db.db --workers 8 --chunk-size 2000 --output streaks.csv
+           python reports.py completion --db main_db.db --snapshot analytics.db --max-age 600
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+from db import connect_readonly, Snapshot, SNAPSHOT_REFRESH
+from analyze import recompute_streaks, completion_rates
+
+#Users per shard
+REPORT_CHUNK_SIZE = 1000
+
+#Report name -> function(cur, user_range=..., **options) that returns a DataFrame
+REPORTS = {"streaks": recompute_streaks, "completion": completion_rates}
+
+#Read-only connection of a worker process, opened once by _init_worker
+_worker_db = None
+
+
+def user_shards(db, chunk_size=REPORT_CHUNK_SIZE):
+    """Function that splits the user IDs into (first, last) ranges of at most chunk_size users"""
+    user_ids = [row[0] for row in db.execute("SELECT user_id FROM user ORDER BY user_id")]
+    return [(user_ids[start], user_ids[min(start + chunk_size, len(user_ids)) - 1])
+            for start in range(0, len(user_ids), chunk_size)]
+
+
+def _init_worker(name):
+    """Function that opens the read-only connection of a worker process"""
+    global _worker_db
+    _worker_db = connect_readonly(name)
+
+
+def _run_shard(report, user_range, options):
+    """Function that computes one shard of a report in a worker process"""
+    return REPORTS[report](_worker_db.cursor(), user_range=user_range, **options)
+
+
+def run_report(name, report, workers=None, chunk_size=REPORT_CHUNK_SIZE, progress=None, **options):
+    """
+    Function that computes a report over all users in parallel and merges the partial results
+
+    :param name: Path of the database file
+    :param report: Name of a report in REPORTS
+    :param workers: Number of worker processes (default: number of CPUs; 1 runs in this process)
+    :param chunk_size: Users per shard
+    :param progress: Optional function called with (finished shards, total shards) after every shard
+    :param options: Further arguments of the report function (e.g. as_of)
+    :return: DataFrame of the whole report, ordered like a single-process run
+    """
+    global _worker_db
+    if report not in REPORTS:
+        raise ValueError(f"Unknown report '{report}'. Choose one of: {', '.join(REPORTS)}.")
+    if not os.path.exists(name):
+        raise FileNotFoundError(f"The database '{name}' does not exist.")
+    workers = workers or os.cpu_count() or 1
+    db = connect_readonly(name)
+    try:
+        shards = user_shards(db, chunk_size)
+    finally:
+        db.close()
+
+    parts = {}
+    if workers == 1:
+        _init_worker(name)
+        try:
+            for number, user_range in enumerate(shards):
+                parts[number] = _run_shard(report, user_range, options)
+                if progress:
+                    progress(len(parts), len(shards))
+        finally:
+            _worker_db.close()
+            _worker_db = None
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(name,)) as executor:
+            futures = {executor.submit(_run_shard, report, user_range, options): number
+                       for number, user_range in enumerate(shards)}
+            for future in as_completed(futures):
+                parts[futures[future]] = future.result()
+                if progress:
+                    progress(len(parts), len(shards))
+
+    #Shards cover consecutive user IDs, so concatenating them in shard order keeps the user order
+    frames = [parts[number] for number in range(len(shards)) if not parts[number].empty]
+    if not frames:
+        return parts[0] if parts else pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compute a habit tracker report in parallel")
+    parser.add_argument("report", choices=sorted(REPORTS))
+    parser.add_argument("--db", default="main_db.db", help="Path of the database file")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: number of CPUs)")
+    parser.add_argument("--chunk-size", type=int, default=REPORT_CHUNK_SIZE, help="Users per shard")
+    parser.add_argument("--output", help="CSV file for the report (default: print a summary)")
+    parser.add_argument("--snapshot", help="Snapshot file to read instead of the live database (taken if missing or stale)")
+    parser.add_argument("--max-age", type=float, default=SNAPSHOT_REFRESH, help="Seconds after which the snapshot is refreshed")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    try:
+        source = args.db
+        if args.snapshot:
+            snapshot = Snapshot(args.db, args.snapshot, refresh_interval=args.max_age)
+            snapshot.connection()
+            snapshot.close()
+            print(snapshot.staleness())
+            source = args.snapshot
+        result = run_report(source, args.report, args.workers, args.chunk_size,
+                            progress=lambda done, total: print(f"{done}/{total} shards finished...", end="\r"))
+    except (sqlite3.Error, ValueError, OSError) as e:
+        print(f"The report could not be computed: {e}")
+        sys.exit(1)
+    print(f"\nThe '{args.report}' report has {len(result)} rows ({time.perf_counter() - started:.2f} s).")
+    if args.output:
+        result.to_csv(args.output, index=False)
+        print(f"The report was written to '{args.output}'.")
+    else:
+        print(result.head(20).to_string(index=False))
@@ -0,0 +1,509 @@
+"""
+    This file contains the local JSON-over-HTTP service of the habit tracker.
+    The server is built on asyncio streams of the standard library (HTTP/1.1 with keep-alive).
+    The event loop only parses requests: reads and analytics run on a bounded thread pool with one
+    pooled connection per thread, and all writes go through a single writer task, so that writes are
+    serialized on one connection. Check-ins that arrive while the writer is busy are committed
+    together in one check_in_many transaction.
+    Clients log in once (POST /login) and send the session token as 'Authorization: Bearer <token>'.
+
+    POST   /login                  {"identifier", "password", "ttl" (optional)} -> {"token", "user_id"}
+    POST   /logout
+    GET    /habits[?interval=Daily|Weekly]
+    POST   /habits                 {"name", "definition", "type", "interval"}
+    GET    /habits/<name>
+    PATCH  /habits/<name>          {"interval"}
+    DELETE /habits/<name>
+    GET    /habits/<name>/status
+    POST   /check-ins              {"habit", "date" (optional, YYYY-MM-DD), "reps" (optional)}
+    GET    /analytics/streaks      recomputed streaks of the user's habits
+    GET    /analytics/completion[?windows=7,30,90]
+    GET    /analytics/leaderboard[?k=20&metric=longest|current&scope=all]
+
+    With --socket the server runs as a local daemon on a Unix domain socket (readable only by its
+    owner) with warmed-up connections, for the thin command line client (see client.py).
+
+    Usage: python server.py --db main_db.db --port 8080 --threads 8
+           python server.py --db main_db.db --socket ~/.habit_tracker.sock
+    Load test: python -m benchmarks.loadgen --port 8080 --clients 32
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs, unquote
+from auth import SESSION_TTL, SESSION_MAX_TTL
+from client import DEFAULT_SOCKET
+from dates import format_day
+from db import ConnectionPool, DEFAULT_PROFILE, migrate_db
+from services import HabitService, CounterService, UserService
+from counter_manager import (CHECK_IN_INSERTED, CHECK_IN_DUPLICATE, CHECK_IN_UNKNOWN_HABIT, CHECK_IN_UNKNOWN_USER,
+                             CHECK_IN_OUT_OF_ORDER, CHECK_IN_BACKFILLED, CHECK_IN_INVALID, MAX_HABIT_REP)
+from leaderboard import top_streaks, LEADERBOARD_METRICS
+import analyze
+
+#Threads (and pooled connections) for reads, largest request body, and check-ins per group commit
+SERVER_THREADS = 8
+MAX_BODY_BYTES = 1048576
+CHECK_IN_BATCH = 500
+
+#Check-in outcome -> HTTP status of the response
+CHECK_IN_STATUS = {
+    CHECK_IN_INSERTED: HTTPStatus.CREATED,
+    CHECK_IN_BACKFILLED: HTTPStatus.CREATED,
+    CHECK_IN_DUPLICATE: HTTPStatus.CONFLICT,
+    CHECK_IN_OUT_OF_ORDER: HTTPStatus.CONFLICT,
+    CHECK_IN_UNKNOWN_HABIT: HTTPStatus.NOT_FOUND,
+    #The user of a still cached session was deleted
+    CHECK_IN_UNKNOWN_USER: HTTPStatus.NOT_FOUND,
+    CHECK_IN_INVALID: HTTPStatus.BAD_REQUEST,
+}
+
+
+class HttpError(Exception):
+    """An error that is answered with an HTTP status and a JSON message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _plain(value):
+    """Function that turns records (NamedTuples) into dicts, so that they are encoded as JSON objects"""
+    if hasattr(value, "_asdict"):
+        return {name: _plain(item) for name, item in value._asdict().items()}
+    if isinstance(value, dict):
+        return {name: _plain(item) for name, item in value.items()}
+    if isinstance(value, list):
+        return [_plain(item) for item in value]
+    return value
+
+
+def _json_default(value):
+    """Function that converts numpy scalars and other values for json.dumps"""
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def _habit(habit):
+    """Function that returns a HabitRecord as a dict with its creation date instead of the day number"""
+    habit = _plain(habit)
+    habit["date"] = format_day(habit.pop("day"))
+    return habit
+
+
+def _frame_records(frame):
+    """Function that returns the rows of a DataFrame as a list of dicts"""
+    return frame.to_dict(orient="records")
+
+
+def _result(result, status=HTTPStatus.OK):
+    """Function that turns a ServiceResult into a response (failed results are client errors)"""
+    if not result.ok:
+        raise HttpError(HTTPStatus.BAD_REQUEST, result.message)
+    return status, {"message": result.message}
+
+
+def _resolve(future, result=None, error=None):
+    """Function that completes the future of a queued write (unless its client has gone away)"""
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class HabitTrackerServer:
+    """
+    The asyncio HTTP server with its reader thread pool and single writer task.
+
+    :param name: str
+        Path of the database file.
+    :param threads: int
+        Number of reader threads (and pooled read connections).
+    :param profile: str
+        Performance profile of the connections (see db.PROFILES).
+    """
+
+    def __init__(self, name="main_db.db", threads=SERVER_THREADS, profile=DEFAULT_PROFILE):
+        self.name = name
+        self.read_pool = ConnectionPool(name, threads, profile=profile)
+        self.write_pool = ConnectionPool(name, 1, profile=profile)
+        self.readers = ThreadPoolExecutor(threads, thread_name_prefix="reader")
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix="writer")
+        self._writes = None
+        self._writer_task = None
+        self._write_db = None
+        #(method, path pattern, handler, needs a session)
+        self.routes = [
+            ("POST", r"/login", self.login, False),
+            ("POST", r"/logout", self.logout, True),
+            ("GET", r"/habits", self.list_habits, True),
+            ("POST", r"/habits", self.create_habit, True),
+            ("GET", r"/habits/(?P<name>[^/]+)", self.get_habit, True),
+            ("PATCH", r"/habits/(?P<name>[^/]+)", self.set_interval, True),
+            ("DELETE", r"/habits/(?P<name>[^/]+)", self.delete_habit, True),
+            ("GET", r"/habits/(?P<name>[^/]+)/status", self.habit_status, True),
+            ("POST", r"/check-ins", self.check_in, True),
+            ("GET", r"/analytics/streaks", self.streaks, True),
+            ("GET", r"/analytics/completion", self.completion, True),
+            ("GET", r"/analytics/leaderboard", self.leaderboard, True),
+        ]
+        self.routes = [(method, re.compile(pattern + "$"), handler, needs_session)
+                       for method, pattern, handler, needs_session in self.routes]
+
+
+    ####Thread pool and writer task
+
+    async def _read(self, function, *args):
+        """Method that runs function(read connection, *args) on the reader thread pool"""
+        def run():
+            with self.read_pool.connection() as db:
+                return function(db, *args)
+        return await asyncio.get_running_loop().run_in_executor(self.readers, run)
+
+
+    async def _write(self, function, *args):
+        """Method that queues function(writer connection, *args) for the writer task and waits for its result"""
+        future = asyncio.get_running_loop().create_future()
+        await self._writes.put((function, args, future))
+        return await future
+
+
+    async def _check_in(self, record):
+        """Method that queues a check-in record for the next group commit and returns its outcome"""
+        future = asyncio.get_running_loop().create_future()
+        await self._writes.put((None, record, future))
+        return await future
+
+
+    async def _run_writer(self):
+        """Method of the writer task: executes the queued writes in order on one connection"""
+        loop = asyncio.get_running_loop()
+        self._write_db = await loop.run_in_executor(self.writer, self.write_pool.checkout)
+        while True:
+            jobs = [await self._writes.get()]
+            while len(jobs) < CHECK_IN_BATCH and not self._writes.empty():
+                jobs.append(self._writes.get_nowait())
+            #Consecutive check-ins share one transaction; other writes run one by one in between
+            check_ins = []
+            for function, args, future in jobs:
+                if function is None:
+                    check_ins.append((args, future))
+                    continue
+                if check_ins:
+                    await self._commit_check_ins(check_ins)
+                    check_ins = []
+                try:
+                    _resolve(future, await loop.run_in_executor(self.writer, function, self._write_db, *args))
+                except Exception as e:
+                    #A failed write must not leave its transaction open for the next one
+                    await loop.run_in_executor(self.writer, self._write_db.rollback)
+                    _resolve(future, error=e)
+            if check_ins:
+                await self._commit_check_ins(check_ins)
+
+
+    async def _commit_check_ins(self, check_ins):
+        """Method that commits a group of (record, future) check-ins with one check_in_many call"""
+        records = [record for record, future in check_ins]
+        try:
+            outcomes = await asyncio.get_running_loop().run_in_executor(
+                self.writer, CounterService(self._write_db).check_in_many, records)
+        except Exception as e:
+            #The group was rolled back; commit its check-ins one by one, so that only the failing one gets the error
+            if len(check_ins) > 1:
+                for check_in in check_ins:
+                    await self._commit_check_ins([check_in])
+            else:
+                _resolve(check_ins[0][1], error=e)
+            return
+        for (record, future), outcome in zip(check_ins, outcomes):
+            _resolve(future, outcome)
+
+
+    ####Handlers
+    #Every handler receives the user ID of the session (or None), the path parameters (and the
+    #session 'token'), the query parameters and the JSON body, and returns (status, payload).
+
+    async def login(self, user_id, params, query, body):
+        identifier, password = body.get("identifier"), body.get("password")
+        if not identifier or not password:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "'identifier' and 'password' are required.")
+        try:
+            ttl = min(int(body.get("ttl", SESSION_TTL)), SESSION_MAX_TTL)
+        except (TypeError, ValueError):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "'ttl' must be a number of seconds.")
+        #The password is verified (and an outdated hash recomputed) on a reader thread, so the slow KDF
+        #never blocks the writer; the upgraded hash and the session are then written by the writer task
+        user_id, new_hash = await self._read(lambda db: UserService(db).verify(identifier, password))
+        if user_id is None:
+            raise HttpError(HTTPStatus.UNAUTHORIZED, "Password or user ID were incorrect.")
+        token = await self._write(lambda db: UserService(db).open_session(user_id, ttl, new_hash))
+        return HTTPStatus.OK, {"token": token, "user_id": user_id, "expires_in": ttl}
+
+
+    async def logout(self, user_id, params, query, body):
+        return _result(await self._write(lambda db: UserService(db).logout(params["token"])))
+
+
+    async def list_habits(self, user_id, params, query, body):
+        habits = await self._read(lambda db: HabitService(db).list_habits(user_id))
+        interval = query.get("interval")
+        return HTTPStatus.OK, {"habits": [_habit(habit) for habit in habits if interval is None or habit.interval == interval]}
+
+
+    async def create_habit(self, user_id, params, query, body):
+        if not isinstance(body.get("name"), str):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "'name' is required.")
+        result = await self._write(lambda db: HabitService(db).create_habit(
+            user_id, body["name"], body.get("definition"), body.get("type"), body.get("interval")))
+        return _result(result, HTTPStatus.CREATED)
+
+
+    async def get_habit(self, user_id, params, query, body):
+        habit = await self._read(lambda db: HabitService(db).get_habit(user_id, params["name"]))
+        if habit is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"The habit '{params['name']}' does not exist.")
+        return HTTPStatus.OK, {"habit": _habit(habit)}
+
+
+    async def set_interval(self, user_id, params, query, body):
+        return _result(await self._write(lambda db: HabitService(db).set_interval(
+            user_id, params["name"], body.get("interval"))))
+
+
+    async def delete_habit(self, user_id, params, query, body):
+        return _result(await self._write(lambda db: HabitService(db).delete_habit(user_id, params["name"])))
+
+
+    async def habit_status(self, user_id, params, query, body):
+        status = await self._read(lambda db: CounterService(db).get_status(user_id, params["name"]))
+        if status is None:
+            raise HttpError(HTTPStatus.NOT_FOUND, f"The habit '{params['name']}' was never checked.")
+        return HTTPStatus.OK, {"status": status}
+
+
+    async def check_in(self, user_id, params, query, body):
+        if not isinstance(body.get("habit"), str):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "'habit' is required.")
+        reps = body.get("reps", 1)
+        if isinstance(reps, bool) or not isinstance(reps, int) or not 1 <= reps <= MAX_HABIT_REP:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"'reps' must be a number from 1 to {MAX_HABIT_REP}.")
+        #A number would be taken as a day number by check_in_many
+        if body.get("date") is not None and not isinstance(body["date"], str):
+            raise HttpError(HTTPStatus.BAD_REQUEST, "'date' must be a date in the format YYYY-MM-DD.")
+        record = {"user_id": user_id, "habit_name": body["habit"], "check_date": body.get("date"), "habit_rep": reps}
+        outcome = await self._check_in(record)
+        return CHECK_IN_STATUS.get(outcome, HTTPStatus.INTERNAL_SERVER_ERROR), {"habit": body["habit"], "date": body.get("date"), "outcome": outcome}
+
+
+    async def streaks(self, user_id, params, query, body):
+        frame = await self._read(lambda db: analyze.recompute_streaks(db.cursor(), user_range=(user_id, user_id)))
+        return HTTPStatus.OK, {"streaks": _frame_records(frame)}
+
+
+    async def completion(self, user_id, params, query, body):
+        try:
+            windows = tuple(int(days) for days in query.get("windows", "7,30,90").split(","))
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "'windows' must be a comma-separated list of days.")
+        frame = await self._read(lambda db: analyze.completion_rates(db.cursor(), user_id=user_id, windows=windows))
+        return HTTPStatus.OK, {"completion": _frame_records(frame)}
+
+
+    async def leaderboard(self, user_id, params, query, body):
+        metric = query.get("metric", "longest")
+        if metric not in LEADERBOARD_METRICS:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"Unknown metric '{metric}'. Choose one of: {', '.join(LEADERBOARD_METRICS)}.")
+        try:
+            k = min(int(query.get("k", 20)), 1000)
+        except ValueError:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "'k' must be a number.")
+        ranked_user = None if query.get("scope") == "all" else user_id
+        entries = await self._read(lambda db: top_streaks(db.cursor(), k, ranked_user, metric))
+        return HTTPStatus.OK, {"leaderboard": entries}
+
+
+    ####HTTP
+
+    async def _dispatch(self, method, target, headers, body):
+        """Method that routes a request to its handler and returns (status, payload)"""
+        url = urlsplit(target)
+        path = unquote(url.path).rstrip("/") or "/"
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        allowed = False
+        for route_method, pattern, handler, needs_session in self.routes:
+            match = pattern.match(path)
+            if not match:
+                continue
+            if route_method != method:
+                allowed = True
+                continue
+            try:
+                payload = json.loads(body) if body else {}
+            except ValueError:
+                raise HttpError(HTTPStatus.BAD_REQUEST, "The body is not valid JSON.")
+            if not isinstance(payload, dict):
+                raise HttpError(HTTPStatus.BAD_REQUEST, "The body must be a JSON object.")
+            user_id = None
+            if needs_session:
+                scheme, _, token = headers.get("authorization", "").partition(" ")
+                if scheme.lower() != "bearer" or not token:
+                    raise HttpError(HTTPStatus.UNAUTHORIZED, "A session token is required (POST /login).")
+                user_id = await self._read(lambda db: UserService(db).session_user(token))
+                if user_id is None:
+                    raise HttpError(HTTPStatus.UNAUTHORIZED, "The session expired or does not exist.")
+            params = match.groupdict()
+            if needs_session:
+                params["token"] = token
+            return await handler(user_id, params, query, payload)
+        if allowed:
+            raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, f"{method} is not allowed on {path}.")
+        raise HttpError(HTTPStatus.NOT_FOUND, f"There is no resource {path}.")
+
+
+    async def _handle_connection(self, reader, writer):
+        """Method that answers the requests of one client connection (kept open between requests)"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode("latin-1").split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                try:
+                    if length > MAX_BODY_BYTES:
+                        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "The request body is too large.")
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self._dispatch(method, target, headers, body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": e.message}
+                except Exception as e:
+                    logging.error(f"{method} {target} failed: {e!r}")
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {"error": str(e)}
+                data = json.dumps(_plain(payload), default=_json_default).encode()
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close" \
+                    and status != HTTPStatus.REQUEST_ENTITY_TOO_LARGE
+                writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+    def warm_up(self):
+        """Method that opens every pooled connection and loads the schema and the small tables into their caches"""
+        connections = [self.read_pool.checkout() for _ in range(self.read_pool.size)]
+        try:
+            for db in connections:
+                for table in ("user", "habits", "habit_state"):
+                    db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+        finally:
+            for db in connections:
+                self.read_pool.checkin(db)
+
+
+    async def serve(self, host="127.0.0.1", port=8080, unix_socket=None):
+        """Method that runs the server (on TCP, or on a Unix domain socket if given) until SIGINT or SIGTERM"""
+        if unix_socket and os.path.exists(unix_socket):
+            #A socket file that nobody listens on is left over from a crashed daemon
+            try:
+                reader, writer = await asyncio.open_unix_connection(unix_socket)
+                writer.close()
+                raise OSError(f"Another daemon is already listening on '{unix_socket}'.")
+            except ConnectionError:
+                os.remove(unix_socket)
+        await self.start()
+        if unix_socket:
+            server = await asyncio.start_unix_server(self._handle_connection, unix_socket)
+            os.chmod(unix_socket, 0o600)
+            address = unix_socket
+        else:
+            server = await asyncio.start_server(self._handle_connection, host, port)
+            address = f"http://{host}:{port}"
+        print(f"Habit tracker server listening on {address} (database '{self.name}').", flush=True)
+        #SIGINT and SIGTERM (e.g. from systemd or kill) stop the server cleanly
+        stopped = asyncio.Event()
+        for signal_number in (signal.SIGINT, signal.SIGTERM):
+            asyncio.get_running_loop().add_signal_handler(signal_number, stopped.set)
+        try:
+            async with server:
+                await stopped.wait()
+        finally:
+            await self.stop()
+            if unix_socket and os.path.exists(unix_socket):
+                os.remove(unix_socket)
+
+
+    async def start(self):
+        """Method that migrates the database, warms up the connections and starts the writer task"""
+        with self.write_pool.connection() as db:
+            migrate_db(db)
+        self.warm_up()
+        self._writes = asyncio.Queue()
+        self._writer_task = asyncio.create_task(self._run_writer())
+
+
+    async def stop(self):
+        """Method that stops the writer task and closes the server"""
+        if self._writer_task is not None:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except asyncio.CancelledError:
+                pass
+        self.close()
+
+
+    def close(self):
+        """Method to stop the thread pools and close the connection pools"""
+        self.readers.shutdown(wait=True)
+        #The writer thread may still use its connection until it is shut down
+        self.writer.shutdown(wait=True)
+        if self._write_db is not None:
+            self.write_pool.checkin(self._write_db)
+            self._write_db = None
+        self.read_pool.close()
+        self.write_pool.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Habit tracker JSON-over-HTTP server")
+    parser.add_argument("--db", default="main_db.db", help="Path of the database file")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--threads", type=int, default=SERVER_THREADS, help="Reader threads")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE, help="Performance profile of the connections")
+    parser.add_argument("--socket", nargs="?", const=DEFAULT_SOCKET,
+                        help=f"Listen on a Unix domain socket instead of TCP (default path: {DEFAULT_SOCKET})")
+    args = parser.parse_args()
+
+    #Per-request messages of the database layer would flood the log
+    logging.getLogger().setLevel(logging.WARNING)
+    try:
+        asyncio.run(HabitTrackerServer(args.db, args.threads, args.profile).serve(args.host, args.port, args.socket))
+        print("The server was stopped.")
+    except OSError as e:
+        print(f"The server could not be started: {e}")
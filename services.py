@@ -0,0 +1,436 @@
+"""
+    This file contains the headless service layer of the habit tracker.
+    The services take plain arguments, run the business logic against the database
+    and return typed results instead of prompting the user or printing.
+    This way the tracker can be driven from scripts, other services and load tests without a terminal.
+    The interactive functions in the manager files and in 'main.py' are thin prompt wrappers around them.
+"""
+
+import sqlite3
+from typing import NamedTuple
+from dates import today, format_day
+from auth import (hash_password, verify_password, create_session, resolve_session, revoke_session,
+                  revoke_user_sessions, SESSION_TTL)
+from db import connection_scope, database_file, get_router, get_write_behind
+from sharding import SHARDED_TABLES
+from habit_cache import habit_cache
+from records import HABIT_COLUMNS, USER_COLUMNS, habit_row, user_row, index_by_name
+from counter_manager import check_in_many, CHECK_IN_INSERTED
+
+#Valid practice intervals of a habit
+HABIT_INTERVALS = ("Daily", "Weekly")
+
+
+####Result types
+
+class HabitStatus(NamedTuple):
+    """The materialized streak and repetition state of one habit"""
+    habit_name: str
+    current_streak: int
+    longest_streak: int
+    last_check_date: str  #YYYY-MM-DD
+    total_reps: int
+
+
+class CheckInResult(NamedTuple):
+    """The outcome of checking a habit on a given date (see the CHECK_IN_* outcomes in counter_manager.py)"""
+    habit_name: str
+    check_date: str
+    outcome: str
+
+    @property
+    def ok(self):
+        return self.outcome == CHECK_IN_INSERTED
+
+
+class ServiceResult(NamedTuple):
+    """The outcome of a service operation that changes data"""
+    ok: bool
+    message: str
+
+
+####Services
+
+class HabitService:
+    def __init__(self, db_connection, cache=habit_cache):
+
+        """
+        A service to list, create, delete and edit the habits of a user.
+
+        :param db_connection: sqlite3.Connection or db.ConnectionPool
+            The database connection (or pool of connections) used to interact with the database.
+        :param cache: habit_cache.HabitCache or None
+            The cache of habit catalogs (the central one by default, None to always read the database).
+            In-memory databases are never cached, as they have no file to key their catalogs by.
+        """
+
+        self.db = db_connection
+        self.cache = cache
+        self._database = None
+
+
+    def _cache_key(self):
+        """Method that returns the database file the catalogs of this service are cached under ('' if not cached)"""
+        if self.cache is None:
+            return ""
+        if self._database is None:
+            with connection_scope(self.db) as db:
+                self._database = database_file(db)
+        return self._database
+
+
+    def catalog(self, user_id):
+        """Method that returns the habit catalog of a user: a dict of habit name -> HabitRecord (custom habits first)"""
+        database = self._cache_key()
+        catalog = self.cache.get(database, user_id) if database else None
+        if catalog is not None:
+            return catalog
+        with connection_scope(self.db) as db:
+            cur = db.cursor()
+            cur.row_factory = habit_row
+            cur.execute(f"SELECT {HABIT_COLUMNS} FROM habits WHERE user_id = ? AND is_custom = 1", (user_id,))
+            habits = cur.fetchall()
+            cur.execute(f"SELECT {HABIT_COLUMNS} FROM habits WHERE is_custom = 0")
+            habits += cur.fetchall()
+        catalog = index_by_name(habits)
+        if database:
+            self.cache.put(database, user_id, catalog)
+        return catalog
+
+
+    def list_habits(self, user_id):
+        """Method that returns all habits of a user (custom first, then predefined) as a list of HabitRecord"""
+        return list(self.catalog(user_id).values())
+
+
+    def get_habit(self, user_id, habit_name):
+        """Method that returns one habit of a user as HabitRecord, or None if it does not exist"""
+        return self.catalog(user_id).get(habit_name)
+
+
+    def _invalidate(self, user_id):
+        """Method to drop the cached catalog of a user after one of their habits changed"""
+        database = self._cache_key()
+        if database:
+            self.cache.invalidate(user_id, database)
+
+
+    def create_habit(self, user_id, habit_name, habit_def, habit_type, habit_interval):
+        """Method to create a custom habit for a user"""
+        if not habit_name:
+            return ServiceResult(False, "The habit name must not be empty.")
+        if habit_interval not in HABIT_INTERVALS:
+            return ServiceResult(False, f"Invalid periodicity '{habit_interval}'. Neither 'Daily' nor 'Weekly'.")
+        with connection_scope(self.db) as db:
+            try:
+                db.execute(
+                    """INSERT INTO habits (user_id, habit_name, habit_def, habit_type, habit_day, habit_interval, is_custom)
+                    VALUES (?, ?, ?, ?, ?, ?, 1)""",
+                    (user_id, habit_name, habit_def, habit_type, today(), habit_interval)
+                )
+                db.commit()
+                self._invalidate(user_id)
+            except sqlite3.IntegrityError:
+                db.rollback()
+                return ServiceResult(False, f"The habit '{habit_name}' already exists.")
+            except sqlite3.Error as e:
+                db.rollback()
+                return ServiceResult(False, f"An error occurred while creating your custom habit: {e}")
+        return ServiceResult(True, f"The habit '{habit_name}' has been successfully saved.")
+
+
+    def delete_habit(self, user_id, habit_name):
+        """Method to delete a custom habit of a user"""
+        with connection_scope(self.db) as db:
+            try:
+                cur = db.execute("DELETE FROM habits WHERE habit_name = ? AND user_id = ?", (habit_name, user_id))
+                if cur.rowcount == 0:
+                    db.rollback()
+                    return ServiceResult(False, f"The habit '{habit_name}' does not exist.")
+                db.commit()
+                self._invalidate(user_id)
+            except sqlite3.Error as e:
+                db.rollback()
+                return ServiceResult(False, f"An error occurred while deleting your habit: {e}")
+        return ServiceResult(True, f"The habit '{habit_name}' was successfully deleted.")
+
+
+    def set_interval(self, user_id, habit_name, habit_interval):
+        """Method to change the periodicity of a custom habit of a user"""
+        if habit_interval not in HABIT_INTERVALS:
+            return ServiceResult(False, f"Invalid periodicity '{habit_interval}'. Neither 'Daily' nor 'Weekly'.")
+        with connection_scope(self.db) as db:
+            try:
+                cur = db.execute("UPDATE habits SET habit_interval = ? WHERE habit_name = ? AND user_id = ?",
+                                 (habit_interval, habit_name, user_id))
+                if cur.rowcount == 0:
+                    db.rollback()
+                    return ServiceResult(False, f"The habit '{habit_name}' does not exist.")
+                db.commit()
+                self._invalidate(user_id)
+            except sqlite3.Error as e:
+                db.rollback()
+                return ServiceResult(False, f"An error occurred while editing your habit: {e}")
+        return ServiceResult(True, f"The periodicity of habit '{habit_name}' has been successfully updated to '{habit_interval}'.")
+
+
+class CounterService:
+    def __init__(self, db_connection):
+
+        """
+        A service to check habits, reset streaks and read the streak state of habits.
+
+        :param db_connection: sqlite3.Connection or db.ConnectionPool
+            The database connection (or pool of connections) used to interact with the database.
+        """
+
+        self.db = db_connection
+
+
+    def check_in(self, user_id, habit_name, check_date=None):
+        """Method to mark a habit as checked (today by default) and return a CheckInResult"""
+        check_date = check_date or format_day(today())
+        outcome = self.check_in_many([{"user_id": user_id, "habit_name": habit_name, "check_date": check_date}])[0]
+        return CheckInResult(habit_name, check_date, outcome)
+
+
+    def check_in_many(self, records):
+        """Method to check in a batch of records in one transaction (see counter_manager.check_in_many)"""
+        write_behind = get_write_behind()
+        if write_behind is not None and write_behind.writes_to(self.db):
+            #Write-behind mode: the records of concurrent callers share group commits
+            return write_behind.check_in_many(records)
+        with connection_scope(self.db) as db:
+            return check_in_many(db, records)
+
+
+    def reset_streak(self, user_id, habit_name):
+        """Method to manually reset the streak of a habit"""
+        with connection_scope(self.db) as db:
+            try:
+                db.execute("UPDATE counter SET habit_streak = 0 WHERE habit_name = ? AND user_id = ?",
+                           (habit_name, user_id))
+                #Keep the materialized habit state in the same transaction
+                db.execute("UPDATE habit_state SET current_streak = 0 WHERE habit_name = ? AND user_id = ?",
+                           (habit_name, user_id))
+                db.commit()
+            except sqlite3.Error as e:
+                db.rollback()
+                return ServiceResult(False, f"An error occurred while resetting streak for '{habit_name}': {e}")
+        return ServiceResult(True, f"The streak for '{habit_name}' has been manually reset.")
+
+
+    def get_status(self, user_id, habit_name):
+        """Method that returns the HabitStatus of a habit, or None if it was never checked"""
+        with connection_scope(self.db) as db:
+            row = db.execute(
+                """SELECT habit_name, current_streak, longest_streak, last_check_day, total_reps
+                FROM habit_state WHERE user_id = ? AND habit_name = ?""",
+                (user_id, habit_name)
+            ).fetchone()
+        if row is None:
+            return None
+        habit_name, current_streak, longest_streak, last_check_day, total_reps = row
+        return HabitStatus(habit_name, current_streak, longest_streak, format_day(last_check_day), total_reps)
+
+
+class UserService:
+    def __init__(self, db_connection):
+
+        """
+        A service to create, authenticate, change and delete user profiles.
+
+        :param db_connection: sqlite3.Connection or db.ConnectionPool
+            The database connection (or pool of connections) used to interact with the database.
+        """
+
+        self.db = db_connection
+
+
+    def name_taken(self, user_name):
+        """Method that checks whether a user name is already in use"""
+        with connection_scope(self.db) as db:
+            return db.execute("SELECT 1 FROM user WHERE user_name = ?", (user_name,)).fetchone() is not None
+
+
+    def get_user(self, identifier):
+        """Method that returns the UserRecord for a user name or user ID, or None if there is no such user"""
+        with connection_scope(self.db) as db:
+            cur = db.cursor()
+            cur.row_factory = user_row
+            #Two probes on the primary key and on idx_user_name (an OR of both columns scans the table)
+            cur.execute(f"SELECT {USER_COLUMNS} FROM user WHERE user_id = ?", (identifier,))
+            user = cur.fetchone()
+            if user is None:
+                cur.execute(f"SELECT {USER_COLUMNS} FROM user WHERE user_name = ? LIMIT 1", (identifier,))
+                user = cur.fetchone()
+            return user
+
+
+    def find_user(self, identifier):
+        """Method that returns the user ID for a user name or user ID, or None if there is no such user"""
+        user = self.get_user(identifier)
+        return user.user_id if user else None
+
+
+    def verify(self, identifier, user_pwd):
+        """
+        Method that checks a password without writing to the database
+
+        :return: (user ID, new hash); the user ID is None if the login failed, the new hash is None
+            unless the stored hash is plaintext or outdated and should be replaced (see open_session)
+        """
+        user = self.get_user(identifier)
+        if user is None:
+            return None, None
+        matches, needs_rehash = verify_password(user_pwd, user.user_pwd)
+        if not matches:
+            return None, None
+        return user.user_id, hash_password(user_pwd) if needs_rehash else None
+
+
+    def authenticate(self, identifier, user_pwd):
+        """Method that returns the user ID if the password matches the user name or user ID, otherwise None"""
+        user_id, new_hash = self.verify(identifier, user_pwd)
+        if new_hash is not None:
+            #Plaintext passwords and hashes with an outdated cost are upgraded on login
+            self._update_user("UPDATE user SET user_pwd = ? WHERE user_id = ?", (new_hash, user_id),
+                              "Password hash upgraded.")
+        return user_id
+
+
+    def open_session(self, user_id, ttl=SESSION_TTL, new_hash=None):
+        """Method that stores a new session of a verified user (and an upgraded password hash) and returns its token"""
+        with connection_scope(self.db) as db:
+            try:
+                if new_hash is not None:
+                    db.execute("UPDATE user SET user_pwd = ? WHERE user_id = ?", (new_hash, user_id))
+                token = create_session(db, user_id, ttl)
+                db.commit()
+            except sqlite3.Error:
+                db.rollback()
+                raise
+        return token
+
+
+    def login(self, identifier, user_pwd, ttl=SESSION_TTL):
+        """Method that verifies the password once and returns a session token, or None if the login failed"""
+        user_id, new_hash = self.verify(identifier, user_pwd)
+        if user_id is None:
+            return None
+        return self.open_session(user_id, ttl, new_hash)
+
+
+    def session_user(self, token):
+        """Method that returns the user ID of a valid session token (without the password hash), or None"""
+        with connection_scope(self.db) as db:
+            return resolve_session(db, token)
+
+
+    def logout(self, token):
+        """Method to end a session"""
+        with connection_scope(self.db) as db:
+            try:
+                revoke_session(db, token)
+                db.commit()
+            except sqlite3.Error as e:
+                db.rollback()
+                return ServiceResult(False, f"An error occurred while logging out: {e}")
+        return ServiceResult(True, "You were logged out.")
+
+
+    def create_user(self, user_id, user_name, user_pwd):
+        """Method to create a new user profile"""
+        router = get_router()
+        with connection_scope(self.db) as db:
+            try:
+                db.execute("INSERT INTO user (user_id, user_name, user_pwd) VALUES (?, ?, ?)",
+                           (user_id, user_name, hash_password(user_pwd)))
+                if router is not None:
+                    #In sharded mode the user is placed on a shard together with the profile
+                    router.place_user(db, user_id)
+                db.commit()
+            except sqlite3.IntegrityError:
+                db.rollback()
+                return ServiceResult(False, f"The user ID '{user_id}' is already taken.")
+            except sqlite3.Error as e:
+                db.rollback()
+                return ServiceResult(False, f"Error creating user: {e}")
+        return ServiceResult(True, "User created successfully!")
+
+
+    def change_name(self, user_id, new_user_name):
+        """Method to change the user name of a profile"""
+        if self.name_taken(new_user_name):
+            return ServiceResult(False, "This user name is already taken. Please choose a different one.")
+        return self._update_user("UPDATE user SET user_name = ? WHERE user_id = ?", (new_user_name, user_id),
+                                 f"User name changed to '{new_user_name}'.")
+
+
+    def change_pwd(self, user_id, new_user_pwd):
+        """Method to change the password of a profile and end all of its sessions"""
+        return self._update_user("UPDATE user SET user_pwd = ? WHERE user_id = ?",
+                                 (hash_password(new_user_pwd), user_id),
+                                 "Password changed successfully.", revoke_user=user_id)
+
+
+    def change_id(self, user_id, new_user_id):
+        """Method to change the user ID of a profile together with all of its habits and counters"""
+        router = get_router()
+        with connection_scope(self.db) as db:
+            try:
+                db.execute("UPDATE user SET user_id = ? WHERE user_id = ?", (new_user_id, user_id))
+                revoke_user_sessions(db, user_id)
+                if router is None:
+                    for table in SHARDED_TABLES:
+                        db.execute(f"UPDATE {table} SET user_id = ? WHERE user_id = ?", (new_user_id, user_id))
+                else:
+                    #In sharded mode the habits and counters live on the user's shard; the user row
+                    #and the directory entry are committed together below
+                    router.change_user_id(db, user_id, new_user_id)
+                db.commit()
+                habit_cache.invalidate(user_id)
+            except sqlite3.IntegrityError:
+                db.rollback()
+                return ServiceResult(False, f"The user ID '{new_user_id}' is already taken.")
+            except sqlite3.Error as e:
+                db.rollback()
+                return ServiceResult(False, f"An error occurred when changing profile: {e}")
+        return ServiceResult(True, f"User ID changed to '{new_user_id}'.")
+
+
+    def delete_user(self, user_id, user_pwd):
+        """Method to delete a profile after verifying its password"""
+        if self.authenticate(user_id, user_pwd) != user_id:
+            return ServiceResult(False, "Password or user ID were incorrect. Account deletion was canceled.")
+        router = get_router()
+        with connection_scope(self.db) as db:
+            try:
+                #The habits, counters and streak records of the user are deleted with the profile
+                if router is None:
+                    for table in SHARDED_TABLES:
+                        db.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+                else:
+                    router.delete_user(db, user_id)
+                db.execute("DELETE FROM user WHERE user_id = ?", (user_id,))
+                revoke_user_sessions(db, user_id)
+                db.commit()
+            except sqlite3.Error as e:
+                db.rollback()
+                return ServiceResult(False, f"An error occurred when changing profile: {e}")
+        habit_cache.invalidate(user_id)
+        return ServiceResult(True, "Your User account was successfully deleted.")
+
+
+    def _update_user(self, statement, params, message, revoke_user=None):
+        """Method that runs a single statement on the user table in its own transaction (optionally ending the user's sessions)"""
+        with connection_scope(self.db) as db:
+            try:
+                db.execute(statement, params)
+                if revoke_user is not None:
+                    revoke_user_sessions(db, revoke_user)
+                db.commit()
+            except sqlite3.Error as e:
+                db.rollback()
+                return ServiceResult(False, f"An error occurred when changing profile: {e}")
+        return ServiceResult(True, message)
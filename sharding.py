@@ -0,0 +1,322 @@
+"""
+    This file contains the optional sharded storage mode of the habit tracker.
+    In sharded mode the habits, counters and habit states of every user live in one of N shard
+    database files, so users on different shards do not contend for the same SQLite write lock.
+    A small directory database holds the user table (for the authentication lookups) and the
+    'user_shard' table that records the shard of every user. New users are placed by consistent
+    hashing of their user ID; the directory entry is authoritative afterwards, so users can be
+    moved between shards by the rebalancing tool without changing their ID.
+    Sharded mode is enabled with db.enable_sharding() or the environment variables
+    HABIT_TRACKER_SHARDS=shard0.db,shard1.db,... and HABIT_TRACKER_DIRECTORY=directory.db.
+    Usage: python sharding.py rebalance --directory directory.db --shards shard0.db shard1.db shard2.db
+"""
+
+import argparse
+import bisect
+import hashlib
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from db import ConnectionPool, DEFAULT_PROFILE, create_tables, migrate_db
+
+#Virtual nodes per shard on the hash ring (more nodes spread the users more evenly)
+RING_REPLICAS = 100
+
+#Tables whose rows belong to one user and are stored on the user's shard
+SHARDED_TABLES = ("habits", "counter", "habit_state", "streak_breaks")
+
+
+class ShardConnection(sqlite3.Connection):
+    """
+    A connection to a shard. The user table lives in the directory and the router only routes users
+    that have a directory entry, so check-ins on a shard do not look for the user (see HabitLookup).
+    """
+    is_shard = True
+
+
+class HashRing:
+    """
+    A consistent hash ring that maps keys (user IDs) to shards.
+    Adding or removing a shard only moves the keys between the changed shard and its neighbours.
+
+    :param shards: list
+        Names of the shards (paths of the shard files).
+    :param replicas: int
+        Number of virtual nodes per shard.
+    """
+
+    def __init__(self, shards, replicas=RING_REPLICAS):
+        if not shards:
+            raise ValueError("A hash ring needs at least one shard.")
+        self.shards = list(shards)
+        points = sorted((self._hash(f"{shard}#{replica}"), shard)
+                        for shard in self.shards for replica in range(replicas))
+        self._points = [point for point, shard in points]
+        self._owners = [shard for point, shard in points]
+
+
+    @staticmethod
+    def _hash(key):
+        """Method that returns a stable 64-bit hash of a string (the same in every process)"""
+        return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+    def shard_for(self, key):
+        """Method that returns the shard of a key: the first virtual node clockwise of its hash"""
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[index]
+
+
+class ShardRouter:
+    """
+    Routes every user to the connection of their shard.
+    The directory database is the central database of db.get_db(); the shards are opened lazily
+    with one connection pool each and are initialized with the habit tracker schema on first use.
+    The router may be shared between threads.
+
+    :param directory: str
+        Path of the directory database.
+    :param shards: list
+        Paths of the shard databases.
+    :param pool_size: int
+        Maximum number of connections per shard.
+    :param profile: str
+        Performance profile of the shard connections (see db.PROFILES).
+    """
+
+    def __init__(self, directory="directory.db", shards=(), pool_size=5, profile=DEFAULT_PROFILE):
+        self.directory = directory
+        self.ring = HashRing(shards)
+        self.pool_size = pool_size
+        self.profile = profile
+        self._pools = {}
+        self._checked_out = []
+        self._lock = threading.RLock()
+
+
+    @property
+    def shards(self):
+        return self.ring.shards
+
+
+    def init_directory(self, directory_db):
+        """
+        Method to bring the directory database to the current schema and create the user_shard table.
+        Users that were created before sharded mode was enabled are placed on the ring.
+        """
+        create_tables(directory_db.cursor(), directory_db)
+        migrate_db(directory_db)
+        directory_db.execute("""CREATE TABLE IF NOT EXISTS user_shard (
+                                user_id TEXT PRIMARY KEY,
+                                shard TEXT NOT NULL)
+                             """)
+        directory_db.execute("CREATE INDEX IF NOT EXISTS idx_user_shard_shard ON user_shard (shard)")
+        unplaced = directory_db.execute("""SELECT user_id FROM user
+                                           WHERE user_id NOT IN (SELECT user_id FROM user_shard)""").fetchall()
+        for user_id, in unplaced:
+            self.place_user(directory_db, user_id)
+        directory_db.commit()
+
+
+    def pool(self, shard):
+        """Method that returns the connection pool of a shard (the shard is initialized on first use)"""
+        with self._lock:
+            if shard not in self._pools:
+                pool = ConnectionPool(shard, self.pool_size, profile=self.profile, factory=ShardConnection)
+                with pool.connection() as db:
+                    init_shard(db)
+                self._pools[shard] = pool
+            return self._pools[shard]
+
+
+    @staticmethod
+    def placed_shard(directory_db, user_id):
+        """Method that returns the recorded shard of a user, or None if the user has no shard"""
+        row = directory_db.execute("SELECT shard FROM user_shard WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+
+    def place_user(self, directory_db, user_id):
+        """Method to record the shard of a new user, chosen on the hash ring (the caller commits the directory)"""
+        shard = self.ring.shard_for(user_id)
+        directory_db.execute("INSERT OR IGNORE INTO user_shard (user_id, shard) VALUES (?, ?)", (user_id, shard))
+        logging.info(f"User '{user_id}' was placed on shard '{shard}'.")
+        return shard
+
+
+    def shard_of(self, directory_db, user_id):
+        """Method that returns the shard of a user; users without a directory entry raise KeyError"""
+        shard = self.placed_shard(directory_db, user_id)
+        if shard is None:
+            raise KeyError(f"The user '{user_id}' has no shard.")
+        return shard
+
+
+    @contextmanager
+    def connection_for(self, directory_db, user_id):
+        """Context manager that checks out a connection of a user's shard for the duration of a 'with' block"""
+        with self.pool(self.shard_of(directory_db, user_id)).connection() as db:
+            yield db
+
+
+    def checkout(self, directory_db, user_id):
+        """Method that checks out a connection of a user's shard for a long-lived caller (e.g. a CLI session); close() returns it"""
+        pool = self.pool(self.shard_of(directory_db, user_id))
+        db = pool.checkout()
+        with self._lock:
+            self._checked_out.append((pool, db))
+        return db
+
+
+    def _update_shard(self, shard, statement, user_id, *params):
+        """Method that runs a statement with the given parameters followed by user_id on every sharded table of a shard"""
+        with self.pool(shard).connection() as db:
+            try:
+                for table in SHARDED_TABLES:
+                    db.execute(statement.format(table=table), (*params, user_id))
+                db.commit()
+            except sqlite3.Error:
+                db.rollback()
+                raise
+
+
+    def change_user_id(self, directory_db, user_id, new_user_id):
+        """Method to re-key the shard rows and the directory entry of a user whose ID was changed (the caller commits the directory)"""
+        shard = self.placed_shard(directory_db, user_id)
+        if shard is None:
+            return
+        self._update_shard(shard, "UPDATE {table} SET user_id = ? WHERE user_id = ?", user_id, new_user_id)
+        directory_db.execute("UPDATE user_shard SET user_id = ? WHERE user_id = ?", (new_user_id, user_id))
+
+
+    def delete_user(self, directory_db, user_id):
+        """Method to delete the shard rows and the directory entry of a user (the caller commits the directory)"""
+        shard = self.placed_shard(directory_db, user_id)
+        if shard is None:
+            return
+        self._update_shard(shard, "DELETE FROM {table} WHERE user_id = ?", user_id)
+        directory_db.execute("DELETE FROM user_shard WHERE user_id = ?", (user_id,))
+
+
+    def close(self):
+        """Method to return the connections of checkout() and close all shard pools"""
+        with self._lock:
+            for pool, db in self._checked_out:
+                pool.checkin(db)
+            self._checked_out = []
+            for pool in self._pools.values():
+                pool.close()
+            self._pools = {}
+
+
+def init_shard(db):
+    """Function that brings a shard database to the current schema and inserts the predefined habits"""
+    from habit_manager import create_predef_habits
+    cur = db.cursor()
+    create_tables(cur, db)
+    migrate_db(db)
+    cur.execute("SELECT COUNT(*) FROM habits WHERE is_custom = 0")
+    if cur.fetchone()[0] == 0:
+        create_predef_habits(cur, db)
+
+
+def move_user(router, directory_db, user_id, target):
+    """
+    Function that moves all rows of a user to another shard.
+    The rows are copied first, then the directory is switched to the target and only then are the
+    rows deleted from the source, so an interrupted move never loses data and can simply be repeated.
+    Writes of the user should be stopped while they are moved.
+
+    :param router: ShardRouter
+    :param directory_db: Connection of the directory database
+    :param user_id: ID of the user to move
+    :param target: Shard to move the user to
+    :return: Number of copied rows
+    """
+    source = router.shard_of(directory_db, user_id)
+    if source == target:
+        return 0
+    router.pool(source)
+    copied = 0
+    with router.pool(target).connection() as db:
+        db.execute("ATTACH DATABASE ? AS source", (source,))
+        try:
+            cur = db.cursor()
+            cur.execute("BEGIN")
+            for table in SHARDED_TABLES:
+                #Columns by name, so that shards created by different schema versions may order them differently
+                columns = ", ".join(row[1] for row in cur.execute(f"PRAGMA main.table_info({table})").fetchall())
+                cur.execute(f"INSERT OR REPLACE INTO main.{table} ({columns}) SELECT {columns} FROM source.{table} WHERE user_id = ?",
+                            (user_id,))
+                copied += cur.rowcount
+            db.commit()
+            directory_db.execute("UPDATE user_shard SET shard = ? WHERE user_id = ?", (target, user_id))
+            directory_db.commit()
+            cur.execute("BEGIN")
+            for table in SHARDED_TABLES:
+                cur.execute(f"DELETE FROM source.{table} WHERE user_id = ?", (user_id,))
+            db.commit()
+        except sqlite3.Error:
+            db.rollback()
+            raise
+        finally:
+            db.execute("DETACH DATABASE source")
+    logging.info(f"User '{user_id}' was moved from '{source}' to '{target}' ({copied} rows).")
+    return copied
+
+
+def rebalance(router, directory_db, shards, progress=None):
+    """
+    Function that moves every user whose shard differs from their place on a new hash ring
+
+    :param router: ShardRouter (its ring is replaced by the ring of the new shards)
+    :param directory_db: Connection of the directory database
+    :param shards: Paths of the new list of shards
+    :param progress: Optional function called with (moved users, users to move) after every user
+    :return: Number of moved users
+    """
+    router.ring = HashRing(shards)
+    placements = directory_db.execute("SELECT user_id, shard FROM user_shard").fetchall()
+    moves = [(user_id, router.ring.shard_for(user_id)) for user_id, shard in placements
+             if shard != router.ring.shard_for(user_id)]
+    for number, (user_id, target) in enumerate(moves, 1):
+        move_user(router, directory_db, user_id, target)
+        if progress:
+            progress(number, len(moves))
+    return len(moves)
+
+
+def shard_status(directory_db):
+    """Function that returns the number of users on each shard"""
+    return dict(directory_db.execute("SELECT shard, COUNT(*) FROM user_shard GROUP BY shard ORDER BY shard").fetchall())
+
+
+if __name__ == "__main__":
+    from db import enable_sharding, get_db, close_db
+
+    parser = argparse.ArgumentParser(description="Habit tracker shard maintenance")
+    parser.add_argument("command", choices=["status", "rebalance", "move"])
+    parser.add_argument("--directory", default="directory.db", help="Path of the directory database")
+    parser.add_argument("--shards", nargs="+", required=True, help="Paths of the shard databases (new list for rebalance)")
+    parser.add_argument("--user", help="User ID to move (move)")
+    parser.add_argument("--to", help="Target shard (move)")
+    args = parser.parse_args()
+
+    router = enable_sharding(args.shards, args.directory)
+    directory_db = get_db()
+    try:
+        if args.command == "rebalance":
+            moved = rebalance(router, directory_db, args.shards,
+                              progress=lambda done, total: print(f"{done}/{total} users moved...", end="\r"))
+            print(f"\n{moved} users were moved.")
+        elif args.command == "move":
+            if not args.user or args.to not in args.shards:
+                parser.error("move needs --user and a --to shard from --shards")
+            print(f"{move_user(router, directory_db, args.user, args.to)} rows were moved.")
+        for shard, users in shard_status(directory_db).items():
+            print(f"{shard}: {users} users")
+    except sqlite3.Error as e:
+        print(f"The shard maintenance failed: {e}")
+    finally:
+        close_db()
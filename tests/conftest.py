@@ -0,0 +1,39 @@
+"""
+    Shared fixtures of the habit tracker tests.
+    Every test gets its own initialized database file (tables, migrations, predefined habits and the
+    test user 'test0101'), so that tests never touch main_db.db or each other's data.
+"""
+
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db import initialize_db  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """Path of a freshly initialized database"""
+    path = str(tmp_path / "test.db")
+    db = sqlite3.connect(path)
+    initialize_db(db.cursor(), db)
+    db.close()
+    return path
+
+
+@pytest.fixture
+def db(db_path):
+    """Connection to a freshly initialized database"""
+    connection = sqlite3.connect(db_path, check_same_thread=False)
+    yield connection
+    connection.close()
+
+
+def habit_state(db, user_id, habit_name):
+    """Function that returns (current streak, longest streak, last check day, total reps) of a habit"""
+    return db.execute("""SELECT current_streak, longest_streak, last_check_day, total_reps FROM habit_state
+                         WHERE user_id = ? AND habit_name = ?""", (user_id, habit_name)).fetchone()
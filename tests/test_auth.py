@@ -0,0 +1,62 @@
+import time
+
+import pytest
+
+import auth
+from auth import hash_password, verify_password, session_cache
+from services import UserService
+
+USER = "test0101"
+
+
+@pytest.fixture(autouse=True)
+def empty_session_cache():
+    session_cache.invalidate()
+    yield
+    session_cache.invalidate()
+
+
+def test_hash_round_trip_and_rehash():
+    stored = hash_password("secret")
+    assert verify_password("secret", stored) == (True, False)
+    assert verify_password("wrong", stored) == (False, False)
+    legacy = hash_password("secret", "pbkdf2_sha256", {"iterations": 1000})
+    assert verify_password("secret", legacy) == (True, True)
+    assert verify_password("secret", "secret") == (True, True)
+
+
+@pytest.mark.parametrize("stored", ["scrypt$n=16384$00ff$00ff", "scrypt$n=16384,r=8,p=1,x=1$00ff$00ff",
+                                    "pbkdf2_sha256$rounds=1000$00ff$00ff", "scrypt$n=3,r=8,p=1$00ff$00ff",
+                                    "scrypt$n=16384,r=8,p=1$zz$00ff"])
+def test_malformed_hashes_do_not_raise(stored):
+    assert verify_password("secret", stored)[0] is False
+
+
+def test_login_session_and_logout(db):
+    service = UserService(db)
+    assert service.login("testuser", "wrong") is None
+    token = service.login("testuser", "pwd123!")
+    assert service.session_user(token) == USER
+    service.logout(token)
+    assert service.session_user(token) is None
+
+
+def test_expired_sessions_are_rejected_and_purged(db):
+    token = UserService(db).login(USER, "pwd123!", ttl=-1)
+    assert UserService(db).session_user(token) is None
+    assert auth.purge_sessions(db) == 1
+
+
+def test_password_change_ends_cached_sessions(db):
+    service = UserService(db)
+    token = service.login(USER, "pwd123!")
+    assert service.session_user(token) == USER
+    assert service.change_pwd(USER, "new-password").ok
+    assert service.session_user(token) is None
+    assert service.authenticate(USER, "new-password") == USER
+
+
+def test_session_cache_expires_entries():
+    session_cache.put("hash", USER, time.time() + 3600, now=0)
+    assert session_cache.get("hash", now=1) == USER
+    assert session_cache.get("hash", now=session_cache.ttl + 1) is None
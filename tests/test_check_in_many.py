@@ -0,0 +1,88 @@
+import sqlite3
+import threading
+
+import pytest
+
+from conftest import habit_state
+from counter_manager import (check_in_many, CHECK_IN_INSERTED, CHECK_IN_DUPLICATE, CHECK_IN_OUT_OF_ORDER,
+                             CHECK_IN_UNKNOWN_HABIT, CHECK_IN_INVALID, CHECK_IN_UNKNOWN_USER)
+
+USER = "test0101"
+DAILY = "Journaling"
+WEEKLY = "Jogging"
+
+
+def record(habit_name, check_date, **extra):
+    return {"user_id": USER, "habit_name": habit_name, "check_date": check_date, **extra}
+
+
+def test_streaks_build_up_in_date_order(db):
+    outcomes = check_in_many(db, [record(DAILY, "2025-01-03"), record(DAILY, "2025-01-01"),
+                                  record(DAILY, "2025-01-02"), record(WEEKLY, "2025-01-01")])
+    assert outcomes == [CHECK_IN_INSERTED] * 4
+    assert habit_state(db, USER, DAILY)[:2] == (3, 3)
+    assert habit_state(db, USER, WEEKLY)[:2] == (1, 1)
+
+
+def test_duplicate_out_of_order_and_unknown_habit(db):
+    check_in_many(db, [record(DAILY, "2025-01-05")])
+    outcomes = check_in_many(db, [record(DAILY, "2025-01-05"), record(DAILY, "2025-01-04"),
+                                  record("No such habit", "2025-01-05")])
+    assert outcomes == [CHECK_IN_DUPLICATE, CHECK_IN_OUT_OF_ORDER, CHECK_IN_UNKNOWN_HABIT]
+
+
+def test_unknown_user_is_rejected(db):
+    #The default lookup only loads the users of the batch, it must still check that they exist
+    outcomes = check_in_many(db, [{"user_id": "ghost", "habit_name": DAILY, "check_date": "2024-06-03"},
+                                  record(DAILY, "2024-06-03")])
+    assert outcomes == [CHECK_IN_UNKNOWN_USER, CHECK_IN_INSERTED]
+    assert db.execute("SELECT COUNT(*) FROM counter WHERE user_id = 'ghost'").fetchone()[0] == 0
+    assert habit_state(db, "ghost", DAILY) is None
+
+
+def test_service_check_in_of_unknown_user(db):
+    from services import CounterService
+    assert CounterService(db).check_in("ghost", "Yoga", "2024-06-03").outcome == CHECK_IN_UNKNOWN_USER
+    assert habit_state(db, "ghost", "Yoga") is None
+
+
+@pytest.mark.parametrize("habit_rep", ["x", None, -1, 2.5, True, [1], 10 ** 30])
+def test_invalid_reps_do_not_raise(db, habit_rep):
+    records = [record(DAILY, "2025-01-01", habit_rep=habit_rep), record(WEEKLY, "2025-01-01")]
+    outcomes = check_in_many(db, records)
+    #None means "not given" like a missing check_date, every other value is rejected
+    expected = CHECK_IN_INSERTED if habit_rep is None else CHECK_IN_INVALID
+    assert outcomes == [expected, CHECK_IN_INSERTED]
+    assert not db.in_transaction
+
+
+def test_reps_are_summed_into_habit_state(db):
+    check_in_many(db, [record(DAILY, "2025-01-01", habit_rep="2"), record(DAILY, "2025-01-02", habit_rep=3)])
+    assert habit_state(db, USER, DAILY)[3] == 5
+
+
+def test_concurrent_writers_do_not_share_a_stale_state(db_path):
+    #Two connections check in the following days of the same habit at the same time;
+    #with the write lock taken before the state is read, the second writer sees the first one's state
+    connections = [sqlite3.connect(db_path, timeout=10, check_same_thread=False) for _ in range(2)]
+    check_in_many(connections[0], [record(DAILY, "2025-01-01")])
+    barrier = threading.Barrier(2)
+
+    def check_in(connection, check_date):
+        barrier.wait()
+        check_in_many(connection, [record(DAILY, check_date)])
+
+    threads = [threading.Thread(target=check_in, args=(connection, check_date))
+               for connection, check_date in zip(connections, ["2025-01-02", "2025-01-03"])]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    state = habit_state(connections[0], USER, DAILY)
+    assert state[2] is not None
+    rows = connections[0].execute("SELECT COUNT(*) FROM counter WHERE habit_name = ?", (DAILY,)).fetchone()[0]
+    #Either both days were inserted in order (streak 3), or 01-03 came first (streak 1 after a gap)
+    #and 01-02 is out of order; a stale state would insert both days with a wrong streak
+    assert (rows, state[0]) in ((3, 3), (2, 1))
+    for connection in connections:
+        connection.close()
@@ -0,0 +1,55 @@
+import random
+
+import pytest
+
+from analyze import completion_rates
+from dates import format_day
+
+USER = "test0101"
+AS_OF = 20100
+
+
+def naive_rates(db, windows):
+    """The completion rates computed row by row in Python"""
+    habits = db.execute("""SELECT ?, habit_name, habit_interval, habit_day FROM habits WHERE is_custom = 0
+                           UNION ALL
+                           SELECT user_id, habit_name, habit_interval, habit_day FROM habits WHERE is_custom = 1""",
+                        (USER,)).fetchall()
+    rates = {}
+    for user_id, habit_name, interval, habit_day in habits:
+        days = [row[0] for row in db.execute("SELECT check_day FROM counter WHERE user_id = ? AND habit_name = ?",
+                                             (user_id, habit_name))]
+        period = 7 if interval == "Weekly" else 1
+        for window in windows:
+            in_window = [day for day in days if AS_OF - window < day <= AS_OF]
+            completed = len({(AS_OF - day) // 7 for day in in_window}) if period == 7 else len(in_window)
+            span = max(0, min(window, AS_OF - habit_day + 1))
+            rates[(user_id, habit_name, window)] = (completed, -(-span // period))
+    return rates
+
+
+@pytest.fixture
+def history(db):
+    #A custom habit created 20 days before AS_OF has fewer expected periods in the longer windows
+    db.execute("""INSERT INTO habits (user_id, habit_name, habit_type, habit_day, habit_interval, is_custom)
+                  VALUES (?, 'Reading', 'Cognitive', ?, 'Weekly', 1)""", (USER, AS_OF - 19))
+    rng = random.Random(3)
+    for habit_name in ("Yoga", "Jogging", "Reading"):
+        days = sorted(rng.sample(range(AS_OF - 120, AS_OF + 5), 60))
+        db.executemany("INSERT INTO counter (user_id, habit_name, check_day, habit_rep, habit_streak) "
+                       "VALUES (?, ?, ?, 1, 1)", [(USER, habit_name, day) for day in days])
+    db.commit()
+
+
+def test_rates_match_a_row_by_row_count(db, history):
+    windows = (7, 30, 90)
+    frame = completion_rates(db.cursor(), user_id=USER, windows=windows, as_of=format_day(AS_OF))
+    computed = {(row.User, row.Habit, row.Window): (row.Completed, row.Expected) for row in frame.itertuples()}
+    assert computed == naive_rates(db, windows)
+    reading = frame[(frame["Habit"] == "Reading") & (frame["Window"] == 90)].iloc[0]
+    assert reading["Expected"] == 3
+    assert reading["Rate"] == round(reading["Completed"] / 3, 4)
+
+
+def test_no_windows(db):
+    assert completion_rates(db.cursor(), windows=()).empty
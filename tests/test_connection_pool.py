@@ -0,0 +1,92 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from db import ConnectionPool, connection_scope
+
+
+@pytest.fixture
+def pool(db_path):
+    pool = ConnectionPool(db_path, size=2, timeout=0.2)
+    yield pool
+    pool.close()
+
+
+def test_returned_connections_are_reused(pool):
+    with pool.connection() as first:
+        first.execute("SELECT 1")
+    with pool.connection() as second:
+        assert second is first
+
+
+def test_checkout_waits_for_a_free_slot(pool):
+    connections = [pool.checkout(), pool.checkout()]
+    assert connections[0] is not connections[1]
+    with pytest.raises(sqlite3.OperationalError, match="No free connection"):
+        pool.checkout()
+    pool.checkin(connections.pop())
+    connections.append(pool.checkout())
+    for db in connections:
+        pool.checkin(db)
+
+
+def test_no_more_than_size_connections_are_used_at_once(db_path):
+    pool = ConnectionPool(db_path, size=2, timeout=5)
+    in_use, peak = [0], [0]
+    lock = threading.Lock()
+
+    def work():
+        with pool.connection() as db:
+            with lock:
+                in_use[0] += 1
+                peak[0] = max(peak[0], in_use[0])
+            db.execute("SELECT COUNT(*) FROM habits").fetchone()
+            time.sleep(0.01)
+            with lock:
+                in_use[0] -= 1
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    pool.close()
+    assert peak[0] <= 2
+
+
+def test_broken_idle_connections_are_replaced(pool):
+    with pool.connection() as broken:
+        pass
+    broken.close()
+    with pool.connection() as db:
+        assert db is not broken
+        assert db.execute("SELECT COUNT(*) FROM user").fetchone()[0] == 1
+
+
+def test_open_transactions_are_rolled_back_on_checkin(pool):
+    with pool.connection() as db:
+        db.execute("DELETE FROM user")
+        assert db.in_transaction
+    with pool.connection() as db:
+        assert not db.in_transaction
+        assert db.execute("SELECT COUNT(*) FROM user").fetchone()[0] == 1
+
+
+def test_closed_pool(pool):
+    db = pool.checkout()
+    pool.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        pool.checkout()
+    #A connection checked out before the close is closed when it is returned
+    pool.checkin(db)
+    with pytest.raises(sqlite3.ProgrammingError):
+        db.execute("SELECT 1")
+
+
+def test_connection_scope_accepts_pools_and_connections(pool, db):
+    with connection_scope(db) as scoped:
+        assert scoped is db
+    with connection_scope(pool) as scoped:
+        assert isinstance(scoped, sqlite3.Connection) and scoped is not db
@@ -0,0 +1,65 @@
+import os
+import stat
+import subprocess
+import sys
+import time
+
+import pytest
+
+import client
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def daemon(db_path, tmp_path, monkeypatch):
+    """A daemon on a Unix domain socket; the client keeps its token in the test directory"""
+    socket_path = str(tmp_path / "daemon.sock")
+    process = subprocess.Popen([sys.executable, "server.py", "--db", db_path, "--threads", "2", "--socket", socket_path],
+                               cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+    for _ in range(100):
+        if os.path.exists(socket_path) or process.poll() is not None:
+            break
+        time.sleep(0.05)
+    monkeypatch.setattr(client, "TOKEN_FILE", str(tmp_path / "token"))
+    monkeypatch.delenv("HABIT_TRACKER_TOKEN", raising=False)
+    monkeypatch.setattr("getpass.getpass", lambda prompt="": "pwd123!")
+    yield socket_path
+    process.terminate()
+    process.wait(10)
+    #The daemon removes its socket when it is stopped
+    assert not os.path.exists(socket_path)
+
+
+def test_socket_is_private(daemon):
+    assert stat.S_IMODE(os.stat(daemon).st_mode) == 0o600
+
+
+def test_client_commands(daemon, capsys):
+    assert client.main(["--socket", daemon, "login", "testuser"]) == 0
+    assert stat.S_IMODE(os.stat(client.TOKEN_FILE).st_mode) == 0o600
+    assert client.main(["--socket", daemon, "check", "Yoga", "--date", "2025-01-01"]) == 0
+    assert client.main(["--socket", daemon, "check", "Yoga", "--date", "2025-01-01"]) == 1
+    assert client.main(["--socket", daemon, "check", "No such habit"]) == 1
+    assert client.main(["--socket", daemon, "status", "Yoga"]) == 0
+    output = capsys.readouterr().out
+    assert "Logged in as 'test0101'" in output
+    assert "'Yoga': inserted" in output and "'Yoga': duplicate" in output
+    assert "2025-01-01" in output
+
+    assert client.main(["--socket", daemon, "logout"]) == 0
+    assert not os.path.exists(client.TOKEN_FILE)
+    assert client.main(["--socket", daemon, "habits"]) == 1
+
+
+def test_request_returns_status_and_payload(daemon):
+    status, payload = client.request("POST", "/login", {"identifier": "testuser", "password": "pwd123!"},
+                                     socket_path=daemon)
+    assert status == 200 and payload["user_id"] == "test0101"
+    status, payload = client.request("GET", "/habits", token=payload["token"], socket_path=daemon)
+    assert status == 200 and "Yoga" in {habit["name"] for habit in payload["habits"]}
+
+
+def test_client_without_daemon(tmp_path, capsys):
+    assert client.main(["--socket", str(tmp_path / "missing.sock"), "streaks"]) == 2
+    assert "The daemon is not running" in capsys.readouterr().out
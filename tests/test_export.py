@@ -0,0 +1,45 @@
+import csv
+import os
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+from db import create_tables
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_cli_migrates_an_old_database(tmp_path):
+    #A database with the original schema: ISO TEXT dates and no habit_state table
+    path = str(tmp_path / "old.db")
+    db = sqlite3.connect(path)
+    create_tables(db.cursor(), db)
+    db.execute("INSERT INTO counter (user_id, habit_name, check_date, check_time, habit_rep, habit_streak) "
+               "VALUES ('test0101', 'Yoga', '2024-05-15', '08:00:00', 1, 1)")
+    db.commit()
+    db.close()
+
+    output = str(tmp_path / "counter.csv")
+    result = subprocess.run([sys.executable, "export.py", "counter", output, "--db", path],
+                            cwd=ROOT, capture_output=True, text=True)
+    assert result.returncode == 0, result.stdout + result.stderr
+    with open(output, newline="") as csv_file:
+        rows = list(csv.DictReader(csv_file))
+    assert [(row["habit_name"], row["check_date"]) for row in rows] == [("Yoga", "2024-05-15")]
+
+
+def test_parquet_schema_does_not_depend_on_the_first_batch(db, tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    from export import export_table
+    #The predefined habits come first and have no user_id, the custom habit has one
+    db.execute("""INSERT INTO habits (user_id, habit_name, habit_type, habit_day, habit_interval, is_custom)
+                  VALUES ('test0101', 'Reading', 'Cognitive', 20000, 'Weekly', 1)""")
+    db.commit()
+    path = str(tmp_path / "habits.parquet")
+    rows, seconds, rate = export_table(db, "habits", path, batch_size=2)
+    table = pq.read_table(path)
+    assert rows == table.num_rows == 7
+    assert str(table.schema.field("user_id").type) == "string"
+    assert table.column("user_id").to_pylist()[-1] == "test0101"
@@ -0,0 +1,99 @@
+import sqlite3
+
+import pytest
+
+from db import initialize_db
+from habit_cache import HabitCache
+from services import HabitService
+
+USER = "test0101"
+
+
+@pytest.fixture
+def cache():
+    return HabitCache(max_users=2, ttl=30)
+
+
+def open_db(path):
+    db = sqlite3.connect(str(path))
+    initialize_db(db.cursor(), db)
+    return db
+
+
+def test_catalogs_do_not_leak_between_databases(tmp_path, cache):
+    db_a, db_b = open_db(tmp_path / "a.db"), open_db(tmp_path / "b.db")
+    try:
+        assert "OnlyInA" not in HabitService(db_b, cache).catalog(USER)
+        assert HabitService(db_a, cache).create_habit(USER, "OnlyInA", "Only in A", "Physical", "Daily").ok
+        assert "OnlyInA" in HabitService(db_a, cache).catalog(USER)
+        assert "OnlyInA" not in HabitService(db_b, cache).catalog(USER)
+    finally:
+        db_a.close()
+        db_b.close()
+
+
+def test_habit_changes_invalidate_the_catalog(db, cache):
+    service = HabitService(db, cache)
+    assert "Reading" not in service.catalog(USER)
+    assert service.create_habit(USER, "Reading", "Read a book", "Cognitive", "Daily").ok
+    assert service.get_habit(USER, "Reading").interval == "Daily"
+    assert service.set_interval(USER, "Reading", "Weekly").ok
+    assert service.get_habit(USER, "Reading").interval == "Weekly"
+    assert service.delete_habit(USER, "Reading").ok
+    assert service.get_habit(USER, "Reading") is None
+    assert cache.stats()["invalidations"] == 3
+
+
+def test_edits_of_another_process_are_seen_after_the_ttl(db_path, cache):
+    db = sqlite3.connect(db_path)
+    other = sqlite3.connect(db_path)
+    try:
+        service = HabitService(db, cache)
+        service.catalog(USER)
+        #Another process creates a habit without going through this cache
+        assert HabitService(other, None).create_habit(USER, "Reading", "Read a book", "Cognitive", "Daily").ok
+        database, = {key[0] for key in cache._catalogs}
+        assert "Reading" not in cache.get(database, USER)
+        assert cache.get(database, USER, now=cache._catalogs[(database, USER)][1]) is None
+        assert "Reading" in service.catalog(USER)
+        assert cache.stats()["expirations"] == 1
+    finally:
+        db.close()
+        other.close()
+
+
+def test_lru_bound_and_stats(cache):
+    for user_id in ("a", "b", "c"):
+        cache.put("main.db", user_id, {user_id: None}, now=0)
+    assert cache.get("main.db", "a", now=1) is None
+    assert cache.get("main.db", "b", now=1) == {"b": None}
+    cache.put("main.db", "d", {}, now=1)
+    #"b" was used more recently than "c", so "c" is evicted
+    assert cache.get("main.db", "c", now=1) is None
+    assert cache.get("main.db", "b", now=1) is not None
+    stats = cache.stats()
+    assert (stats["size"], stats["hits"], stats["misses"], stats["evictions"]) == (2, 2, 2, 2)
+    assert stats["hit_rate"] == 0.5
+
+
+def test_invalidate_by_user_database_or_all():
+    cache = HabitCache()
+    for database in ("a.db", "b.db"):
+        for user_id in ("u1", "u2"):
+            cache.put(database, user_id, {}, now=0)
+    cache.invalidate("u1")
+    assert sorted(cache._catalogs) == [("a.db", "u2"), ("b.db", "u2")]
+    cache.invalidate(database="a.db")
+    assert list(cache._catalogs) == [("b.db", "u2")]
+    cache.invalidate()
+    assert cache.stats()["size"] == 0
+
+
+def test_in_memory_databases_are_not_cached(cache):
+    db = sqlite3.connect(":memory:")
+    try:
+        initialize_db(db.cursor(), db)
+        HabitService(db, cache).catalog(USER)
+        assert cache.stats()["size"] == 0
+    finally:
+        db.close()
@@ -0,0 +1,14 @@
+from import_budget import measure_imports, check_budget, FORBIDDEN_MODULES
+
+
+def test_main_does_not_import_heavy_modules():
+    loaded = {name.split(".")[0] for name, self_us, cumulative_us in measure_imports("main")}
+    assert "main" in loaded and "services" in loaded
+    assert not loaded.intersection(FORBIDDEN_MODULES)
+
+
+def test_budget_check_reports_forbidden_imports(capsys):
+    #Only the lazy-import rule is checked here, the time budget depends on the machine
+    assert check_budget(budget_ms=10000, module="main")
+    assert not check_budget(budget_ms=10000, module="analyze")
+    assert "must be imported lazily: numpy, pandas" in capsys.readouterr().out
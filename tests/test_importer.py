@@ -0,0 +1,48 @@
+import csv
+
+from conftest import habit_state
+from counter_manager import (CHECK_IN_INSERTED, CHECK_IN_DUPLICATE, CHECK_IN_BACKFILLED, CHECK_IN_INVALID,
+                             CHECK_IN_UNKNOWN_USER, CHECK_IN_UNKNOWN_HABIT)
+from db import rebuild_habit_state
+from importer import import_checkins
+
+USER = "test0101"
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as csv_file:
+        writer = csv.DictWriter(csv_file, ["user_id", "habit_name", "check_date", "habit_rep"])
+        writer.writeheader()
+        for user_id, habit_name, check_date, habit_rep in rows:
+            writer.writerow({"user_id": user_id, "habit_name": habit_name, "check_date": check_date,
+                             "habit_rep": habit_rep})
+
+
+def test_import_outcomes(db, tmp_path):
+    path = str(tmp_path / "checkins.csv")
+    write_csv(path, [(USER, "Journaling", "2025-01-01", ""), (USER, "Journaling", "2025-01-02", "2"),
+                     (USER, "Journaling", "2025-01-02", "1"), ("nobody", "Journaling", "2025-01-01", ""),
+                     (USER, "No such habit", "2025-01-01", ""), (USER, "Journaling", "", ""),
+                     (USER, "Yoga", "2025-01-01", "x")])
+    result = import_checkins(db, path, chunk_size=3)
+    assert result["outcomes"] == {CHECK_IN_INSERTED: 2, CHECK_IN_DUPLICATE: 1, CHECK_IN_UNKNOWN_USER: 1,
+                                  CHECK_IN_UNKNOWN_HABIT: 1, CHECK_IN_INVALID: 2}
+    assert habit_state(db, USER, "Journaling") == (2, 2, habit_state(db, USER, "Journaling")[2], 3)
+
+
+def test_out_of_order_rows_are_backfilled(db, tmp_path):
+    path = str(tmp_path / "checkins.csv")
+    #Jan 3 and 4 arrive first (one chunk), the older Jan 1 and 2 in later chunks
+    write_csv(path, [(USER, "Journaling", "2025-01-03", 1), (USER, "Journaling", "2025-01-04", 1),
+                     (USER, "Journaling", "2025-01-02", 1), (USER, "Journaling", "2025-01-01", 1),
+                     (USER, "Journaling", "2025-01-04", 1)])
+    result = import_checkins(db, path, chunk_size=2)
+    assert result["outcomes"] == {CHECK_IN_INSERTED: 2, CHECK_IN_BACKFILLED: 2, CHECK_IN_DUPLICATE: 1}
+    streaks = db.execute("""SELECT habit_streak FROM counter WHERE user_id = ? AND habit_name = 'Journaling'
+                            ORDER BY check_day""", (USER,)).fetchall()
+    assert [streak for streak, in streaks] == [1, 2, 3, 4]
+    state = habit_state(db, USER, "Journaling")
+    assert state[:2] == (4, 4) and state[3] == 4
+    #The materialized state matches a rebuild from the counter history
+    rebuild_habit_state(db)
+    assert habit_state(db, USER, "Journaling") == state
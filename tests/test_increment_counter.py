@@ -0,0 +1,15 @@
+from conftest import habit_state
+from counter_manager import check_in_many, increment_counter
+from dates import today
+
+USER = "test0101"
+
+
+def test_increment_keeps_the_current_streak(db):
+    check_in_many(db, [{"user_id": USER, "habit_name": "Journaling", "check_date": today() - 2},
+                       {"user_id": USER, "habit_name": "Journaling", "check_date": today() - 1}])
+    increment_counter(db.cursor(), db, "Journaling", USER)
+    current_streak, longest_streak, last_check_day, total_reps = habit_state(db, USER, "Journaling")
+    assert (current_streak, longest_streak, last_check_day, total_reps) == (3, 3, today(), 3)
+    assert db.execute("SELECT habit_streak FROM counter WHERE habit_name = 'Journaling' AND check_day = ?",
+                      (today(),)).fetchone()[0] == 3
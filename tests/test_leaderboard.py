@@ -0,0 +1,42 @@
+import pytest
+
+from leaderboard import top_streaks, iter_leaderboard, LeaderboardEntry
+
+
+@pytest.fixture
+def ranked(db):
+    #Many ties on the streak, so pages end in the middle of a group of equal streaks
+    rows = [(f"user{user:02d}", f"Habit{habit}", (user + habit) % 4, (user * habit) % 5, 20000)
+            for user in range(12) for habit in range(3)]
+    db.executemany("""INSERT INTO habit_state (user_id, habit_name, longest_streak, current_streak, last_check_day)
+                      VALUES (?, ?, ?, ?, ?)""", rows)
+    db.commit()
+    return rows
+
+
+def expected(rows, column, user_id=None):
+    entries = [LeaderboardEntry(row[column], row[0], row[1]) for row in rows if user_id in (None, row[0])]
+    return sorted(entries, reverse=True)
+
+
+@pytest.mark.parametrize("page_size", [1, 5, 7, 36, 100])
+@pytest.mark.parametrize("metric, column", [("longest", 2), ("current", 3)])
+def test_pages_have_no_gaps_or_duplicates(db, ranked, page_size, metric, column):
+    entries = list(iter_leaderboard(db.cursor(), page_size, metric=metric))
+    assert entries == expected(ranked, column)
+
+
+def test_pages_continue_after_the_last_entry(db, ranked):
+    cur = db.cursor()
+    first = top_streaks(cur, 4)
+    second = top_streaks(cur, 4, after=first[-1])
+    assert first + second == expected(ranked, 2)[:8]
+
+
+def test_leaderboard_of_one_user(db, ranked):
+    assert list(iter_leaderboard(db.cursor(), 2, user_id="user03")) == expected(ranked, 2, "user03")
+
+
+def test_unknown_metric(db):
+    with pytest.raises(ValueError):
+        top_streaks(db.cursor(), metric="total")
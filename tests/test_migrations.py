@@ -0,0 +1,110 @@
+import sqlite3
+
+import pytest
+
+from dates import to_day
+from db import migrate_db, get_schema_version, MIGRATIONS
+
+USER = "test0101"
+
+#Schema of an unversioned database before the migrations (dates stored as ISO TEXT)
+BASELINE_SCHEMA = """
+    CREATE TABLE user (
+        user_id TEXT PRIMARY KEY,
+        user_name TEXT NOT NULL,
+        user_pwd TEXT NOT NULL);
+    CREATE TABLE habits (
+        user_id TEXT,
+        habit_name TEXT NOT NULL,
+        habit_def TEXT,
+        habit_type TEXT,
+        habit_date TEXT,
+        habit_interval TEXT,
+        is_custom BOOLEAN DEFAULT 1,
+        PRIMARY KEY (user_id, habit_name),
+        FOREIGN KEY (user_id) REFERENCES user (user_id));
+    CREATE TABLE counter (
+        user_id TEXT,
+        habit_name TEXT,
+        check_date TEXT,
+        check_time, TEXT,
+        habit_rep INTEGER DEFAULT 0,
+        habit_streak INTEGER DEFAULT 0,
+        PRIMARY KEY (user_id, habit_name, check_date),
+        FOREIGN KEY (user_id) REFERENCES user (user_id),
+        FOREIGN KEY (habit_name) REFERENCES habits (habit_name));
+"""
+
+COUNTER_ROWS = [
+    ("2024-06-01", "08:00:00", 1, 1),
+    ("2024-06-02", "08:00:00", 2, 2),
+    ("2024-06-03", "09:30:00", 1, 3),
+    ("2024-06-05", "07:15:00", 4, 1),
+]
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    db = sqlite3.connect(str(tmp_path / "baseline.db"))
+    db.executescript(BASELINE_SCHEMA)
+    db.execute("INSERT INTO user VALUES (?, 'testuser', 'pwd')", (USER,))
+    db.execute("""INSERT INTO habits (habit_name, habit_def, habit_type, habit_date, habit_interval, is_custom)
+                  VALUES ('Yoga', 'Yoga', 'Physical', '2024-05-15', 'Daily', 0)""")
+    db.execute("""INSERT INTO habits VALUES (?, 'Reading', 'Read', 'Cognitive', '2024-05-20', 'Weekly', 1)""", (USER,))
+    db.executemany("INSERT INTO counter (user_id, habit_name, check_date, check_time, habit_rep, habit_streak) "
+                   "VALUES (?, 'Yoga', ?, ?, ?, ?)", [(USER, *row) for row in COUNTER_ROWS])
+    db.commit()
+    yield db
+    db.close()
+
+
+def test_text_dates_become_day_numbers(baseline):
+    assert migrate_db(baseline) == MIGRATIONS[-1][0]
+    counter = baseline.execute("""SELECT check_day, check_time, habit_rep, habit_streak FROM counter
+                                  WHERE user_id = ? AND habit_name = 'Yoga' ORDER BY check_day""", (USER,)).fetchall()
+    assert counter == [(to_day(date), time, rep, streak) for date, time, rep, streak in COUNTER_ROWS]
+    habits = baseline.execute("SELECT habit_name, habit_day, habit_interval FROM habits ORDER BY habit_name").fetchall()
+    assert habits == [("Reading", to_day("2024-05-20"), "Weekly"), ("Yoga", to_day("2024-05-15"), "Daily")]
+
+    #habit_state was filled from the TEXT history and converted with it
+    state = baseline.execute("""SELECT current_streak, longest_streak, last_check_day, total_reps FROM habit_state
+                                WHERE user_id = ? AND habit_name = 'Yoga'""", (USER,)).fetchone()
+    assert state == (1, 3, to_day("2024-06-05"), 8)
+    assert baseline.execute("SELECT COUNT(*) FROM habit_state").fetchone()[0] == 1
+
+    #The old date columns (and the stray TEXT column) are gone
+    counter_columns = [row[1] for row in baseline.execute("PRAGMA table_info(counter)")]
+    assert "check_date" not in counter_columns and "TEXT" not in counter_columns
+    assert baseline.execute("PRAGMA integrity_check").fetchone()[0] == "ok"
+
+
+def test_invalid_iso_dates_are_refused(baseline):
+    baseline.execute("INSERT INTO counter (user_id, habit_name, check_date, habit_rep, habit_streak) "
+                     "VALUES (?, 'Yoga', '2024-13-01', 1, 1)", (USER,))
+    baseline.commit()
+    with pytest.raises(sqlite3.IntegrityError, match="invalid check_date"):
+        migrate_db(baseline)
+    #The failed migration was rolled back: the earlier migrations stay applied, the dates stay TEXT
+    assert get_schema_version(baseline.cursor()) == 4
+    assert baseline.execute("SELECT COUNT(*) FROM counter WHERE check_date LIKE '2024-%'").fetchone()[0] == 5
+    habit_columns = [row[1] for row in baseline.execute("PRAGMA table_info(habits)")]
+    assert "habit_date" in habit_columns and "habit_day" not in habit_columns
+
+
+def test_migrations_are_recorded_and_applied_once(db):
+    versions = [row[0] for row in db.execute("SELECT version FROM schema_version ORDER BY version")]
+    assert versions == [version for version, description, migration in MIGRATIONS]
+    assert migrate_db(db) == versions[-1]
+    assert db.execute("SELECT COUNT(*) FROM schema_version").fetchone()[0] == len(versions)
+
+
+def query_plan(db, sql, params):
+    return " ".join(row[-1] for row in db.execute(f"EXPLAIN QUERY PLAN {sql}", params))
+
+
+def test_lookups_use_the_indexes(db):
+    #The latest check of a habit is read from the covering index alone
+    plan = query_plan(db, """SELECT check_day, habit_streak, habit_rep FROM counter
+                             WHERE user_id = ? AND habit_name = ? ORDER BY check_day DESC LIMIT 1""", (USER, "Yoga"))
+    assert "COVERING INDEX idx_counter_user_habit_day" in plan and "TEMP B-TREE" not in plan
+    assert "INDEX idx_user_name" in query_plan(db, "SELECT user_id FROM user WHERE user_name = ?", ("testuser",))
@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+
+from db import PROFILES, apply_profile, read_profile, use_profile
+
+#Values as reported by "PRAGMA <name>" (synchronous and temp_store are read back as numbers)
+SYNCHRONOUS = {"OFF": 0, "NORMAL": 1, "FULL": 2}
+TEMP_STORE = {"DEFAULT": 0, "FILE": 1, "MEMORY": 2}
+
+
+def effective(profile):
+    settings = dict(PROFILES[profile])
+    settings["journal_mode"] = settings["journal_mode"].lower()
+    settings["synchronous"] = SYNCHRONOUS[settings["synchronous"]]
+    settings["temp_store"] = TEMP_STORE[settings["temp_store"]]
+    return settings
+
+
+@pytest.mark.parametrize("profile", list(PROFILES))
+def test_profiles_are_applied(db_path, profile):
+    db = sqlite3.connect(db_path)
+    try:
+        settings = apply_profile(db, profile)
+        assert settings == read_profile(db)
+        #mmap_size may be capped by the SQLite build, every other PRAGMA is exact
+        assert {pragma: value for pragma, value in settings.items() if pragma != "mmap_size"} == \
+            {pragma: value for pragma, value in effective(profile).items() if pragma != "mmap_size"}
+    finally:
+        db.close()
+
+
+def test_use_profile_restores_the_previous_settings(db_path):
+    db = sqlite3.connect(db_path)
+    try:
+        apply_profile(db, "durable")
+        before = read_profile(db)
+        with use_profile(db, "bulk-load"):
+            assert read_profile(db)["synchronous"] == SYNCHRONOUS["OFF"]
+            db.execute("INSERT INTO user VALUES ('bulk', 'bulk', 'pwd')")
+        assert read_profile(db) == before
+        assert not db.in_transaction
+        assert db.execute("SELECT COUNT(*) FROM user WHERE user_id = 'bulk'").fetchone()[0] == 1
+    finally:
+        db.close()
+
+
+def test_unknown_profile(db):
+    with pytest.raises(ValueError, match="Unknown profile"):
+        apply_profile(db, "fastest")
@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from analyze import recompute_streaks, _streak_frame
+from counter_manager import HabitLookup, _recompute_streaks
+from dates import format_day
+
+USER = "test0101"
+#Predefined habits (Journaling is daily, Jogging weekly) and a custom weekly habit that shadows a daily one
+HABITS = ("Journaling", "Jogging", "Yoga")
+
+
+@pytest.fixture
+def history(db):
+    db.execute("""INSERT INTO habits (user_id, habit_name, habit_type, habit_interval, is_custom)
+                  VALUES (?, 'Yoga', 'Physical', 'Weekly', 1)""", (USER,))
+    rng = random.Random(7)
+    rows = []
+    for habit_name in HABITS:
+        day = 20000
+        for _ in range(60):
+            #Gaps of 1 to 9 days continue a weekly streak up to 7 and a daily streak only at 1
+            day += rng.choice([1, 1, 1, 2, 3, 6, 7, 8, 9])
+            rows.append((USER, habit_name, day, 1, 0))
+    db.executemany("""INSERT INTO counter (user_id, habit_name, check_day, habit_rep, habit_streak)
+                      VALUES (?, ?, ?, ?, ?)""", rows)
+    db.commit()
+    return rows
+
+
+def test_vectorized_streaks_match_the_incremental_rule(db, history):
+    cur = db.cursor()
+    vectorized = {(row.habit_name, row.day): row.streak for row in _streak_frame(cur).itertuples()}
+
+    #_recompute_streaks applies next_streak row by row and stores the result in counter
+    _recompute_streaks(cur, HabitLookup(cur, [USER]), [(USER, habit_name) for habit_name in HABITS])
+    db.commit()
+    incremental = {(habit_name, day): streak for habit_name, day, streak
+                   in db.execute("SELECT habit_name, check_day, habit_streak FROM counter")}
+    assert vectorized == incremental
+    #The history has streaks longer than 1 for both intervals
+    assert all(max(streak for (name, day), streak in incremental.items() if name == habit_name) > 1
+               for habit_name in HABITS)
+
+
+def test_summary_matches_habit_state(db, history):
+    cur = db.cursor()
+    _recompute_streaks(cur, HabitLookup(cur, [USER]), [(USER, habit_name) for habit_name in HABITS])
+    db.commit()
+    last_day = max(row[2] for row in history)
+    frame = recompute_streaks(cur, as_of=format_day(last_day)).set_index("Habit")
+    for habit_name, current, longest, last_check in db.execute(
+            "SELECT habit_name, current_streak, longest_streak, last_check_day FROM habit_state"):
+        assert frame.loc[habit_name, "Longest Streak"] == longest
+        assert frame.loc[habit_name, "Last Check"] == format_day(last_check)
+        #A streak is still current on as_of if the last check is within the habit's interval
+        interval = frame.loc[habit_name, "Interval"]
+        still_current = last_day - last_check <= (7 if interval == "Weekly" else 1)
+        assert frame.loc[habit_name, "Current Streak"] == (current if still_current else 0)
+    assert frame.loc["Yoga", "Interval"] == "Weekly"
+
+
+def test_streaks_are_broken_after_the_interval(db, history):
+    last_day = max(row[2] for row in history)
+    frame = recompute_streaks(db.cursor(), as_of=format_day(last_day + 8))
+    assert frame["Current Streak"].tolist() == [0] * len(HABITS)
@@ -0,0 +1,31 @@
+from counter_manager import last_counter_record
+from records import (HabitRecord, CounterRecord, HABIT_COLUMNS, COUNTER_COLUMNS, USER_COLUMNS,
+                     habit_row, user_row, index_by_name)
+
+USER = "test0101"
+
+
+def test_rows_become_records(db):
+    cur = db.cursor()
+    cur.row_factory = habit_row
+    habit = cur.execute(f"SELECT {HABIT_COLUMNS} FROM habits WHERE habit_name = 'Yoga'").fetchone()
+    assert isinstance(habit, HabitRecord)
+    assert (habit.user_id, habit.name, habit.interval, habit.is_custom) == (None, "Yoga", "Daily", False)
+    cur.row_factory = user_row
+    assert cur.execute(f"SELECT {USER_COLUMNS} FROM user").fetchone().user_id == USER
+    #Records have no per-instance dict
+    assert not hasattr(habit, "__dict__")
+
+
+def test_last_counter_record(db):
+    assert last_counter_record(db.cursor(), "Yoga", USER) is None
+    db.executemany(f"INSERT INTO counter ({COUNTER_COLUMNS}) VALUES (?, 'Yoga', ?, '08:00:00', 1, ?)",
+                   [(USER, 20000, 1), (USER, 20001, 2)])
+    assert last_counter_record(db.cursor(), "Yoga", USER) == CounterRecord(USER, "Yoga", 20001, "08:00:00", 1, 2)
+
+
+def test_index_by_name_keeps_the_first_record():
+    custom = HabitRecord(USER, "Yoga", "Mine", "Physical", 20000, "Weekly", True)
+    predefined = HabitRecord(None, "Yoga", "Predefined", "Physical", 19858, "Daily", False)
+    other = predefined._replace(name="Jogging")
+    assert index_by_name([custom, predefined, other]) == {"Yoga": custom, "Jogging": other}
@@ -0,0 +1,42 @@
+import random
+
+import pandas as pd
+import pytest
+
+from analyze import recompute_streaks, completion_rates
+from reports import run_report, user_shards
+
+AS_OF = "2025-03-01"
+
+
+@pytest.fixture
+def users(db):
+    rng = random.Random(11)
+    user_ids = ["test0101"] + [f"user{number:04d}" for number in range(6)]
+    db.executemany("INSERT INTO user VALUES (?, ?, 'pwd')", [(user_id, user_id) for user_id in user_ids[1:]])
+    for user_id in user_ids:
+        for habit_name in ("Yoga", "Jogging"):
+            days = sorted(rng.sample(range(20000, 20150), 40))
+            db.executemany("INSERT INTO counter (user_id, habit_name, check_day, habit_rep, habit_streak) "
+                           "VALUES (?, ?, ?, 1, 1)", [(user_id, habit_name, day) for day in days])
+    db.commit()
+    return user_ids
+
+
+def test_shards_cover_every_user_once(db, users):
+    ordered = sorted(users)
+    assert user_shards(db, chunk_size=3) == [(ordered[0], ordered[2]), (ordered[3], ordered[5]), (ordered[6], ordered[6])]
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.parametrize("report, function", [("streaks", recompute_streaks), ("completion", completion_rates)])
+def test_sharded_report_equals_a_single_run(db, db_path, users, workers, report, function):
+    result = run_report(db_path, report, workers=workers, chunk_size=2, as_of=AS_OF)
+    pd.testing.assert_frame_equal(result, function(db.cursor(), as_of=AS_OF))
+
+
+def test_unknown_report_and_database(db_path, tmp_path):
+    with pytest.raises(ValueError):
+        run_report(db_path, "totals")
+    with pytest.raises(FileNotFoundError):
+        run_report(str(tmp_path / "missing.db"), "streaks")
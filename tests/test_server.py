@@ -0,0 +1,83 @@
+import asyncio
+from http import HTTPStatus
+
+import pytest
+
+from conftest import habit_state
+from server import HabitTrackerServer, HttpError
+from services import UserService
+from counter_manager import CHECK_IN_INSERTED, CHECK_IN_INVALID, CHECK_IN_UNKNOWN_USER
+
+USER = "test0101"
+
+
+def run_server(db_path, scenario):
+    """Function that starts a server without listening, runs scenario(server) and stops it"""
+    async def main():
+        server = HabitTrackerServer(db_path, threads=2)
+        await server.start()
+        try:
+            return await asyncio.wait_for(scenario(server), timeout=10)
+        finally:
+            await server.stop()
+    return asyncio.run(main())
+
+
+@pytest.mark.parametrize("reps", ["x", None, 0, -3, 1.5, True])
+def test_invalid_reps_are_rejected(db_path, reps):
+    async def scenario(server):
+        with pytest.raises(HttpError) as error:
+            await server.check_in(USER, {}, {}, {"habit": "Journaling", "reps": reps})
+        assert error.value.status == HTTPStatus.BAD_REQUEST
+        return await server.check_in(USER, {}, {}, {"habit": "Journaling", "date": "2025-01-01"})
+    status, payload = run_server(db_path, scenario)
+    assert status == HTTPStatus.CREATED and payload["outcome"] == CHECK_IN_INSERTED
+
+
+@pytest.mark.parametrize("date", [20000, 2.5, ["2025-01-01"]])
+def test_non_string_dates_are_rejected(db_path, db, date):
+    async def scenario(server):
+        with pytest.raises(HttpError) as error:
+            await server.check_in(USER, {}, {}, {"habit": "Journaling", "date": date})
+        return error.value.status
+    assert run_server(db_path, scenario) == HTTPStatus.BAD_REQUEST
+    assert habit_state(db, USER, "Journaling") is None
+
+
+def test_check_in_of_a_deleted_user_is_not_found(db_path, db):
+    async def scenario(server):
+        return await server.check_in("ghost", {}, {}, {"habit": "Journaling", "date": "2025-01-01"})
+    status, payload = run_server(db_path, scenario)
+    assert (status, payload["outcome"]) == (HTTPStatus.NOT_FOUND, CHECK_IN_UNKNOWN_USER)
+    assert habit_state(db, "ghost", "Journaling") is None
+
+
+def test_writer_survives_failing_jobs(db_path, db):
+    async def scenario(server):
+        def broken(db):
+            db.execute("BEGIN")
+            raise TypeError("broken job")
+        with pytest.raises(TypeError):
+            await server._write(broken)
+        #A record that bypasses the handler's validation only fails itself, not its group
+        outcomes = await asyncio.gather(
+            server._check_in({"user_id": USER, "habit_name": "Journaling", "habit_rep": object()}),
+            server._check_in({"user_id": USER, "habit_name": "Journaling", "check_date": "2025-01-01"}))
+        assert outcomes == [CHECK_IN_INVALID, CHECK_IN_INSERTED]
+        await server.create_habit(USER, {}, {}, {"name": "Reading", "interval": "Daily", "type": "Cognitive"})
+        return await server.check_in(USER, {}, {}, {"habit": "Reading", "date": "2025-01-01"})
+    status, payload = run_server(db_path, scenario)
+    assert status == HTTPStatus.CREATED
+    assert habit_state(db, USER, "Reading")[0] == 1
+
+
+def test_login_upgrades_plaintext_password_through_writer(db_path, db):
+    db.execute("UPDATE user SET user_pwd = 'plain' WHERE user_id = ?", (USER,))
+    db.commit()
+
+    async def scenario(server):
+        status, payload = await server.login(None, {}, {}, {"identifier": "testuser", "password": "plain"})
+        user_id = await server._read(lambda db: UserService(db).session_user(payload["token"]))
+        return status, user_id
+    assert run_server(db_path, scenario) == (HTTPStatus.OK, USER)
+    assert db.execute("SELECT user_pwd FROM user WHERE user_id = ?", (USER,)).fetchone()[0].startswith("scrypt$")
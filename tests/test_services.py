@@ -0,0 +1,76 @@
+import pytest
+
+from counter_manager import CHECK_IN_INSERTED, CHECK_IN_DUPLICATE
+from db import ConnectionPool
+from services import HabitService, CounterService, UserService, HabitStatus
+
+USER = "test0101"
+
+
+@pytest.fixture(params=["connection", "pool"])
+def source(request, db, db_path):
+    """The services accept a bare connection or a ConnectionPool"""
+    if request.param == "connection":
+        yield db
+    else:
+        pool = ConnectionPool(db_path, size=2)
+        yield pool
+        pool.close()
+
+
+def test_habit_service(source):
+    service = HabitService(source, cache=None)
+    assert not service.create_habit(USER, "", "", "Physical", "Daily").ok
+    assert not service.create_habit(USER, "Reading", "", "Cognitive", "Monthly").ok
+    assert service.create_habit(USER, "Reading", "Read a book", "Cognitive", "Daily").ok
+    assert not service.create_habit(USER, "Reading", "Again", "Cognitive", "Daily").ok
+
+    habits = service.list_habits(USER)
+    assert habits[0].name == "Reading" and habits[0].is_custom
+    assert len(habits) == 7
+    assert service.set_interval(USER, "Reading", "Weekly").ok
+    assert service.get_habit(USER, "Reading").interval == "Weekly"
+    assert not service.set_interval(USER, "Missing", "Weekly").ok
+
+    assert service.delete_habit(USER, "Reading").ok
+    assert not service.delete_habit(USER, "Reading").ok
+    assert service.get_habit(USER, "Reading") is None
+
+
+def test_counter_service(source):
+    service = CounterService(source)
+    assert service.get_status(USER, "Yoga") is None
+    assert service.check_in(USER, "Yoga", "2025-01-01").ok
+    result = service.check_in(USER, "Yoga", "2025-01-02")
+    assert (result.habit_name, result.check_date, result.outcome) == ("Yoga", "2025-01-02", CHECK_IN_INSERTED)
+    assert service.check_in(USER, "Yoga", "2025-01-02").outcome == CHECK_IN_DUPLICATE
+    assert service.get_status(USER, "Yoga") == HabitStatus("Yoga", 2, 2, "2025-01-02", 2)
+
+    assert service.reset_streak(USER, "Yoga").ok
+    assert service.get_status(USER, "Yoga").current_streak == 0
+    assert service.get_status(USER, "Yoga").longest_streak == 2
+
+
+def test_user_service(source):
+    service = UserService(source)
+    assert service.create_user("user0002", "second", "secret1!").ok
+    assert not service.create_user("user0002", "other", "secret1!").ok
+    assert service.name_taken("second") and not service.name_taken("nobody")
+    assert service.find_user("second") == service.find_user("user0002") == "user0002"
+    assert service.find_user("nobody") is None
+
+    assert service.authenticate("second", "secret1!") == "user0002"
+    assert service.authenticate("second", "wrong") is None
+    assert service.change_name("user0002", "renamed").ok
+    assert not service.change_name("user0002", "testuser").ok
+    assert service.change_pwd("user0002", "secret2!").ok
+    assert service.authenticate("renamed", "secret2!") == "user0002"
+
+    token = service.login("renamed", "secret2!")
+    assert service.session_user(token) == "user0002"
+    assert service.logout(token).ok
+    assert service.session_user(token) is None
+
+    assert not service.delete_user("user0002", "wrong").ok
+    assert service.delete_user("user0002", "secret2!").ok
+    assert service.find_user("user0002") is None
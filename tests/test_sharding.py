@@ -0,0 +1,137 @@
+import sqlite3
+import threading
+
+import pytest
+
+import db as database
+from counter_manager import check_in_many
+from sharding import ShardRouter, move_user
+from services import UserService
+
+USER = "shard0001"
+
+
+@pytest.fixture
+def router(tmp_path, monkeypatch):
+    router = ShardRouter(str(tmp_path / "directory.db"), [str(tmp_path / f"shard{n}.db") for n in range(2)], pool_size=2)
+    monkeypatch.setattr(database, "_router", router)
+    yield router
+    router.close()
+
+
+@pytest.fixture
+def directory(router):
+    connection = sqlite3.connect(router.directory, check_same_thread=False)
+    router.init_directory(connection)
+    yield connection
+    connection.close()
+
+
+def shard_rows(router, shard, user_id):
+    with router.pool(shard).connection() as db:
+        return {table: db.execute(f"SELECT COUNT(*) FROM {table} WHERE user_id = ?", (user_id,)).fetchone()[0]
+                for table in ("counter", "habit_state")}
+
+
+def test_change_id_and_delete_use_the_shard(router, directory):
+    assert UserService(directory).create_user(USER, "sharded", "pwd123!").ok
+    with router.connection_for(directory, USER) as db:
+        check_in_many(db, [{"user_id": USER, "habit_name": "Yoga", "check_date": "2025-01-01"}])
+    shard = router.placed_shard(directory, USER)
+
+    assert UserService(directory).change_id(USER, "shard0002").ok
+    assert shard_rows(router, shard, USER) == {"counter": 0, "habit_state": 0}
+    assert shard_rows(router, shard, "shard0002") == {"counter": 1, "habit_state": 1}
+    assert router.placed_shard(directory, "shard0002") == shard and router.placed_shard(directory, USER) is None
+
+    assert UserService(directory).delete_user("shard0002", "pwd123!").ok
+    assert shard_rows(router, shard, "shard0002") == {"counter": 0, "habit_state": 0}
+    assert router.placed_shard(directory, "shard0002") is None
+    assert directory.execute("SELECT COUNT(*) FROM user WHERE user_id = 'shard0002'").fetchone()[0] == 0
+
+
+def test_change_id_to_a_taken_id_changes_nothing(router, directory):
+    service = UserService(directory)
+    assert service.create_user(USER, "sharded", "pwd123!").ok
+    assert service.create_user("taken", "other", "pwd123!").ok
+    with router.connection_for(directory, USER) as db:
+        check_in_many(db, [{"user_id": USER, "habit_name": "Yoga", "check_date": "2025-01-01"}])
+    assert not service.change_id(USER, "taken").ok
+    assert shard_rows(router, router.placed_shard(directory, USER), USER) == {"counter": 1, "habit_state": 1}
+
+
+def test_pools_are_created_once_across_threads(router, directory):
+    barrier = threading.Barrier(8)
+    pools = []
+
+    def open_pool():
+        barrier.wait()
+        pools.append(router.pool(router.shards[0]))
+
+    threads = [threading.Thread(target=open_pool) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len({id(pool) for pool in pools}) == 1
+
+
+def test_users_are_placed_on_creation_only(router, directory):
+    assert UserService(directory).create_user(USER, "sharded", "pwd123!").ok
+    assert router.placed_shard(directory, USER) == router.ring.shard_for(USER)
+    #Looking up an unknown user does not give them a directory entry
+    with pytest.raises(KeyError):
+        with router.connection_for(directory, "ghost"):
+            pass
+    assert router.placed_shard(directory, "ghost") is None
+    assert directory.execute("SELECT COUNT(*) FROM user_shard").fetchone()[0] == 1
+
+
+def test_existing_users_are_placed_when_the_directory_is_initialized(router, directory):
+    directory.execute("INSERT INTO user VALUES ('legacy01', 'legacy', 'pwd')")
+    directory.commit()
+    router.init_directory(directory)
+    assert router.placed_shard(directory, "legacy01") == router.ring.shard_for("legacy01")
+
+
+def test_every_scope_checks_out_its_own_connection(router, directory):
+    assert UserService(directory).create_user(USER, "sharded", "pwd123!").ok
+    with router.connection_for(directory, USER) as first:
+        with router.connection_for(directory, USER) as second:
+            assert first is not second
+    barrier = threading.Barrier(2)
+    used = []
+
+    def check_in(check_date):
+        with router.connection_for(directory, USER) as db:
+            used.append(db)
+            barrier.wait()
+            check_in_many(db, [{"user_id": USER, "habit_name": "Yoga", "check_date": check_date}])
+
+    threads = [threading.Thread(target=check_in, args=(check_date,)) for check_date in ("2025-01-01", "2025-01-02")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert used[0] is not used[1]
+    assert shard_rows(router, router.placed_shard(directory, USER), USER) == {"counter": 2, "habit_state": 1}
+
+
+def test_move_user_copies_columns_by_name(router, directory):
+    assert UserService(directory).create_user(USER, "sharded", "pwd123!").ok
+    source = router.placed_shard(directory, USER)
+    target = next(shard for shard in router.shards if shard != source)
+    with router.connection_for(directory, USER) as db:
+        check_in_many(db, [{"user_id": USER, "habit_name": "Yoga", "check_date": "2025-01-01", "habit_rep": 3}])
+    #The target's habit_state has its columns in another order
+    with router.pool(target).connection() as db:
+        db.execute("DROP TABLE habit_state")
+        db.execute("""CREATE TABLE habit_state (total_reps INTEGER DEFAULT 0, last_check_day INTEGER,
+                      longest_streak INTEGER DEFAULT 0, current_streak INTEGER DEFAULT 0,
+                      habit_name TEXT, user_id TEXT, PRIMARY KEY (user_id, habit_name))""")
+    assert move_user(router, directory, USER, target) == 2
+    assert router.placed_shard(directory, USER) == target
+    with router.pool(target).connection() as db:
+        assert db.execute("""SELECT current_streak, longest_streak, last_check_day, total_reps FROM habit_state
+                             WHERE user_id = ?""", (USER,)).fetchone() == (1, 1, 20089, 3)
+    assert shard_rows(router, source, USER) == {"counter": 0, "habit_state": 0}
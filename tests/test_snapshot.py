@@ -0,0 +1,21 @@
+from analyze import _habit_service
+from db import Snapshot, is_snapshot
+from habit_cache import habit_cache
+
+
+def test_snapshot_connections_are_marked_without_a_query(db, db_path, tmp_path):
+    statements = []
+    db.set_trace_callback(statements.append)
+    assert not is_snapshot(db)
+    assert _habit_service(db.cursor()).cache is habit_cache
+    assert statements == []
+
+    for target in (":memory:", str(tmp_path / "snapshot.db")):
+        snapshot = Snapshot(db_path, target)
+        try:
+            connection = snapshot.connection()
+            assert is_snapshot(connection)
+            assert _habit_service(connection.cursor()).cache is None
+            assert connection.execute("SELECT COUNT(*) FROM habits WHERE is_custom = 0").fetchone()[0] == 6
+        finally:
+            snapshot.close()
@@ -0,0 +1,44 @@
+from conftest import habit_state
+from counter_manager import check_in_many
+from db import detect_streak_breaks, rebuild_habit_state
+from dates import to_day
+
+USER = "test0101"
+
+
+def check_in(db, habit_name, *dates):
+    check_in_many(db, [{"user_id": USER, "habit_name": habit_name, "check_date": date} for date in dates])
+
+
+def test_breaks_follow_the_habit_interval(db):
+    check_in(db, "Journaling", "2025-01-01", "2025-01-02")
+    check_in(db, "Jogging", "2025-01-01")
+    #Jan 3: both streaks can still be continued
+    assert detect_streak_breaks(db, "2025-01-03")["broken"] == 0
+    #Jan 4: the Daily streak is broken, the Weekly one lasts until Jan 8
+    report = detect_streak_breaks(db, "2025-01-04")
+    assert (report["active"], report["broken"], report["recorded"]) == (2, 1, 1)
+    assert habit_state(db, USER, "Journaling")[:2] == (0, 2)
+    assert detect_streak_breaks(db, "2025-01-08")["broken"] == 0
+    assert detect_streak_breaks(db, "2025-01-09")["broken"] == 1
+    assert db.execute("SELECT habit_name, broken_streak, last_check_day FROM streak_breaks ORDER BY habit_name").fetchall() \
+        == [("Jogging", 1, to_day("2025-01-01")), ("Journaling", 2, to_day("2025-01-02"))]
+
+
+def test_job_is_idempotent(db):
+    check_in(db, "Journaling", "2025-01-01")
+    assert detect_streak_breaks(db, "2025-01-05")["recorded"] == 1
+    report = detect_streak_breaks(db, "2025-01-05")
+    assert (report["active"], report["broken"], report["recorded"]) == (0, 0, 0)
+    #A rebuild restores the streak from the counter history; the next run resets it without a second record
+    rebuild_habit_state(db)
+    assert habit_state(db, USER, "Journaling")[0] == 1
+    assert detect_streak_breaks(db, "2025-01-06")["broken"] == 1
+    assert db.execute("SELECT COUNT(*) FROM streak_breaks").fetchone()[0] == 1
+
+
+def test_rebuild_does_not_record_breaks(db):
+    check_in(db, "Journaling", "2020-01-01")
+    rebuild_habit_state(db)
+    assert habit_state(db, USER, "Journaling")[0] == 1
+    assert db.execute("SELECT COUNT(*) FROM streak_breaks").fetchone()[0] == 0
@@ -0,0 +1,75 @@
+import json
+
+import pytest
+
+import db as database
+from db import ConnectionPool, TracingConnection, enable_tracing, trace_scope, query_stats, dump_query_stats
+
+
+@pytest.fixture
+def tracing(monkeypatch):
+    #Tracing is process-wide state; the test's statistics are dropped afterwards
+    monkeypatch.setattr(database, "_trace_stats", None)
+    monkeypatch.setattr(database, "_trace_operations", {})
+    monkeypatch.setattr(database, "_trace_output", None)
+    enable_tracing(output=None)
+
+
+def lookup_habits(db):
+    for habit_name in ("Yoga", "Jogging", "Reading"):
+        db.execute("SELECT habit_interval FROM habits WHERE habit_name = ?", (habit_name,)).fetchall()
+
+
+def test_statements_are_grouped_by_caller(db_path, tracing):
+    pool = ConnectionPool(db_path, size=1)
+    try:
+        with pool.connection() as db:
+            assert isinstance(db, TracingConnection)
+            lookup_habits(db)
+    finally:
+        pool.close()
+    group = query_stats()["test_tracing.lookup_habits"]
+    statement, = group["statements"]
+    assert statement["sql"] == "SELECT habit_interval FROM habits WHERE habit_name = ?"
+    assert (group["calls"], statement["calls"], statement["executed"], statement["rows"]) == (3, 3, 3, 2)
+    assert statement["total_ms"] >= statement["max_ms"] > 0
+
+
+def test_trace_scopes_count_statements_per_operation(db_path, tracing):
+    pool = ConnectionPool(db_path, size=1)
+    try:
+        with pool.connection() as db:
+            for _ in range(2):
+                with trace_scope("view habits"):
+                    lookup_habits(db)
+    finally:
+        pool.close()
+    group = query_stats()["view habits"]
+    assert (group["operations"], group["executed"], group["statements_per_operation"]) == (2, 6, 3.0)
+
+
+def test_literals_are_normalized():
+    assert database._normalize_sql("SELECT * FROM counter WHERE check_day IN (1, 2, 3) AND habit_name = 'Yoga'") == \
+        "SELECT * FROM counter WHERE check_day IN (?, ...) AND habit_name = ?"
+
+
+def test_connections_are_not_traced_by_default(db_path, monkeypatch):
+    monkeypatch.setattr(database, "_trace_stats", None)
+    pool = ConnectionPool(db_path, size=1)
+    try:
+        with pool.connection() as db:
+            assert not isinstance(db, TracingConnection)
+    finally:
+        pool.close()
+
+
+def test_statistics_are_written_as_json(db_path, tracing, tmp_path):
+    pool = ConnectionPool(db_path, size=1)
+    try:
+        with pool.connection() as db:
+            lookup_habits(db)
+    finally:
+        pool.close()
+    output = tmp_path / "stats.json"
+    dump_query_stats(str(output))
+    assert "test_tracing.lookup_habits" in json.loads(output.read_text())
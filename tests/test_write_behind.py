@@ -0,0 +1,97 @@
+import sqlite3
+import threading
+
+import pytest
+
+import db as database
+from conftest import habit_state
+from counter_manager import increment_counter, check_in_many, CHECK_IN_INSERTED, CHECK_IN_DUPLICATE, CHECK_IN_INVALID
+from dates import today
+from services import CounterService
+
+USER = "test0101"
+
+
+@pytest.fixture
+def write_behind(db_path):
+    #Switch the file to WAL first: the writer's own switch would need the lock the test may be holding
+    sqlite3.connect(db_path).execute("PRAGMA journal_mode = WAL").connection.close()
+    #A long delay puts everything submitted by one test into the same group
+    queue = database.enable_write_behind(db_path, batch_size=100, max_delay=0.2)
+    yield queue
+    database.disable_write_behind()
+
+
+def test_failing_row_fails_only_itself(db, write_behind):
+    db.execute("""CREATE TRIGGER reject_bad BEFORE INSERT ON counter WHEN NEW.habit_name = 'Bad'
+                  BEGIN SELECT RAISE(ABORT, 'bad row'); END""")
+    db.commit()
+    futures = [database.add_counter(db, USER, name, 20000, "08:00:00", 1, 1) for name in ("Yoga", "Bad", "Jogging")]
+    assert futures[0].result(5) is True
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[1].result(5)
+    assert futures[2].result(5) is True
+    assert habit_state(db, USER, "Jogging")[2] == 20000
+
+
+def test_unexpected_error_does_not_stop_the_writer(db, write_behind, monkeypatch):
+    original = write_behind._write
+    calls = []
+
+    def broken_once(connection, batch):
+        calls.append(len(batch))
+        if len(calls) == 1:
+            raise RuntimeError("broken batch")
+        return original(connection, batch)
+
+    monkeypatch.setattr(write_behind, "_write", broken_once)
+    first = database.add_counter(db, USER, "Yoga", 20000, "08:00:00", 1, 1)
+    with pytest.raises(RuntimeError):
+        first.result(5)
+    second = database.add_counter(db, USER, "Yoga", 20001, "08:00:00", 1, 1)
+    write_behind.flush(timeout=5)
+    assert second.result(0) is True
+    assert not db.in_transaction
+
+
+def test_check_ins_share_group_commits(db, write_behind):
+    service = CounterService(db)
+    results = {}
+
+    def check_in(day):
+        results[day] = service.check_in_many(
+            [{"user_id": USER, "habit_name": "Journaling", "check_date": f"2025-01-0{day}"}])[0]
+
+    threads = [threading.Thread(target=check_in, args=(day,)) for day in (1, 2, 3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert set(results.values()) == {CHECK_IN_INSERTED}
+    assert habit_state(db, USER, "Journaling")[:2] == (3, 3)
+    assert write_behind.commits == 1
+    assert service.check_in_many([{"user_id": USER, "habit_name": "Journaling", "check_date": "2025-01-03"},
+                                  {"user_id": USER, "habit_name": "Journaling", "habit_rep": "x"}]) \
+        == [CHECK_IN_DUPLICATE, CHECK_IN_INVALID]
+
+
+def test_other_databases_are_written_directly(tmp_path, write_behind):
+    other = sqlite3.connect(str(tmp_path / "other.db"))
+    database.initialize_db(other.cursor(), other)
+    assert database.add_counter(other, USER, "Yoga", 20000, "08:00:00", 1, 1) is True
+    assert habit_state(other, USER, "Yoga")[2] == 20000
+    other.close()
+
+
+def test_increment_counter_reports_the_committed_outcome(db, write_behind, capsys):
+    check_in_many(db, [{"user_id": USER, "habit_name": "Journaling", "check_date": today() - 1}])
+    increment_counter(db.cursor(), db, "Journaling", USER)
+    #The message is printed once the queued row is committed
+    assert habit_state(db, USER, "Journaling")[:3] == (2, 2, today())
+    output = capsys.readouterr().out
+    assert "has been incremented to 1" in output
+    assert "already checked today. Its streak stays at 2" in output
+
+    increment_counter(db.cursor(), db, "Journaling", USER)
+    output = capsys.readouterr().out
+    assert "incremented" not in output and "The number of repetitions was not changed" in output
@@ -5,6 +5,7 @@
 
 from getpass import getpass
 import sqlite3
+from services import UserService
 
 #Function to create the user name
 def create_name(cur, db):
@@ -13,8 +14,7 @@ def create_name(cur, db):
         try:
             print("\nLet's create a user name: ")
             user_name = input("Please enter a user name you can easily memorize: ")
-            cur.execute("SELECT user_id FROM user WHERE user_name = ?", (user_name,))
-            if cur.fetchone():
+            if UserService(db).name_taken(user_name):
                 print("This user name is already taken. Please choose a different one.")
                 continue
 
@@ -87,11 +87,10 @@ def create_profile(cur, db):
         user_id = create_id(cur, db)
         user_pwd = create_pwd(cur, db)
 
-        cur.execute("INSERT INTO user (user_id, user_name, user_pwd) VALUES (?, ?, ?)",
-                    (user_id, user_name, user_pwd))
-        db.commit()
-        print("User created successfully!")
-        return user_id, user_name, user_pwd
+        result = UserService(db).create_user(user_id, user_name, user_pwd)
+        print(result.message)
+        if result.ok:
+            return user_id, user_name, user_pwd
     except sqlite3.Error as e:
         db.rollback()
         print(f"Error creating user: {e}")
@@ -112,41 +111,39 @@ def change_profile(cur, db, user):
             #Prompt valid user input
             user_input = input("\nPlease enter a number (1, 2, 3, 4, or 5): ").strip()
 
-            if user_input == 1:
+            user_service = UserService(db)
+            if user_input == "1":
                 new_user_name = create_name(cur, db)
-                cur.execute("UPDATE user SET user_name = ? WHERE user_id = ?", (new_user_name, user.user_id))
-                db.commit()
-                print(f"User name changed to '{new_user_name}'.")
+                print(user_service.change_name(user.user_id, new_user_name).message)
             
-            elif user_input == 2:
+            elif user_input == "2":
                 new_user_pwd = create_pwd(cur, db)
-                cur.execute("UPDATE user SET user_pwd = ? WHERE user_id = ?", (new_user_pwd, user.user_id))
-                db.commit()
-                print("Password changed successfully.")
+                print(user_service.change_pwd(user.user_id, new_user_pwd).message)
             
-            elif user_input == 3:
+            elif user_input == "3":
                 new_user_id = create_id(cur, db)
-                cur.execute("UPDATE user SET user_id = ? WHERE user_id = ?", (new_user_id, user.user_id))
-                db.commit()
-                print(f"User ID changed to '{new_user_id}'.")
+                result = user_service.change_id(user.user_id, new_user_id)
+                if result.ok:
+                    user.user_id = new_user_id
+                print(result.message)
             
-            elif user_input == 4:
+            elif user_input == "4":
                 print("\nDo you want to delete your user account?")
                 confirm_delete = input("Please enter 'Y' for yes and 'N' for no: ").lower()
                 if confirm_delete == "y":
                     confirm_input1 = getpass("Please enter your password: ")
                     confirm_input2 = input("To confirm deletion, enter your user ID: ")
-                    if confirm_input1 == user.user_pwd and confirm_input2 == user.user_id:
-                        cur.execute("DELETE FROM user WHERE user_id = ?", (user.user_id,))
-                        db.commit()
-                        print("YOur User account was successfully deleted.")
-                        break
+                    if confirm_input2 == user.user_id:
+                        result = user_service.delete_user(user.user_id, confirm_input1)
+                        print(result.message)
+                        if result.ok:
+                            break
                     else:
                         print("Password or user ID were incorrect. Account deletion was canceled.")
                 else:
                     print("Account deletion was canceled.")
             
-            elif user_input == 5:
+            elif user_input == "5":
                 print("Exiting profile management.")
                 break
             
@@ -166,18 +163,14 @@ def user_auth(cur, db):
         try:
             print("\nUser Authentication")
             identifier = input("Please enter your username or user ID: ").strip()
-            cur.execute(
-                "SELECT user_pwd FROM user WHERE user_name = ? OR user_id = ?", 
-                (identifier, identifier)
-            )
-            result = cur.fetchone()
+            user_service = UserService(db)
             
-            if result:
-                stored_pwd = result[0]
+            if user_service.find_user(identifier):
                 input_pwd = getpass("Please enter your password: ")
-                if input_pwd == stored_pwd:
+                user_id = user_service.authenticate(identifier, input_pwd)
+                if user_id:
                     print("Authentication successful!")
-                    return identifier
+                    return user_id
                 else:
                     print("Incorrect password. Please try again.")
             else: